@@ -1,9 +1,10 @@
 import os
+import re
 import tempfile
 from flask import Flask, request, jsonify, send_from_directory, redirect, url_for, session, render_template
 from flask_cors import CORS
+from werkzeug.exceptions import ClientDisconnected
 import boto3
-from boto3.s3.transfer import TransferConfig
 import logging
 from dotenv import load_dotenv
 import uuid
@@ -11,14 +12,26 @@ import time
 import random
 import botocore.exceptions
 import secrets
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from upload_logging import setup_logging, log_event, PART_SAMPLE_RATE, TRACE_LOGGER
+from transfer_profile import load_transfer_profile, pool_connections
+from endpoint_pool import create_endpoint_pool
+from bucket_index import PrefixIndex
+from hedging import hedged_upload_part, PartLatencyTracker, HedgeBudget
+from upload_timing import UploadTimer, start_profiler, stop_profiler
+from prefix_move import move_prefix, check_prefixes, MoveJobRegistry
+from cancellation import TransferCancelled, CancellationRegistry, CancellableInput, DisconnectMonitor
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure non-blocking logging (console, plus a JSON file if UPLOAD_LOG_FILE is set). Every
+# gunicorn worker appends to the same file, so it is not rotated here (use logrotate), and
+# workers forked from a --preload master start their own listener on their first record
+setup_logging(log_file=os.getenv('UPLOAD_LOG_FILE'), rotate=False)
 logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger(TRACE_LOGGER)
 
 # Custom temp directory - set this to a drive with plenty of space
 # If not set, system default temp directory will be used
@@ -52,6 +65,9 @@ SPACES_REGION = os.getenv('DO_SPACES_REGION', 'nyc3')
 SPACES_ENDPOINT = os.getenv('DO_SPACES_ENDPOINT', f'https://{SPACES_REGION}.digitaloceanspaces.com')
 SPACES_BUCKET = os.getenv('DO_SPACES_BUCKET')
 
+# Transfer settings: calibrated profile (see calibrate.py) or the built-in defaults
+transfer_profile = load_transfer_profile('app')
+
 # Configure S3 client with increased retries and timeouts
 s3_config = boto3.session.Config(
     retries={
@@ -60,64 +76,34 @@ s3_config = boto3.session.Config(
     },
     connect_timeout=86400,     # 24 hours - ridiculously long to never hit
     read_timeout=86400,        # 24 hours - ridiculously long to never hit
-    max_pool_connections=30    # Increased from default 10
-)
-
-# Create a transfer config with increased timeouts for larger files
-transfer_config = TransferConfig(
-    multipart_threshold=100 * 1024 * 1024,  # 100MB - increased for terabyte files
-    max_concurrency=20,  # Increased concurrency
-    multipart_chunksize=100 * 1024 * 1024,  # 100MB chunks - increased for terabyte files
-    use_threads=True,
-    max_io_queue=200,  # Increased queue size
-    io_chunksize=524288  # 512KB chunks for reading - increased for better throughput
+    max_pool_connections=pool_connections(transfer_profile)  # Increased from default 10
 )
 
 # Determine if we should use acceleration endpoint
 USE_ACCELERATION = os.getenv('USE_ACCELERATION', 'True').lower() in ('true', 'yes', '1')
 
-# Set the endpoint based on acceleration setting
-if USE_ACCELERATION:
-    endpoint_url = f'https://{SPACES_BUCKET}.s3-accelerate.amazonaws.com'
-    logger.info(f"Using S3 Transfer Acceleration endpoint: {endpoint_url}")
-else:
-    endpoint_url = SPACES_ENDPOINT
-    logger.info(f"Using standard S3 endpoint: {endpoint_url}")
-
-# Create S3 client
-s3 = boto3.client('s3',
-                  region_name=SPACES_REGION,
-                  endpoint_url=endpoint_url,
-                  aws_access_key_id=SPACES_KEY,
-                  aws_secret_access_key=SPACES_SECRET,
-                  config=s3_config)
-
-# Enable transfer acceleration on the bucket if needed
-if USE_ACCELERATION:
-    try:
-        logger.info(f"Checking Transfer Acceleration status for bucket: {SPACES_BUCKET}")
-        acceleration_status = s3.get_bucket_accelerate_configuration(Bucket=SPACES_BUCKET)
-        current_status = acceleration_status.get('Status', 'None')
-        
-        if current_status != 'Enabled':
-            logger.info(f"Enabling Transfer Acceleration for bucket: {SPACES_BUCKET}")
-            s3.put_bucket_accelerate_configuration(
-                Bucket=SPACES_BUCKET,
-                AccelerateConfiguration={'Status': 'Enabled'}
-            )
-            logger.info("Transfer Acceleration enabled successfully")
-        else:
-            logger.info("Transfer Acceleration already enabled")
-    except Exception as e:
-        logger.warning(f"Could not enable Transfer Acceleration: {str(e)}")
-        logger.warning("Will proceed with standard endpoint")
-        # Fallback to standard endpoint if acceleration fails
-        s3 = boto3.client('s3',
-                      region_name=SPACES_REGION,
-                      endpoint_url=SPACES_ENDPOINT,
-                      aws_access_key_id=SPACES_KEY,
-                      aws_secret_access_key=SPACES_SECRET,
-                      config=s3_config)
+# Extra endpoints (comma-separated URLs) to spread and fail over traffic across
+EXTRA_ENDPOINTS = [url.strip() for url in os.getenv('DO_SPACES_EXTRA_ENDPOINTS', '').split(',') if url.strip()]
+
+# Create the S3 client pool: each call goes to the healthiest endpoint (accelerated,
+# standard or extra) and fails over to the next one on endpoint errors
+s3 = create_endpoint_pool(SPACES_BUCKET, SPACES_REGION, SPACES_KEY, SPACES_SECRET,
+                          SPACES_ENDPOINT, USE_ACCELERATION, s3_config, EXTRA_ENDPOINTS)
+
+# Running part times and duplicate-bandwidth budget for hedging straggler parts
+part_tracker = PartLatencyTracker()
+hedge_budget = HedgeBudget()
+
+# Running uploads by upload ID, so /api/upload/<id>/cancel can stop them
+upload_registry = CancellationRegistry()
+
+# Server-side prefix moves run in the background; clients poll /api/move/<job_id>.
+# Job state is kept in SQLite so every gunicorn worker can answer the poll
+move_jobs = MoveJobRegistry(os.getenv('MOVE_JOBS_DB', 'move_jobs.db'))
+UPLOAD_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# Cached index of existing keys per User_Camera prefix, used by /api/preflight
+bucket_index = PrefixIndex(s3, SPACES_BUCKET, ttl=int(os.getenv('INDEX_TTL_SECONDS', 300)))
 
 # Create login template
 @app.route('/login', methods=['GET', 'POST'])
@@ -218,7 +204,8 @@ def serve_js():
     """Serve the JavaScript file"""
     return send_from_directory(app.static_folder, 'app.js')
 
-def retry_with_backoff(func, *args, max_retries=5, initial_backoff=1, **kwargs):
+def retry_with_backoff(func, *args, max_retries=5, initial_backoff=1, timer=None, phase=None,
+                       cancel_token=None, **kwargs):
     """
     Retry a function call with exponential backoff
     
@@ -227,6 +214,9 @@ def retry_with_backoff(func, *args, max_retries=5, initial_backoff=1, **kwargs):
         *args: Arguments for the function
         max_retries: Maximum number of retries
         initial_backoff: Initial backoff time in seconds
+        timer: Optional UploadTimer; attempts count towards phase, sleeps towards retry_sleep
+        phase: Timer phase for the attempts
+        cancel_token: Optional CancellationToken; stops retrying (and sleeping) once cancelled
         **kwargs: Keyword arguments for the function
         
     Returns:
@@ -236,8 +226,11 @@ def retry_with_backoff(func, *args, max_retries=5, initial_backoff=1, **kwargs):
     backoff = initial_backoff
     
     while True:
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
         try:
-            return func(*args, **kwargs)
+            with timer.phase(phase) if timer and phase else nullcontext():
+                return func(*args, **kwargs)
         except (botocore.exceptions.ClientError, 
                 botocore.exceptions.ConnectionError, 
                 botocore.exceptions.ConnectTimeoutError,
@@ -266,19 +259,81 @@ def retry_with_backoff(func, *args, max_retries=5, initial_backoff=1, **kwargs):
             logger.warning(f"Retrying operation. Attempt {retries}/{max_retries} "
                           f"after sleeping for {sleep_time:.2f}s. Error: {str(e)}")
             
-            time.sleep(sleep_time)
+            with timer.phase('retry_sleep') if timer else nullcontext():
+                if cancel_token:
+                    cancel_token.sleep(sleep_time)
+                else:
+                    time.sleep(sleep_time)
             
             # Exponential backoff with extremely high cap
             backoff = min(backoff * 2, 3600)  # Cap at 1 hour instead of 60 seconds
 
+def timed_response(timer, payload, status=200):
+    """
+    Finish an upload request: add the phase timings to the JSON payload, stop the
+    request's profiler (if any) and write the upload trace record.
+
+    Args:
+        timer: UploadTimer of the request
+        payload: Response dict
+        status: HTTP status code
+
+    Returns:
+        (response, status) for Flask
+    """
+    payload['timings'] = timer.as_dict()
+    profile_path = stop_profiler(timer, payload.get('upload_id') or uuid.uuid4())
+    if profile_path:
+        payload['profile'] = profile_path
+
+    log_event(trace_logger, 'upload_trace', filepath=payload.get('filepath'),
+              upload_id=payload.get('upload_id'), success=payload.get('success'),
+              status=payload.get('status', 'success' if payload.get('success') else 'error'),
+              http_status=status, parts=payload.get('parts'), timings=payload['timings'],
+              phase_counts=dict(timer.counts), profile=profile_path)
+    return jsonify(payload), status
+
 @app.route('/api/upload', methods=['POST'])
 @login_required
 def upload_file():
     """
     Handle direct streaming multipart upload to DigitalOcean Spaces with no temp files.
     Implements robust retry logic for each part with extended timeouts for very large files.
-    Uses S3 Transfer Acceleration for faster uploads over long distances.
+    Parts are uploaded max_concurrency at a time, each routed through the endpoint pool
+    (S3 Transfer Acceleration first when enabled) and failing over on its own.
+
+    The response includes the time spent in each phase (receiving the body, reading
+    parts, upload_part calls, retry sleeps, complete/abort); ?profiler=cprofile|sample
+    also profiles the request when UPLOAD_PROFILER is enabled.
+
+    The client can name the upload with an X-Upload-Id header and stop it through
+    /api/upload/<id>/cancel; a client that disconnects cancels it too. Cancelling stops
+    in-flight parts and aborts the multipart upload.
     """
+    # Per-phase timings and the optional per-request profiler
+    timer = UploadTimer()
+    start_profiler(timer, request.args.get('profiler') or request.headers.get('X-Upload-Profiler'))
+    
+    # Generate a unique ID for this upload for tracking (or use the client's, so it can cancel)
+    upload_id = request.headers.get('X-Upload-Id', '')
+    if not UPLOAD_ID_PATTERN.match(upload_id):
+        upload_id = str(uuid.uuid4())
+    token = upload_registry.register(upload_id)
+    if token is None:
+        # Another request is running under this ID; it keeps its ID (and its cancel)
+        logger.warning(f"Upload {upload_id} is already running, refusing a second upload with the same ID")
+        return timed_response(timer, {
+            'error': f"An upload with ID {upload_id} is already running",
+            'upload_id': upload_id,
+            'success': False
+        }, 409)
+    monitor = None
+    filepath = None
+    
+    # Body reads stop as soon as the upload is cancelled, and a body that ends before
+    # Content-Length (client gone mid-body) cancels it instead of parsing as a short form
+    request.environ['wsgi.input'] = CancellableInput(request.environ['wsgi.input'], token,
+                                                     request.content_length)
     try:
         # Start timing the upload
         start_time = time.time()
@@ -286,177 +341,238 @@ def upload_file():
         logger.info("Upload request received")
         
         # Log request headers for debugging
-        logger.info(f"Request headers: {dict(request.headers)}")
-        logger.info(f"Content length: {request.content_length}")
-        logger.info(f"Content type: {request.content_type}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Request headers: %s", dict(request.headers))
+        logger.debug("Content length: %s", request.content_length)
+        logger.debug("Content type: %s", request.content_type)
+        
+        # Receive the body: Flask reads and spools the multipart form on first access
+        with timer.phase('receive'):
+            files = request.files
+            form = request.form
         
-        if 'file' not in request.files:
+        # From here on the client isn't read from, so watch its connection instead
+        monitor = DisconnectMonitor(request.environ, token).start()
+        
+        if 'file' not in files:
             logger.error("No file part in the request")
-            return jsonify({'error': 'No file part', 'success': False}), 400
+            return timed_response(timer, {'error': 'No file part', 'success': False}, 400)
         
-        upload_file = request.files['file']
+        upload_file = files['file']
         if upload_file.filename == '':
             logger.error("No selected file (empty filename)")
-            return jsonify({'error': 'No selected file', 'success': False}), 400
+            return timed_response(timer, {'error': 'No selected file', 'success': False}, 400)
         
         # Get the filepath in the bucket (preserve folder structure)
-        filepath = request.form.get('filepath', upload_file.filename)
+        filepath = form.get('filepath', upload_file.filename)
         logger.info(f"Preparing to upload: {filepath} (size: {upload_file.content_length if hasattr(upload_file, 'content_length') else 'unknown'})")
         
-        # Generate a unique ID for this upload for tracking
-        upload_id = str(uuid.uuid4())
+        # Size of the file itself (request.content_length also counts the form encoding)
+        upload_file.seek(0, os.SEEK_END)
+        body_size = upload_file.tell()
+        upload_file.seek(0)
         
-        # For very large files, use the optimized transfer config with acceleration
         file_size = request.content_length
-        use_optimized = file_size and file_size > 100 * 1024 * 1024  # Use optimized for files over 100MB
         
-        if use_optimized and USE_ACCELERATION:
-            logger.info(f"Using optimized transfer with acceleration for large file: {filepath} ({formatSize(file_size)})")
-            try:
-                # Use boto3's managed upload with our optimized transfer config
-                upload_file.seek(0)  # Ensure we're at the start of the file
-                
-                # Use retry_with_backoff for the upload_fileobj operation
-                retry_with_backoff(
-                    s3.upload_fileobj,
-                    upload_file,  # Fileobj
-                    SPACES_BUCKET,  # Bucket
-                    filepath,  # Key
-                    Config=transfer_config,  # Config with optimized parameters
-                    max_retries=30,  # Extremely high retry count
-                    initial_backoff=10  # Very long initial backoff
-                )
-                
-                elapsed = time.time() - start_time
-                logger.info(f"Accelerated upload completed: {filepath} (ID: {upload_id}) in {elapsed:.2f} seconds")
-                
-                return jsonify({
-                    'success': True,
-                    'message': f'File uploaded successfully as {filepath}',
-                    'filepath': filepath,
-                    'upload_id': upload_id,
-                    'time_seconds': elapsed,
-                    'accelerated': True
-                })
-            except Exception as e:
-                logger.error(f"Accelerated upload failed: {str(e)}")
-                logger.error("Falling back to manual streaming upload")
-                # Fall through to standard streaming upload
-        
-        # Standard streaming upload with manual part management (fallback or for smaller files)
+        # Every file goes through the part loop below, whatever its size: each upload_part
+        # is routed (and fails over) through the endpoint pool on its own and straggler
+        # parts get a hedged duplicate, so an endpoint that degrades mid-upload costs a
+        # part, not the whole file
         try:
             mpu = retry_with_backoff(
                 s3.create_multipart_upload,
                 Bucket=SPACES_BUCKET,
                 Key=filepath,
                 max_retries=30,  # Extremely high retry count for initialization
-                initial_backoff=5  # Longer initial backoff
+                initial_backoff=5,  # Longer initial backoff
+                timer=timer,
+                phase='initiate',
+                cancel_token=token
             )
             multipart_upload_id = mpu["UploadId"]
             logger.info(f"Multipart upload initiated with ID: {multipart_upload_id}")
+        except TransferCancelled:
+            raise
         except Exception as e:
             logger.error(f"Failed to initiate multipart upload: {str(e)}")
-            return jsonify({
+            log_event(logger, 'transfer', level=logging.ERROR, filepath=filepath,
+                      upload_id=upload_id, bytes=file_size, status='init_failed', error=str(e))
+            return timed_response(timer, {
                 'error': f"Failed to initiate upload: {str(e)}",
                 'filepath': filepath,
                 'upload_id': upload_id,
                 'success': False,
                 'status': 'init_failed'
-            }), 500
+            }, 500)
         
         # Track parts
         parts = []
-        part_number = 1
         
-        # Stream the file directly to S3 in larger chunks for better efficiency with very large files
-        chunk_size = 100 * 1024 * 1024  # 100MB chunks (optimized for terabyte-scale uploads)
+        # Parts are read one after another and up to max_concurrency of them are uploaded
+        # at a time (so at most that many chunks are held in memory)
+        chunk_size = transfer_profile['multipart_chunksize']  # 100MB by default (optimized for terabyte-scale uploads)
+        max_in_flight = transfer_profile['max_concurrency']
         upload_file.seek(0)  # Reset to beginning of file
-        chunk = upload_file.read(chunk_size)
         
-        failed_parts = 0
-        retried_parts = 0
+        hedge_stats = {'hedged_parts': 0, 'hedge_wins': 0}
+        endpoint_parts = {}  # endpoint name -> parts it stored
         
-        while chunk:
-            # Upload the part directly from memory with retry logic
-            logger.info(f"Uploading part {part_number} for {filepath}")
-            
+        # Cancelled with the upload, or by the first part that fails so the others stop
+        parts_token = token.child()
+        failures = []  # (part_number, exception) of parts that failed after their retries
+        
+        def send_part(**kwargs):
+            """upload_part that also reports which endpoint stored the part"""
+            response = s3.upload_part(**kwargs)
+            endpoint = s3.last_endpoint()
+            return dict(response, Endpoint=endpoint.name if endpoint else None)
+        
+        def upload_part(part_number, chunk):
+            logger.debug("Uploading part %d for %s", part_number, filepath)
+            part_start = time.time()
             try:
-                # Retry the upload_part operation with backoff
+                # Retry the upload_part operation with backoff (stragglers get a hedged duplicate)
                 part = retry_with_backoff(
-                    s3.upload_part,
+                    hedged_upload_part,
+                    send_part,
+                    part_tracker,
+                    hedge_budget,
                     Body=chunk,
+                    stats=hedge_stats,
+                    token=parts_token,
                     Bucket=SPACES_BUCKET,
                     Key=filepath,
                     PartNumber=part_number,
                     UploadId=multipart_upload_id,
                     max_retries=30,  # Extremely high retry count for parts
-                    initial_backoff=5  # Longer initial backoff
+                    initial_backoff=5,  # Longer initial backoff
+                    timer=timer,
+                    phase='upload_part',
+                    cancel_token=parts_token
                 )
-                
-                # Track the part
-                parts.append({
-                    'PartNumber': part_number,
-                    'ETag': part['ETag']
-                })
-                
+            except TransferCancelled:
+                raise
             except Exception as e:
-                failed_parts += 1
                 logger.error(f"Failed to upload part {part_number} after retries: {str(e)}")
-                # If any part fails, abort the upload and return error
-                try:
-                    retry_with_backoff(
-                        s3.abort_multipart_upload,
-                        Bucket=SPACES_BUCKET,
-                        Key=filepath,
-                        UploadId=multipart_upload_id,
-                        max_retries=5,
-                        initial_backoff=1
-                    )
-                    logger.info(f"Multipart upload aborted: {filepath}")
-                except Exception as abort_error:
-                    logger.error(f"Failed to abort multipart upload: {str(abort_error)}")
+                log_event(logger, 'part', level=logging.ERROR, filepath=filepath,
+                          upload_id=upload_id, part_number=part_number, bytes=len(chunk),
+                          seconds=round(time.time() - part_start, 3), status='failed',
+                          error=str(e))
+                failures.append((part_number, e))
+                parts_token.cancel(f"part {part_number} failed")
+                raise
+            
+            log_event(logger, 'part', sample_rate=PART_SAMPLE_RATE, filepath=filepath,
+                      upload_id=upload_id, part_number=part_number, bytes=len(chunk),
+                      seconds=round(time.time() - part_start, 3), status='success',
+                      endpoint=part['Endpoint'])
+            return {'PartNumber': part_number, 'ETag': part['ETag'], 'Endpoint': part['Endpoint']}
+        
+        executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        in_flight = {}  # future -> part number
+        part_number = 0
+        chunk = True
+        try:
+            while chunk or in_flight:
+                # Read the next part as soon as there is room for it
+                if chunk and len(in_flight) < max_in_flight:
+                    parts_token.raise_if_cancelled()
+                    with timer.phase('read'):
+                        chunk = upload_file.read(chunk_size)
+                    if chunk:
+                        part_number += 1
+                        in_flight[executor.submit(upload_part, part_number, chunk)] = part_number
+                    continue
                 
-                return jsonify({
-                    'error': f"Upload failed at part {part_number}: {str(e)}",
-                    'filepath': filepath,
-                    'upload_id': upload_id,
-                    'part_number': part_number,
-                    'success': False,
-                    'status': 'interrupted'
-                }), 500
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del in_flight[future]
+                    part = future.result()
+                    parts.append(part)
+                    endpoint_parts[part['Endpoint']] = endpoint_parts.get(part['Endpoint'], 0) + 1
+                
+                # Log progress periodically
+                if len(parts) % 10 == 0 and done:
+                    logger.info("Upload progress: %d parts uploaded for %s in %.2f seconds",
+                                len(parts), filepath, time.time() - start_time)
+        except Exception as e:
+            # The first failed part (not the siblings it stopped) is what the client hears about
+            if failures and not token.cancelled:
+                part_number, e = failures[0]
+            cancelled = isinstance(e, (TransferCancelled, ClientDisconnected))
+            if cancelled:
+                logger.warning(f"Upload {upload_id} cancelled at part {part_number}: {str(e)}")
             
-            # Get next chunk
-            chunk = upload_file.read(chunk_size)
-            part_number += 1
+            # Stop the other parts, then abort the upload and return an error
+            parts_token.cancel('upload failed')
+            executor.shutdown(wait=True, cancel_futures=True)
+            try:
+                retry_with_backoff(
+                    s3.abort_multipart_upload,
+                    Bucket=SPACES_BUCKET,
+                    Key=filepath,
+                    UploadId=multipart_upload_id,
+                    max_retries=5,
+                    initial_backoff=1,
+                    timer=timer,
+                    phase='abort'
+                )
+                logger.info(f"Multipart upload aborted: {filepath}")
+            except Exception as abort_error:
+                logger.error(f"Failed to abort multipart upload: {str(abort_error)}")
             
-            # Log progress periodically
-            if part_number % 10 == 0:
-                elapsed = time.time() - start_time
-                logger.info(f"Upload progress: {part_number-1} parts uploaded for {filepath} in {elapsed:.2f} seconds")
+            status = 'cancelled' if cancelled else 'interrupted'
+            log_event(logger, 'transfer', level=logging.WARNING if cancelled else logging.ERROR,
+                      filepath=filepath, upload_id=upload_id, bytes=file_size, parts=len(parts),
+                      seconds=round(time.time() - start_time, 3), status=status,
+                      error=str(e))
+            return timed_response(timer, {
+                'error': f"Upload {'cancelled' if cancelled else 'failed'} at part {part_number}: {str(e)}",
+                'filepath': filepath,
+                'upload_id': upload_id,
+                'part_number': part_number,
+                'parts': len(parts),
+                'success': False,
+                'status': status
+            }, 499 if cancelled else 500)
+        finally:
+            executor.shutdown(wait=False)
         
         # Complete the multipart upload - only if ALL parts succeeded
         if parts:  # Only complete if we have parts
             try:
-                retry_with_backoff(
+                # Parts finish out of order; S3 wants them sorted and without our Endpoint
+                parts.sort(key=lambda part: part['PartNumber'])
+                completed = retry_with_backoff(
                     s3.complete_multipart_upload,
                     Bucket=SPACES_BUCKET,
                     Key=filepath,
                     UploadId=multipart_upload_id,
-                    MultipartUpload={'Parts': parts},
+                    MultipartUpload={'Parts': [{'PartNumber': part['PartNumber'], 'ETag': part['ETag']}
+                                               for part in parts]},
                     max_retries=30,  # Extremely high retry count for completion
-                    initial_backoff=10  # Even longer initial backoff for completion
+                    initial_backoff=10,  # Even longer initial backoff for completion
+                    timer=timer,
+                    phase='complete'
                 )
                 
                 elapsed = time.time() - start_time
                 logger.info(f"Multipart streaming upload completed: {filepath} (ID: {upload_id}) in {elapsed:.2f} seconds")
+                bucket_index.record_upload(filepath, body_size, completed.get('ETag'))
+                log_event(logger, 'transfer', filepath=filepath, upload_id=upload_id,
+                          bytes=file_size, parts=len(parts), seconds=round(elapsed, 3),
+                          status='success', endpoints=endpoint_parts, **hedge_stats)
                 
                 # All parts succeeded, upload is complete
-                return jsonify({
+                return timed_response(timer, {
                     'success': True,
                     'message': f'File uploaded successfully as {filepath}',
                     'filepath': filepath,
                     'upload_id': upload_id,
                     'parts': len(parts),
+                    'hedged_parts': hedge_stats['hedged_parts'],
+                    'hedge_wins': hedge_stats['hedge_wins'],
+                    'endpoints': endpoint_parts,
                     'time_seconds': elapsed
                 })
             except Exception as e:
@@ -464,17 +580,162 @@ def upload_file():
                 # Failure during completion is still a failure
                 raise
         else:
-            # No parts were successfully uploaded - this should never happen now that we abort on first part failure
+            # Nothing was read (empty file) - this should never happen now that we abort on first part failure
             raise Exception("No parts were successfully uploaded")
         
+    except (TransferCancelled, ClientDisconnected) as e:
+        # Cancelled or disconnected before any multipart upload was started
+        reason = token.reason or 'client disconnected'
+        logger.warning(f"Upload {upload_id} cancelled: {reason}")
+        log_event(logger, 'transfer', level=logging.WARNING, filepath=filepath, upload_id=upload_id,
+                  bytes=request.content_length, seconds=round(timer.elapsed(), 3), status='cancelled',
+                  error=reason)
+        return timed_response(timer, {
+            'error': f"Upload cancelled: {reason}",
+            'filepath': filepath,
+            'upload_id': upload_id,
+            'success': False,
+            'status': 'cancelled'
+        }, 499)
     except Exception as e:
         logger.error(f"Upload failed: {str(e)}")
         logger.exception("Detailed error information:")
-        return jsonify({
+        return timed_response(timer, {
             'error': str(e),
             'success': False,
             'status': 'error'
-        }), 500
+        }, 500)
+    finally:
+        if monitor:
+            monitor.stop()
+        upload_registry.unregister(upload_id, token)
+
+@app.route('/api/upload/<upload_id>/cancel', methods=['POST'])
+@login_required
+def cancel_upload(upload_id):
+    """
+    Cancel a running upload by the ID the client sent as X-Upload-Id.
+    
+    In-flight parts stop at their next read, retry sleeps end and the multipart upload
+    is aborted. Cancels that arrive before the upload has started are remembered.
+    """
+    running = upload_registry.cancel(upload_id, 'cancelled by client')
+    logger.info(f"Cancel requested for upload {upload_id} ({'running' if running else 'not running yet'})")
+    return jsonify({
+        'success': True,
+        'upload_id': upload_id,
+        'running': running
+    })
+
+@app.route('/api/preflight', methods=['POST'])
+@login_required
+def preflight():
+    """
+    Check a client file manifest against the bucket and return only the files that
+    still need uploading, so re-dropping a folder skips what is already there.
+    
+    Expects JSON: {"files": [{"path": "User_Camera/Task_Date_Dir/...", "size": 123, "mtime": 1712000000000}]}
+    Each file may also carry "md5" (hex), which is compared with the object's ETag.
+    """
+    data = request.get_json(silent=True) or {}
+    files = data.get('files')
+    if not isinstance(files, list):
+        return jsonify({'error': 'Expected a JSON body with a files list', 'success': False}), 400
+    
+    try:
+        manifest = [{
+            'path': str(f['path']),
+            'size': int(f['size']),
+            'mtime': int(f.get('mtime') or 0),
+            'md5': str(f['md5']).lower() if f.get('md5') else None
+        } for f in files]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Each file needs a path and a size', 'success': False}), 400
+    if any(f['md5'] and not re.fullmatch(r'[0-9a-f]{32}', f['md5']) for f in manifest):
+        return jsonify({'error': 'md5 must be a hex MD5 digest', 'success': False}), 400
+    
+    try:
+        to_upload, skipped = bucket_index.filter_manifest(manifest)
+    except Exception as e:
+        logger.error(f"Preflight check failed: {str(e)}")
+        return jsonify({'error': f"Preflight check failed: {str(e)}", 'success': False}), 500
+    
+    skipped_bytes = sum(f['size'] for f in skipped)
+    logger.info(f"Preflight: {len(to_upload)} of {len(manifest)} files need uploading "
+                f"({len(skipped)} already in bucket, {formatSize(skipped_bytes)} skipped)")
+    
+    return jsonify({
+        'success': True,
+        'upload': [f['path'] for f in to_upload],
+        'skipped': len(skipped),
+        'skipped_bytes': skipped_bytes
+    })
+
+@app.route('/api/move', methods=['POST'])
+@login_required
+def move():
+    """
+    Move (or copy) every object under one prefix to another with server-side copies,
+    e.g. to fix a typo in the task or date without uploading the files again.
+    
+    Expects JSON: {"source": "User_Camera/Task_Date_Dir/", "destination": "...",
+                   "copy": false, "overwrite": false, "dry_run": false}
+    
+    The move runs in the background: the response (202) carries a job_id to poll at
+    /api/move/<job_id>.
+    """
+    data = request.get_json(silent=True) or {}
+    source = data.get('source')
+    destination = data.get('destination')
+    if not isinstance(source, str) or not isinstance(destination, str):
+        return jsonify({'error': 'Expected a JSON body with source and destination prefixes', 'success': False}), 400
+    
+    # Only real JSON booleans: "false" must not turn a copy into a move
+    flags = {}
+    for name in ('copy', 'overwrite', 'dry_run'):
+        flags[name] = data.get(name, False)
+        if not isinstance(flags[name], bool):
+            return jsonify({'error': f"'{name}' must be true or false", 'success': False}), 400
+    
+    try:
+        source, destination = check_prefixes(source, destination)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
+    
+    def run(progress):
+        result = move_prefix(
+            s3, SPACES_BUCKET, source, destination,
+            delete_source=not flags['copy'],
+            overwrite=flags['overwrite'],
+            dry_run=flags['dry_run'],
+            retry=retry_with_backoff,
+            progress=progress
+        )
+        # Listings cached for preflight no longer match either prefix
+        bucket_index.invalidate(source)
+        bucket_index.invalidate(destination)
+        return result
+    
+    job_id = move_jobs.start(run)
+    logger.info(f"Move job {job_id} started: {source} -> {destination}")
+    return jsonify({'success': True, 'job_id': job_id, 'status': 'running',
+                    'source': source, 'destination': destination}), 202
+
+@app.route('/api/move/<job_id>', methods=['GET'])
+@login_required
+def move_status(job_id):
+    """Progress of a background move: status (running, done, failed), done/total objects and the result"""
+    job = move_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown move job', 'success': False}), 404
+    
+    if job['status'] == 'running':
+        job['success'] = True
+    elif job['status'] == 'done':
+        job['success'] = not job['result']['errors']
+    else:
+        job['success'] = False
+    return jsonify(job)
 
 # Helper function to format file sizes
 def formatSize(size_bytes):
@@ -502,6 +763,15 @@ def health_check():
         'region': SPACES_REGION
     })
 
+@app.route('/api/health/endpoints', methods=['GET'])
+@login_required
+def endpoint_health():
+    """Per-endpoint latency, error rate and cooldown state of the S3 client pool"""
+    return jsonify({
+        'timestamp': time.time(),
+        'endpoints': s3.health()
+    })
+
 @app.route('/logout')
 def logout():
     """Logout user by clearing session"""
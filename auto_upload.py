@@ -4,22 +4,29 @@ import sys
 import time
 import argparse
 import logging
+import math
 import boto3
 import random
 import uuid
+import hashlib
+import json
+import socket
 import botocore.exceptions
-from boto3.s3.transfer import TransferConfig
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
+from file_watcher import create_watcher
+from upload_state import UploadStateStore
+from upload_logging import setup_logging, setup_worker_logging, worker_log_queue, log_event, PART_SAMPLE_RATE
+from transfer_profile import load_transfer_profile, build_transfer_config, pool_connections, CLI_DEFAULTS
+from endpoint_pool import create_endpoint_pool
+from hedging import hedged_upload_part, PartLatencyTracker, HedgeBudget
+from prefix_move import move_prefix, COPY_CONCURRENCY
+from cancellation import CancellationToken, TransferCancelled, install_sigint_handler
+
+# Rotating JSON-lines log file, written off the upload path by a background thread of
+# the main process (configured in main(); worker processes send their records to it)
+LOG_FILE = os.getenv('UPLOAD_LOG_FILE', 'upload_log.txt')
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('upload_log.txt')
-    ]
-)
 logger = logging.getLogger(__name__)
 
 def format_size(size_bytes):
@@ -37,7 +44,7 @@ def format_size(size_bytes):
         
     return f"{size:.2f} {units[unit_index]}"
 
-def retry_with_backoff(func, *args, max_retries=5, initial_backoff=1, **kwargs):
+def retry_with_backoff(func, *args, max_retries=5, initial_backoff=1, cancel_token=None, **kwargs):
     """
     Retry a function call with exponential backoff
     
@@ -46,6 +53,7 @@ def retry_with_backoff(func, *args, max_retries=5, initial_backoff=1, **kwargs):
         *args: Arguments for the function
         max_retries: Maximum number of retries
         initial_backoff: Initial backoff time in seconds
+        cancel_token: Optional CancellationToken; stops retrying (and sleeping) once cancelled
         **kwargs: Keyword arguments for the function
         
     Returns:
@@ -55,6 +63,8 @@ def retry_with_backoff(func, *args, max_retries=5, initial_backoff=1, **kwargs):
     backoff = initial_backoff
     
     while True:
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
         try:
             return func(*args, **kwargs)
         except (botocore.exceptions.ClientError, 
@@ -85,16 +95,44 @@ def retry_with_backoff(func, *args, max_retries=5, initial_backoff=1, **kwargs):
             logger.warning(f"Retrying operation. Attempt {retries}/{max_retries} "
                           f"after sleeping for {sleep_time:.2f}s. Error: {str(e)}")
             
-            time.sleep(sleep_time)
+            if cancel_token:
+                cancel_token.sleep(sleep_time)
+            else:
+                time.sleep(sleep_time)
             
             # Exponential backoff with high cap
             backoff = min(backoff * 2, 3600)  # Cap at 1 hour
 
-def get_s3_client():
-    """Initialize and return an S3 client with the appropriate configuration"""
+# Transfer settings loaded by get_s3_client() and used by upload_file()
+transfer_profile = dict(CLI_DEFAULTS)
+
+# Running part times and duplicate-bandwidth budget for hedging straggler parts
+part_tracker = PartLatencyTracker()
+hedge_budget = HedgeBudget()
+
+# Cancelled by the first Ctrl-C (see install_sigint_handler): running uploads stop and
+# abort their multipart uploads, and no new files are started
+cancel_token = CancellationToken()
+
+def get_s3_client(max_pool_connections=None):
+    """
+    Initialize and return an S3 client with the appropriate configuration
+    
+    The client is an EndpointPool: it is used like a boto3 client but routes every
+    call to the healthiest endpoint.
+    
+    Args:
+        max_pool_connections: HTTP connections per endpoint (defaults to what the
+            transfer profile needs)
+    """
+    global transfer_profile
+    
     # Load environment variables
     load_dotenv()
     
+    # Transfer settings: calibrated profile (see calibrate.py) or the built-in defaults
+    transfer_profile = load_transfer_profile('cli')
+    
     # DigitalOcean Spaces credentials
     spaces_key = os.getenv('DO_SPACES_KEY')
     spaces_secret = os.getenv('DO_SPACES_SECRET')
@@ -115,97 +153,238 @@ def get_s3_client():
         },
         connect_timeout=86400,     # 24 hours
         read_timeout=86400,        # 24 hours
-        max_pool_connections=30
+        max_pool_connections=max_pool_connections or pool_connections(transfer_profile)
     )
     
     # Determine if we should use acceleration endpoint
     use_acceleration = os.getenv('USE_ACCELERATION', 'True').lower() in ('true', 'yes', '1')
     
-    # Set the endpoint based on acceleration setting
-    if use_acceleration:
-        endpoint_url = f'https://{spaces_bucket}.s3-accelerate.amazonaws.com'
-        logger.info(f"Using S3 Transfer Acceleration endpoint: {endpoint_url}")
-    else:
-        endpoint_url = spaces_endpoint
-        logger.info(f"Using standard S3 endpoint: {endpoint_url}")
-    
-    # Create S3 client
-    s3 = boto3.client('s3',
-                      region_name=spaces_region,
-                      endpoint_url=endpoint_url,
-                      aws_access_key_id=spaces_key,
-                      aws_secret_access_key=spaces_secret,
-                      config=s3_config)
-    
-    # Enable transfer acceleration on the bucket if needed
-    if use_acceleration:
+    # Extra endpoints (comma-separated URLs) to spread and fail over traffic across
+    extra_endpoints = [url.strip() for url in os.getenv('DO_SPACES_EXTRA_ENDPOINTS', '').split(',') if url.strip()]
+    
+    # Create the S3 client pool: each call goes to the healthiest endpoint and fails
+    # over to the next one on endpoint errors
+    s3 = create_endpoint_pool(spaces_bucket, spaces_region, spaces_key, spaces_secret,
+                              spaces_endpoint, use_acceleration, s3_config, extra_endpoints)
+    
+    return s3, spaces_bucket
+
+def upload_large_file(s3, bucket, local_path, s3_path, file_size, profile=None):
+    """
+    Multipart upload of a local file with each part sent as its own request.
+    
+    Parts are read from disk on demand (at most max_concurrency parts in memory) and
+    every upload_part goes through the client pool, so a file can move to another
+    endpoint mid-upload without starting over. Straggler parts get a hedged duplicate.
+    The file has its own cancellation token: the first part that fails cancels it, so
+    the other parts stop at their next read or retry sleep instead of running through
+    their own retries before the upload is aborted.
+    
+    Args:
+        profile: Transfer settings to use (defaults to the loaded transfer profile)
+    
+    Returns:
+        Dict with the number of parts, hedged parts and hedges that won
+    """
+    profile = profile or transfer_profile
+    
+    # S3 allows at most 10,000 parts per upload
+    part_size = max(profile['multipart_chunksize'], math.ceil(file_size / 10000))
+    part_count = max(1, math.ceil(file_size / part_size))
+    
+    mpu = retry_with_backoff(
+        s3.create_multipart_upload,
+        Bucket=bucket,
+        Key=s3_path,
+        max_retries=30,
+        initial_backoff=5,
+        cancel_token=cancel_token
+    )
+    upload_id = mpu['UploadId']
+    stats = {'parts': part_count, 'hedged_parts': 0, 'hedge_wins': 0}
+    
+    # Cancelled by Ctrl-C (through cancel_token) or by the first failed part
+    file_token = cancel_token.child()
+    failures = []
+    
+    def upload_part(part_number):
+        file_token.raise_if_cancelled()
+        with open(local_path, 'rb') as f:
+            f.seek((part_number - 1) * part_size)
+            data = f.read(part_size)
+        
+        part_start = time.time()
         try:
-            logger.info(f"Checking Transfer Acceleration status for bucket: {spaces_bucket}")
-            acceleration_status = s3.get_bucket_accelerate_configuration(Bucket=spaces_bucket)
-            current_status = acceleration_status.get('Status', 'None')
-            
-            if current_status != 'Enabled':
-                logger.info(f"Enabling Transfer Acceleration for bucket: {spaces_bucket}")
-                s3.put_bucket_accelerate_configuration(
-                    Bucket=spaces_bucket,
-                    AccelerateConfiguration={'Status': 'Enabled'}
-                )
-                logger.info("Transfer Acceleration enabled successfully")
-            else:
-                logger.info("Transfer Acceleration already enabled")
+            part = retry_with_backoff(
+                hedged_upload_part,
+                s3.upload_part,
+                part_tracker,
+                hedge_budget,
+                Body=data,
+                stats=stats,
+                token=file_token,
+                Bucket=bucket,
+                Key=s3_path,
+                PartNumber=part_number,
+                UploadId=upload_id,
+                max_retries=30,
+                initial_backoff=5,
+                cancel_token=file_token
+            )
+        except TransferCancelled:
+            raise
         except Exception as e:
-            logger.warning(f"Could not enable Transfer Acceleration: {str(e)}")
-            logger.warning("Will proceed with standard endpoint")
-            # Fallback to standard endpoint if acceleration fails
-            s3 = boto3.client('s3',
-                          region_name=spaces_region,
-                          endpoint_url=spaces_endpoint,
-                          aws_access_key_id=spaces_key,
-                          aws_secret_access_key=spaces_secret,
-                          config=s3_config)
+            log_event(logger, 'part', level=logging.ERROR, local_path=local_path, s3_path=s3_path,
+                      upload_id=upload_id, part_number=part_number, bytes=len(data),
+                      seconds=round(time.time() - part_start, 3), status='failed', error=str(e))
+            failures.append(e)
+            file_token.cancel(f"part {part_number} failed")
+            raise
+        
+        log_event(logger, 'part', sample_rate=PART_SAMPLE_RATE, local_path=local_path, s3_path=s3_path,
+                  upload_id=upload_id, part_number=part_number, bytes=len(data),
+                  seconds=round(time.time() - part_start, 3), status='success')
+        return {'PartNumber': part_number, 'ETag': part['ETag']}
     
-    return s3, spaces_bucket
+    executor = ThreadPoolExecutor(max_workers=profile['max_concurrency'])
+    try:
+        futures = [executor.submit(upload_part, n) for n in range(1, part_count + 1)]
+        parts = [future.result() for future in futures]
+        
+        retry_with_backoff(
+            s3.complete_multipart_upload,
+            Bucket=bucket,
+            Key=s3_path,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts},
+            max_retries=30,
+            initial_backoff=10
+        )
+    except BaseException as e:
+        # Stop queued and running parts, then clean up the incomplete upload
+        file_token.cancel('upload failed')
+        executor.shutdown(wait=True, cancel_futures=True)
+        try:
+            retry_with_backoff(
+                s3.abort_multipart_upload,
+                Bucket=bucket,
+                Key=s3_path,
+                UploadId=upload_id,
+                max_retries=5,
+                initial_backoff=1
+            )
+        except Exception as abort_error:
+            logger.error(f"Failed to abort multipart upload: {str(abort_error)}")
+        # Parts stopped because a sibling failed report that failure, not a cancel
+        if isinstance(e, TransferCancelled) and failures and not cancel_token.cancelled:
+            raise failures[0]
+        raise
+    finally:
+        executor.shutdown(wait=False)
+    
+    return stats
 
 def upload_file(s3, bucket, local_path, s3_path):
     """Upload a single file to S3 with retry logic"""
-    logger.info(f"Uploading {local_path} to {s3_path}")
-    
-    # Create a transfer config with increased timeouts for larger files
-    transfer_config = TransferConfig(
-        multipart_threshold=10 * 1024 * 1024,  # 10MB
-        max_concurrency=10,
-        multipart_chunksize=25 * 1024 * 1024,  # 25MB chunks
-        use_threads=True,
-        max_io_queue=100,
-        io_chunksize=262144     # 256KB chunks for reading
-    )
+    logger.debug("Uploading %s to %s", local_path, s3_path)
+    
+    # Create a transfer config from the loaded transfer profile
+    transfer_config = build_transfer_config(transfer_profile)
     
     file_size = os.path.getsize(local_path)
-    logger.info(f"File size: {format_size(file_size)}")
+    logger.debug("File size: %s", format_size(file_size))
     
     try:
         start_time = time.time()
+        stats = {}
         
-        # Use retry_with_backoff for the upload_file operation
-        retry_with_backoff(
-            s3.upload_file,
-            local_path,  # Filename
-            bucket,      # Bucket
-            s3_path,     # Key
-            Config=transfer_config,  # Config with optimized parameters
-            max_retries=30,  # High retry count
-            initial_backoff=5  # Longer initial backoff
-        )
+        if file_size >= transfer_profile['multipart_threshold']:
+            # Large files: parts are routed (and retried) individually
+            stats = upload_large_file(s3, bucket, local_path, s3_path, file_size)
+        else:
+            # Below the multipart threshold the whole file is sent as a single part
+            try:
+                # Use retry_with_backoff for the upload_file operation
+                retry_with_backoff(
+                    s3.upload_file,
+                    local_path,  # Filename
+                    bucket,      # Bucket
+                    s3_path,     # Key
+                    Config=transfer_config,  # Config with optimized parameters
+                    max_retries=30,  # High retry count
+                    initial_backoff=5,  # Longer initial backoff
+                    cancel_token=cancel_token,
+                    Callback=lambda _: cancel_token.raise_if_cancelled()  # Stops boto3's transfer threads
+                )
+            except TransferCancelled:
+                raise
+            except Exception as e:
+                log_event(logger, 'part', level=logging.ERROR, local_path=local_path, s3_path=s3_path,
+                          part_number=1, bytes=file_size, seconds=round(time.time() - start_time, 3),
+                          status='failed', error=str(e))
+                raise
+            log_event(logger, 'part', sample_rate=PART_SAMPLE_RATE, local_path=local_path, s3_path=s3_path,
+                      part_number=1, bytes=file_size, seconds=round(time.time() - start_time, 3),
+                      status='success')
         
         elapsed = time.time() - start_time
-        logger.info(f"Upload completed: {s3_path} in {elapsed:.2f} seconds ({format_size(file_size/elapsed)}/s)")
+        logger.info("Upload completed: %s in %.2f seconds (%s/s)%s",
+                    s3_path, elapsed, format_size(file_size / max(elapsed, 1e-6)),
+                    f" - {stats['hedged_parts']} hedged parts ({stats['hedge_wins']} won)" if stats.get('hedged_parts') else "")
+        log_event(logger, 'transfer', local_path=local_path, s3_path=s3_path,
+                  bytes=file_size, seconds=round(elapsed, 3), status='success', **stats)
         return True
+    except TransferCancelled as e:
+        logger.warning(f"Upload cancelled for {local_path}: {str(e)}")
+        log_event(logger, 'transfer', level=logging.WARNING, local_path=local_path,
+                  s3_path=s3_path, bytes=file_size, seconds=round(time.time() - start_time, 3),
+                  status='cancelled', error=str(e))
+        return False
     except Exception as e:
         logger.error(f"Upload failed for {local_path}: {str(e)}")
+        log_event(logger, 'transfer', level=logging.ERROR, local_path=local_path,
+                  s3_path=s3_path, bytes=file_size, seconds=round(time.time() - start_time, 3),
+                  status='failed', error=str(e))
         return False
 
-def upload_directory(s3, bucket, local_dir, metadata):
-    """Upload an entire directory to S3 with the specified metadata"""
+def parse_shard(value):
+    """Parse a --shard value of the form i/k into an (index, count) tuple"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Shard must be in i/k format (e.g. 0/4)")
+    
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError("Shard index must satisfy 0 <= i < k")
+    
+    return index, count
+
+def shard_of(s3_path, shard_count):
+    """
+    Deterministically map an S3 key to a shard number.
+    
+    Uses a hash of the key (not the local path) so that every host computes the
+    same assignment regardless of where the files are mounted or what order
+    os.walk returns them in.
+    """
+    key = s3_path.replace('\\', '/')
+    digest = hashlib.md5(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shard_count
+
+def split_for_workers(file_list, workers):
+    """Split a file list into balanced batches (largest files first) for the worker pool"""
+    batches = [[] for _ in range(workers)]
+    batch_sizes = [0] * workers
+    
+    for file_info in sorted(file_list, key=lambda f: f['size'], reverse=True):
+        smallest = batch_sizes.index(min(batch_sizes))
+        batches[smallest].append(file_info)
+        batch_sizes[smallest] += file_info['size']
+    
+    return [batch for batch in batches if batch]
+
+def get_target_path(local_dir, metadata):
+    """Build the S3 prefix for a directory: User_Camera/Task_Date_OriginalTopDir"""
     # Extract metadata
     user = metadata['user']
     camera = metadata['camera']
@@ -221,14 +400,11 @@ def upload_directory(s3, bucket, local_dir, metadata):
     new_top_dir = f"{task}_{date}_{dir_name}"
     
     # Full target path in S3
-    target_path = f"{base_path}/{new_top_dir}"
-    
-    logger.info(f"Uploading directory: {local_dir}")
-    logger.info(f"Target S3 path: {target_path}")
-    
-    # Count files and calculate total size
-    total_files = 0
-    total_size = 0
+    return f"{base_path}/{new_top_dir}"
+
+def list_directory_files(local_dir, metadata):
+    """Build the list of files to upload from a directory and their target S3 paths"""
+    target_path = get_target_path(local_dir, metadata)
     file_list = []
     
     for root, _, files in os.walk(local_dir):
@@ -243,25 +419,31 @@ def upload_directory(s3, bucket, local_dir, metadata):
             rel_path = os.path.relpath(local_file_path, local_dir)
             s3_file_path = f"{target_path}/{rel_path}"
             
-            file_size = os.path.getsize(local_file_path)
-            total_size += file_size
-            total_files += 1
-            
             file_list.append({
                 'local_path': local_file_path,
                 's3_path': s3_file_path,
-                'size': file_size
+                'size': os.path.getsize(local_file_path)
             })
     
-    logger.info(f"Found {total_files} files to upload (Total: {format_size(total_size)})")
+    return target_path, file_list
+
+def upload_file_list(s3, bucket, file_list, label=None):
+    """Upload a list of files sequentially, logging progress under the given label"""
+    prefix = f"[{label}] " if label else ""
+    total_files = len(file_list)
+    total_size = sum(f['size'] for f in file_list)
     
-    # Upload files
     uploaded_files = 0
     failed_files = 0
     uploaded_size = 0
     
     for i, file_info in enumerate(file_list):
-        logger.info(f"[{i+1}/{total_files}] Uploading: {file_info['local_path']}")
+        if cancel_token.cancelled:
+            logger.warning(f"{prefix}Cancelled: {total_files - i} files not uploaded")
+            failed_files += total_files - i
+            break
+        
+        logger.info("%s[%d/%d] Uploading: %s", prefix, i + 1, total_files, file_info['local_path'])
         
         success = upload_file(
             s3, 
@@ -273,10 +455,100 @@ def upload_directory(s3, bucket, local_dir, metadata):
         if success:
             uploaded_files += 1
             uploaded_size += file_info['size']
-            logger.info(f"Progress: {uploaded_files}/{total_files} files ({format_size(uploaded_size)}/{format_size(total_size)})")
+            logger.info("%sProgress: %d/%d files (%s/%s)", prefix, uploaded_files, total_files,
+                        format_size(uploaded_size), format_size(total_size))
         else:
             failed_files += 1
-            logger.error(f"Failed to upload: {file_info['local_path']}")
+            logger.error(f"{prefix}Failed to upload: {file_info['local_path']}")
+    
+    return {
+        'uploaded_files': uploaded_files,
+        'failed_files': failed_files,
+        'total_files': total_files,
+        'uploaded_size': uploaded_size,
+        'total_size': total_size
+    }
+
+# Per-process S3 client for --workers mode (boto3 clients can't be pickled)
+_worker_client = None
+
+def _init_worker(log_queue):
+    """Create the S3 client once in each worker process"""
+    global _worker_client
+    # Records go to the parent process, the only one that writes (and rotates) the log file
+    setup_worker_logging(log_queue)
+    # Ctrl-C reaches the whole process group; each worker cancels its own uploads
+    install_sigint_handler(cancel_token)
+    _worker_client = get_s3_client()
+
+def _upload_file_list_in_worker(file_list, label):
+    """Entry point for a worker process: upload its batch with the process-local client"""
+    s3, bucket = _worker_client
+    return upload_file_list(s3, bucket, file_list, label)
+
+def upload_directory(s3, bucket, local_dir, metadata, shard=None, pool=None, workers=1):
+    """
+    Upload an entire directory to S3 with the specified metadata
+    
+    Args:
+        s3: S3 client (used when no worker pool is given)
+        bucket: Target bucket
+        local_dir: Local directory to upload
+        metadata: Dict with user, camera, task and date
+        shard: Optional (index, count) tuple; only files in this shard are uploaded
+        pool: Optional ProcessPoolExecutor created with _init_worker and worker_log_queue()
+        workers: Number of processes in the pool
+    """
+    target_path, file_list = list_directory_files(local_dir, metadata)
+    
+    logger.info(f"Uploading directory: {local_dir}")
+    logger.info(f"Target S3 path: {target_path}")
+    
+    shard_label = None
+    if shard:
+        shard_index, shard_count = shard
+        shard_label = f"shard {shard_index}/{shard_count}"
+        all_files = len(file_list)
+        file_list = [f for f in file_list if shard_of(f['s3_path'], shard_count) == shard_index]
+        logger.info(f"[{shard_label}] Selected {len(file_list)}/{all_files} files for this shard")
+    
+    total_files = len(file_list)
+    total_size = sum(f['size'] for f in file_list)
+    logger.info(f"Found {total_files} files to upload (Total: {format_size(total_size)})")
+    
+    if pool and workers > 1 and total_files > 1:
+        batches = split_for_workers(file_list, workers)
+        futures = []
+        for worker_index, batch in enumerate(batches):
+            label = f"worker {worker_index}/{len(batches)}"
+            if shard_label:
+                label = f"{shard_label} {label}"
+            futures.append(pool.submit(_upload_file_list_in_worker, batch, label))
+        
+        batch_results = []
+        for future, batch in zip(futures, batches):
+            try:
+                batch_results.append(future.result())
+            except Exception as e:
+                logger.error(f"Worker failed while uploading {len(batch)} files: {str(e)}")
+                batch_results.append({
+                    'uploaded_files': 0,
+                    'failed_files': len(batch),
+                    'total_files': len(batch),
+                    'uploaded_size': 0,
+                    'total_size': sum(f['size'] for f in batch)
+                })
+        
+        counts = {
+            key: sum(r[key] for r in batch_results)
+            for key in ('uploaded_files', 'failed_files', 'total_files', 'uploaded_size', 'total_size')
+        }
+    else:
+        counts = upload_file_list(s3, bucket, file_list, shard_label)
+    
+    uploaded_files = counts['uploaded_files']
+    failed_files = counts['failed_files']
+    uploaded_size = counts['uploaded_size']
     
     # Summary
     logger.info(f"Directory upload complete: {local_dir}")
@@ -293,22 +565,364 @@ def upload_directory(s3, bucket, local_dir, metadata):
         'total_size': total_size
     }
 
+def watch_directories(s3, bucket, dirs, metadata, state_path, shard=None, settle_seconds=30,
+                      batch_size=20, batch_interval=5, concurrency=4, poll_interval=10,
+                      force_polling=False):
+    """
+    Continuously upload new or finished files under the given directories.
+    
+    Files are picked up through inotify (or polling), uploaded once their size and
+    mtime have not changed for settle_seconds, and recorded in a local state store so
+    a restart never uploads the same file twice. If metadata['date'] is None, each
+    watched directory gets the date (mtime) of its first finished file, kept in the
+    state store, so a capture that runs past midnight stays under one prefix. A file
+    whose upload fails is retried with exponential backoff (see UploadStateStore).
+    
+    Args:
+        s3: S3 client
+        bucket: Target bucket
+        dirs: Directories to watch (each maps to its own Task_Date_Dir prefix)
+        metadata: Dict with user, camera, task and date
+        state_path: SQLite file recording uploaded files
+        shard: Optional (index, count) tuple; only files in this shard are uploaded
+        settle_seconds: How long a file must stay unchanged before it is uploaded
+        batch_size: Upload as soon as this many files are ready
+        batch_interval: Otherwise upload whatever is ready after this many seconds
+        concurrency: Number of files uploaded at the same time
+        poll_interval: Scan interval when inotify is not available
+        force_polling: Use polling even if inotify is available
+    """
+    roots = [os.path.abspath(d) for d in dirs]
+    store = UploadStateStore(state_path)
+    watcher = create_watcher(roots, poll_interval, force_polling)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    
+    pending = {}     # local path -> (size, mtime, monotonic time it may be uploaded)
+    ready = []       # files that have settled and wait for the next batch
+    in_flight = {}   # future -> file info
+    queued = set()   # local paths in ready or in_flight
+    last_flush = time.monotonic()
+    uploaded_files = 0
+    failed_files = 0
+    
+    def find_root(path):
+        for root in roots:
+            if path == root or path.startswith(root + os.sep):
+                return root
+        return None
+    
+    def observe(path):
+        """Start or continue tracking a file that may have changed"""
+        if path in queued:
+            # Re-checked once its upload finishes
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            pending.pop(path, None)
+            return
+        
+        key = (st.st_size, st.st_mtime)
+        previous = pending.get(path)
+        if previous and previous[:2] == key:
+            return
+        if store.is_uploaded(path, *key):
+            pending.pop(path, None)
+            return
+        
+        # Base the settle time on the file's own mtime so files that finished while we were
+        # down are uploaded right away
+        age = max(0, time.time() - st.st_mtime)
+        ready_at = time.monotonic() - age + settle_seconds
+        
+        # A version of the file that failed to upload waits out its backoff
+        retry_at = store.retry_at(path, *key)
+        if retry_at is not None:
+            ready_at = max(ready_at, time.monotonic() + retry_at - time.time())
+        pending[path] = (st.st_size, st.st_mtime, ready_at)
+    
+    logger.info(f"Watching {len(roots)} directories (settle: {settle_seconds}s, state: {state_path})")
+    for root in roots:
+        logger.info(f"  - {root}")
+    
+    try:
+        while not cancel_token.cancelled:
+            for path in watcher.wait(timeout=1.0):
+                observe(os.path.abspath(path))
+            
+            # Promote files that have stopped changing
+            now = time.monotonic()
+            for path, (size, mtime, ready_at) in list(pending.items()):
+                if now < ready_at:
+                    continue
+                
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    del pending[path]
+                    continue
+                if (st.st_size, st.st_mtime) != (size, mtime):
+                    pending[path] = (st.st_size, st.st_mtime, now + settle_seconds)
+                    continue
+                
+                del pending[path]
+                root = find_root(path)
+                if root is None:
+                    continue
+                
+                date = metadata['date'] or store.directory_date(
+                    root, time.strftime('%Y-%m-%d', time.localtime(mtime)))
+                file_metadata = dict(metadata, date=date)
+                rel_path = os.path.relpath(path, root)
+                s3_path = f"{get_target_path(root, file_metadata)}/{rel_path}"
+                if shard and shard_of(s3_path, shard[1]) != shard[0]:
+                    continue
+                
+                ready.append({'local_path': path, 's3_path': s3_path, 'size': size, 'mtime': mtime})
+                queued.add(path)
+            
+            # Send a batch when enough files are ready or the batch interval has passed
+            if ready and (len(ready) >= batch_size or now - last_flush >= batch_interval):
+                logger.info(f"Uploading batch of {len(ready)} files")
+                for file_info in ready:
+                    future = executor.submit(upload_file, s3, bucket, file_info['local_path'], file_info['s3_path'])
+                    in_flight[future] = file_info
+                ready = []
+                last_flush = now
+            
+            # Record finished uploads (the state store is only touched from this thread)
+            if in_flight:
+                done, _ = wait(list(in_flight), timeout=0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_info = in_flight.pop(future)
+                    queued.discard(file_info['local_path'])
+                    if future.result():
+                        store.mark_uploaded(file_info['local_path'], file_info['s3_path'],
+                                            file_info['size'], file_info['mtime'])
+                        uploaded_files += 1
+                    else:
+                        failed_files += 1
+                        retry_at = store.record_failure(file_info['local_path'], file_info['size'],
+                                                        file_info['mtime'])
+                        logger.warning(f"Retrying {file_info['local_path']} in "
+                                       f"{retry_at - time.time():.0f} seconds")
+                    # Picks up failed uploads (after their backoff) and files that changed while uploading
+                    observe(file_info['local_path'])
+    except KeyboardInterrupt:
+        logger.info("Stopping watch mode, waiting for in-flight uploads to finish")
+    finally:
+        if cancel_token.cancelled:
+            logger.info("Stopping watch mode, cancelling in-flight uploads")
+        executor.shutdown(wait=True)
+        for future, file_info in in_flight.items():
+            if not future.cancelled() and future.exception() is None and future.result():
+                store.mark_uploaded(file_info['local_path'], file_info['s3_path'],
+                                    file_info['size'], file_info['mtime'])
+                uploaded_files += 1
+        watcher.close()
+        store.close()
+        logger.info(f"Watch mode stopped: {uploaded_files} files uploaded, {failed_files} failed attempts")
+        log_endpoint_health(s3)
+    
+    return 0
+
+def log_endpoint_health(s3):
+    """Log the health statistics of each endpoint in the client pool"""
+    for endpoint in s3.health():
+        logger.info(f"Endpoint {endpoint['name']} ({endpoint['url']}): {endpoint['requests']} requests, "
+                    f"{endpoint['errors']} errors, error rate {endpoint['error_rate']:.2f}, "
+                    f"{'available' if endpoint['available'] else 'cooling down'}")
+
+def log_summary(results):
+    """Log the UPLOAD SUMMARY block for a list of directory results and return the exit code"""
+    logger.info("\n\n===== UPLOAD SUMMARY =====")
+    total_uploaded = 0
+    total_failed = 0
+    
+    for result in results:
+        dir_name = result['directory']
+        upload_result = result['result']
+        
+        status = "SUCCESS" if upload_result['success'] else "FAILED"
+        logger.info(f"{dir_name}: {status} - {upload_result['uploaded_files']}/{upload_result['total_files']} files uploaded")
+        
+        total_uploaded += upload_result['uploaded_files']
+        total_failed += upload_result['failed_files']
+    
+    logger.info(f"\nTotal files uploaded: {total_uploaded}")
+    logger.info(f"Total files failed: {total_failed}")
+    
+    if total_failed > 0:
+        logger.warning("Some files failed to upload. Check the log for details.")
+        return 1
+    else:
+        logger.info("All files uploaded successfully!")
+        return 0
+
+# Per-directory counts that merge-summaries adds up across shards
+SUMMARY_COUNTS = ('uploaded_files', 'failed_files', 'total_files', 'uploaded_size', 'total_size')
+
+def write_summary(path, results, shard=None):
+    """Write a run's directory results to a JSON summary file (input for merge-summaries)"""
+    with open(path, 'w') as f:
+        json.dump({
+            'shard': list(shard) if shard else None,
+            'host': socket.gethostname(),
+            'finished_at': time.time(),
+            'results': results
+        }, f, indent=2)
+    logger.info(f"Wrote upload summary to {path}")
+
+def merge_summaries(summaries):
+    """
+    Combine the directory results of several summary files (one per shard).
+    
+    Returns:
+        Results list for log_summary, with each directory's counts added up across shards
+    """
+    merged = {}
+    for summary in summaries:
+        for result in summary['results']:
+            entry = merged.setdefault(result['directory'], dict({key: 0 for key in SUMMARY_COUNTS}, success=True))
+            for key in SUMMARY_COUNTS:
+                entry[key] += result['result'][key]
+            entry['success'] = entry['success'] and result['result']['success']
+    return [{'directory': name, 'result': result} for name, result in merged.items()]
+
+def merge_main(argv):
+    """
+    'merge-summaries' subcommand: log one UPLOAD SUMMARY for the summary files written by
+    the --shard i/k runs on each host.
+    """
+    parser = argparse.ArgumentParser(prog='auto_upload.py merge-summaries',
+                                     description='Combine the upload summaries of several shards')
+    parser.add_argument('files', nargs='+', help='Summary files written with --summary-file (or by --shard runs)')
+    args = parser.parse_args(argv)
+    
+    summaries = []
+    for path in args.files:
+        try:
+            with open(path) as f:
+                summaries.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read summary {path}: {str(e)}")
+            return 1
+        shard = summaries[-1].get('shard')
+        logger.info(f"{path}: {'shard ' + '/'.join(map(str, shard)) if shard else 'unsharded run'} "
+                    f"on {summaries[-1].get('host', 'unknown host')}, {len(summaries[-1]['results'])} directories")
+    
+    # Every shard of the run should be there exactly once
+    shards = [tuple(summary['shard']) for summary in summaries if summary.get('shard')]
+    complete = True
+    for count in sorted({k for _, k in shards}):
+        found = sorted(i for i, k in shards if k == count)
+        missing = sorted(set(range(count)) - set(found))
+        if missing:
+            logger.warning(f"Missing summaries for shard(s) {', '.join(f'{i}/{count}' for i in missing)}")
+            complete = False
+        if len(found) != len(set(found)):
+            logger.warning(f"Some shards of {count} appear more than once; their counts are added twice")
+            complete = False
+    
+    exit_code = log_summary(merge_summaries(summaries))
+    return exit_code if complete else 1
+
+def move_main(command, argv):
+    """
+    'move' / 'copy' subcommands: server-side copy of a whole prefix (e.g. to fix a typo
+    in the task or date), deleting the originals for 'move'.
+    """
+    parser = argparse.ArgumentParser(prog=f'auto_upload.py {command}',
+                                     description=f'Server-side {command} of every object under a prefix')
+    parser.add_argument('source', help='Source prefix (e.g. jaemin_jetson5/calbi_2024-05-01_day1/)')
+    parser.add_argument('destination', help='Destination prefix')
+    parser.add_argument('--overwrite', action='store_true', help='Replace objects that already exist at the destination')
+    parser.add_argument('--dry-run', action='store_true', help='Only show what would be copied')
+    parser.add_argument('--concurrency', type=int, default=COPY_CONCURRENCY, help='Objects copied at the same time')
+    args = parser.parse_args(argv)
+    
+    s3, bucket = get_s3_client()
+    try:
+        result = move_prefix(s3, bucket, args.source, args.destination,
+                             delete_source=(command == 'move'),
+                             overwrite=args.overwrite,
+                             dry_run=args.dry_run,
+                             concurrency=args.concurrency,
+                             retry=retry_with_backoff)
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    
+    logger.info(f"\n{'='*80}\n{command.upper()} SUMMARY\n{'='*80}")
+    logger.info(f"{result['source']} -> {result['destination']}")
+    logger.info(f"Objects under source: {result['objects']}")
+    if result['dry_run']:
+        logger.info(f"Would copy: {result['to_copy']} objects ({format_size(result['bytes'])})")
+    else:
+        logger.info(f"Copied: {result['copied']} objects ({format_size(result['copied_bytes'])}) "
+                    f"with {result['copy_requests']} copy requests in {result['seconds']:.2f}s")
+        if command == 'move':
+            logger.info(f"Deleted originals: {result['deleted']}")
+    if result['already_copied']:
+        logger.info(f"Already copied by an earlier run: {result['already_copied']} objects"
+                    f"{' (originals deleted)' if command == 'move' and not result['dry_run'] else ''}")
+    if result['conflicts']:
+        logger.warning(f"{len(result['conflicts'])} different objects already exist at the destination "
+                       f"and were left alone (use --overwrite to replace them)")
+    for key, error in result['errors'].items():
+        logger.error(f"  {key}: {error}")
+    
+    return 1 if result['errors'] else 0
+
 def main():
+    # Configure logging (worker processes log through this process, see _init_worker)
+    setup_logging(log_file=LOG_FILE)
+    
+    # Server-side prefix copy/move subcommands
+    if len(sys.argv) > 1 and sys.argv[1] in ('move', 'copy'):
+        return move_main(sys.argv[1], sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge-summaries':
+        return merge_main(sys.argv[2:])
+    
+    # First Ctrl-C cancels the running uploads cleanly, a second one quits immediately
+    install_sigint_handler(cancel_token)
+    
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Automatically upload directories to S3')
     parser.add_argument('--user', required=True, help='User name for metadata')
     parser.add_argument('--camera', required=True, help='Camera name for metadata')
     parser.add_argument('--task', required=True, help='Task name for metadata')
-    parser.add_argument('--date', default=time.strftime('%Y-%m-%d'), help='Date for metadata (YYYY-MM-DD format, defaults to today)')
+    parser.add_argument('--date', help='Date for metadata (YYYY-MM-DD format, defaults to today)')
     parser.add_argument('--dirs', nargs='*', help='Specific directories to upload (defaults to all directories in script location)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of uploader processes to spread files across (defaults to 1)')
+    parser.add_argument('--shard', type=parse_shard, help='Only upload shard i of k (e.g. 0/2 on one host, 1/2 on another)')
+    parser.add_argument('--summary-file', help='Write the results to this JSON file (default with --shard: upload_summary_<i>of<k>.json)')
+    parser.add_argument('--watch', action='store_true', help='Keep running and upload new files as soon as they are finished')
+    parser.add_argument('--settle-seconds', type=float, default=30, help='Watch mode: seconds a file must stay unchanged before upload')
+    parser.add_argument('--batch-size', type=int, default=20, help='Watch mode: upload as soon as this many files are ready')
+    parser.add_argument('--batch-interval', type=float, default=5, help='Watch mode: upload ready files at least this often (seconds)')
+    parser.add_argument('--watch-concurrency', type=int, default=4, help='Watch mode: files uploaded at the same time')
+    parser.add_argument('--poll-interval', type=float, default=10, help='Watch mode: scan interval when inotify is unavailable')
+    parser.add_argument('--force-polling', action='store_true', help='Watch mode: poll even if inotify is available')
+    parser.add_argument('--state-file', default='upload_state.db', help='Watch mode: local record of uploaded files')
     args = parser.parse_args()
     
-    # Validate date format
-    try:
-        time.strptime(args.date, '%Y-%m-%d')
-    except ValueError:
-        logger.error("Date must be in YYYY-MM-DD format")
+    if args.workers < 1:
+        logger.error("--workers must be at least 1")
         sys.exit(1)
+    if args.watch and args.workers > 1:
+        logger.error("--workers does not apply to --watch; use --watch-concurrency")
+        sys.exit(1)
+    
+    # Validate date format (watch mode without --date dates each directory when it is first seen)
+    if args.date is None and not args.watch:
+        args.date = time.strftime('%Y-%m-%d')
+    if args.date is not None:
+        try:
+            time.strptime(args.date, '%Y-%m-%d')
+        except ValueError:
+            logger.error("Date must be in YYYY-MM-DD format")
+            sys.exit(1)
     
     # Get S3 client
     s3, bucket = get_s3_client()
@@ -325,7 +939,11 @@ def main():
     logger.info(f"  User: {metadata['user']}")
     logger.info(f"  Camera: {metadata['camera']}")
     logger.info(f"  Task: {metadata['task']}")
-    logger.info(f"  Date: {metadata['date']}")
+    logger.info(f"  Date: {metadata['date'] or 'date each directory is first seen'}")
+    if args.shard:
+        logger.info(f"  Shard: {args.shard[0]}/{args.shard[1]}")
+    if args.workers > 1:
+        logger.info(f"  Workers: {args.workers}")
     
     # Get script directory
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -351,46 +969,59 @@ def main():
         logger.error("No directories found to upload")
         sys.exit(1)
     
+    if args.watch:
+        return watch_directories(
+            s3, bucket, dirs_to_upload, metadata, args.state_file,
+            shard=args.shard,
+            settle_seconds=args.settle_seconds,
+            batch_size=args.batch_size,
+            batch_interval=args.batch_interval,
+            concurrency=args.watch_concurrency,
+            poll_interval=args.poll_interval,
+            force_polling=args.force_polling
+        )
+    
     logger.info(f"Found {len(dirs_to_upload)} directories to upload:")
     for dir_path in dirs_to_upload:
         logger.info(f"  - {os.path.basename(dir_path)}")
     
+    # Start the worker processes once and reuse them for every directory
+    pool = None
+    if args.workers > 1:
+        pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                   initargs=(worker_log_queue(),))
+    
     # Upload each directory
     results = []
-    for dir_path in dirs_to_upload:
-        dir_name = os.path.basename(dir_path)
-        logger.info(f"\n{'='*80}\nProcessing directory: {dir_name}\n{'='*80}")
-        
-        result = upload_directory(s3, bucket, dir_path, metadata)
-        results.append({
-            'directory': dir_name,
-            'result': result
-        })
-    
-    # Print summary
-    logger.info("\n\n===== UPLOAD SUMMARY =====")
-    total_uploaded = 0
-    total_failed = 0
+    try:
+        for dir_path in dirs_to_upload:
+            dir_name = os.path.basename(dir_path)
+            logger.info(f"\n{'='*80}\nProcessing directory: {dir_name}\n{'='*80}")
+            
+            result = upload_directory(s3, bucket, dir_path, metadata,
+                                      shard=args.shard, pool=pool, workers=args.workers)
+            results.append({
+                'directory': dir_name,
+                'result': result
+            })
+    finally:
+        if pool:
+            pool.shutdown()
     
-    for result in results:
-        dir_name = result['directory']
-        upload_result = result['result']
-        
-        status = "SUCCESS" if upload_result['success'] else "FAILED"
-        logger.info(f"{dir_name}: {status} - {upload_result['uploaded_files']}/{upload_result['total_files']} files uploaded")
-        
-        total_uploaded += upload_result['uploaded_files']
-        total_failed += upload_result['failed_files']
+    log_endpoint_health(s3)
+    exit_code = log_summary(results)
     
-    logger.info(f"\nTotal files uploaded: {total_uploaded}")
-    logger.info(f"Total files failed: {total_failed}")
+    # Shard results are combined with 'auto_upload.py merge-summaries'
+    summary_file = args.summary_file
+    if summary_file is None and args.shard:
+        summary_file = f"upload_summary_{args.shard[0]}of{args.shard[1]}.json"
+    if summary_file:
+        write_summary(summary_file, results, args.shard)
     
-    if total_failed > 0:
-        logger.warning("Some files failed to upload. Check the log for details.")
-        return 1
-    else:
-        logger.info("All files uploaded successfully!")
-        return 0
+    if cancel_token.cancelled:
+        logger.warning("Upload cancelled before all files were uploaded")
+        return 130
+    return exit_code
 
 if __name__ == "__main__":
     sys.exit(main()) 
\ No newline at end of file
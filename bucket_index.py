@@ -0,0 +1,200 @@
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+def manifest_prefix(paths):
+    """Deepest directory prefix shared by all paths, e.g. ``User_Camera/Task_Date_Dir/`` ('' if none)"""
+    common = None
+    for path in paths:
+        dirs = path.split('/')[:-1]
+        if common is None:
+            common = dirs
+            continue
+        length = 0
+        while length < min(len(common), len(dirs)) and common[length] == dirs[length]:
+            length += 1
+        common = common[:length]
+    return '/'.join(common) + '/' if common else ''
+
+def etag_matches(etag, md5):
+    """
+    Compare an object's ETag with the hex MD5 of a local file.
+
+    A plain ETag is the object's MD5 and a single-part multipart ETag is the MD5 of
+    that MD5 plus "-1"; for other multipart ETags the part size would be needed.
+
+    Returns:
+        True or False, or None when the ETag can't be checked against the MD5
+    """
+    if not etag or not md5:
+        return None
+    etag = etag.strip('"').lower()
+    md5 = md5.lower()
+    if '-' not in etag:
+        return etag == md5
+    digest, parts = etag.split('-', 1)
+    if parts == '1':
+        return digest == hashlib.md5(bytes.fromhex(md5)).hexdigest()
+    return None
+
+class PrefixIndex:
+    """
+    Cached index of the objects (size, ETag, last modified) under key prefixes.
+
+    A manifest is indexed under the deepest prefix its files share (usually
+    ``User_Camera/Task_Date_Dir/``), so checking one capture directory never lists the
+    rest of the user's objects. A prefix is listed with paginated ListObjectsV2 the
+    first time it is needed; once it is older than ttl seconds, callers keep getting
+    the cached objects while one background listing merges changes into them. Uploads
+    made by this process are added with record_upload(), so the index stays current
+    between listings without going back to the bucket.
+    """
+
+    def __init__(self, s3, bucket, ttl=300):
+        self.s3 = s3
+        self.bucket = bucket
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # prefix -> {'objects': {key: (size, etag, last_modified)}, 'refreshed': ts,
+        #            'refreshing': bool, 'lock': Lock}
+        self.prefixes = {}
+
+    def _entry(self, prefix):
+        """Cache entry for a prefix, or for an already listed prefix that contains it"""
+        with self.lock:
+            for cached, entry in self.prefixes.items():
+                if prefix.startswith(cached) and entry['refreshed']:
+                    return cached, entry
+            if prefix not in self.prefixes:
+                self.prefixes[prefix] = {'objects': {}, 'refreshed': 0, 'refreshing': False,
+                                         'lock': threading.Lock()}
+            return prefix, self.prefixes[prefix]
+
+    def refresh(self, prefix, entry=None):
+        """
+        List every object under the prefix and merge the listing into the cached entries.
+
+        Each page is merged as soon as it arrives; objects that were not listed are
+        dropped at the end, except uploads recorded while the listing was running.
+        """
+        if entry is None:
+            prefix, entry = self._entry(prefix)
+        seen = set()
+        kwargs = {'Bucket': self.bucket, 'Prefix': prefix, 'MaxKeys': 1000}
+        pages = 0
+        start = time.time()
+
+        while True:
+            response = self.s3.list_objects_v2(**kwargs)
+            pages += 1
+            page = {}
+            for obj in response.get('Contents', []):
+                last_modified = obj.get('LastModified')
+                page[obj['Key']] = (
+                    obj['Size'],
+                    obj.get('ETag'),
+                    last_modified.timestamp() if last_modified else None
+                )
+            with self.lock:
+                entry['objects'].update(page)
+            seen.update(page)
+            if not response.get('IsTruncated'):
+                break
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+        with self.lock:
+            gone = [key for key, value in entry['objects'].items()
+                    if key not in seen and not (value[2] and value[2] >= start)]
+            for key in gone:
+                del entry['objects'][key]
+            entry['refreshed'] = time.time()
+
+        logger.info(f"Indexed {len(seen)} objects under {prefix} ({pages} pages, {len(gone)} removed)")
+
+    def _refresh_in_background(self, prefix, entry):
+        try:
+            self.refresh(prefix, entry)
+        except Exception as e:
+            logger.warning(f"Background refresh of {prefix} failed: {str(e)}")
+        finally:
+            entry['refreshing'] = False
+
+    def get(self, prefix):
+        """
+        Return the cached objects under a prefix.
+
+        The first call for a prefix lists it; a stale prefix is returned as cached and
+        refreshed in the background.
+        """
+        cached, entry = self._entry(prefix)
+
+        # One listing per prefix at a time; other callers wait and reuse it
+        with entry['lock']:
+            if not entry['refreshed']:
+                self.refresh(cached, entry)
+            elif time.time() - entry['refreshed'] > self.ttl and not entry['refreshing']:
+                entry['refreshing'] = True
+                threading.Thread(target=self._refresh_in_background, args=(cached, entry),
+                                 daemon=True).start()
+
+        with self.lock:
+            return {key: value for key, value in entry['objects'].items() if key.startswith(prefix)}
+
+    def record_upload(self, key, size, etag=None):
+        """Add an object uploaded by this process to any cached prefix that contains it"""
+        with self.lock:
+            for prefix, entry in self.prefixes.items():
+                if key.startswith(prefix):
+                    entry['objects'][key] = (size, etag, time.time())
+
+    def invalidate(self, prefix):
+        """Drop cached listings that overlap a prefix (e.g. after a server-side move)"""
+        with self.lock:
+            for cached in list(self.prefixes):
+                if cached.startswith(prefix) or prefix.startswith(cached):
+                    del self.prefixes[cached]
+
+    def filter_manifest(self, files):
+        """
+        Return the manifest entries that still need uploading.
+
+        A file is skipped when an object with the same key and size exists and either
+        its ETag matches the file's MD5 (if the client sent one and the ETag can be
+        checked) or it was uploaded after the file was last modified.
+
+        Args:
+            files: List of dicts with path (the object key), size, mtime (ms since epoch)
+                and optionally md5 (hex digest of the file)
+
+        Returns:
+            (files_to_upload, skipped_files)
+        """
+        # One listing per User_Camera/Task_Date_Dir group, narrowed to what the files share
+        groups = {}
+        for file_info in files:
+            group = '/'.join(file_info['path'].split('/')[:-1][:2])
+            groups.setdefault(group, []).append(file_info)
+
+        to_upload = []
+        skipped = []
+        for group_files in groups.values():
+            objects = self.get(manifest_prefix(f['path'] for f in group_files))
+            for file_info in group_files:
+                existing = objects.get(file_info['path'])
+                if not existing or existing[0] != file_info['size']:
+                    to_upload.append(file_info)
+                    continue
+
+                unchanged = etag_matches(existing[1], file_info.get('md5'))
+                if unchanged is None:
+                    mtime = (file_info.get('mtime') or 0) / 1000.0
+                    unchanged = existing[2] is None or existing[2] >= mtime
+                if unchanged:
+                    skipped.append(dict(file_info, etag=existing[1]))
+                else:
+                    to_upload.append(file_info)
+
+        return to_upload, skipped
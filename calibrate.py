@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Calibrate transfer settings for the current link and write a transfer profile.
+
+Sweeps part size and concurrency (one dimension at a time, keeping the best value found
+so far; multipart_threshold keeps the target's default) by uploading a sample file
+through the same code path the target uploader uses, and writes the fastest combination
+that fits in the memory budget to that target's section of transfer_profile.json. app.py and auto_upload.py
+load their own section at startup.
+
+Code paths:
+    cli    auto_upload.py's large-file path: parts read from disk by each part thread
+    app    app.py's upload loop: parts read from the request body one after another and
+           uploaded max_concurrency at a time
+
+Usage:
+    python calibrate.py                                  # against the configured endpoint
+    python calibrate.py --target app
+    python calibrate.py --simulate --latency-ms 80 --bandwidth-mbps 500 --connection-mbps 60
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import logging
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import boto3
+from transfer_profile import (save_transfer_profile, pool_connections,
+                              TARGET_DEFAULTS, DEFAULT_PROFILE_PATH)
+from s3_standin import start_standin, add_simulation_args, simulation_kwargs
+import auto_upload
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Values tried for each dimension
+PART_SIZES = [8 * MB, 16 * MB, 25 * MB, 50 * MB, 100 * MB]
+CONCURRENCIES = [2, 4, 8, 16, 32]
+
+SWEEPS = {
+    'multipart_chunksize': PART_SIZES,
+    'max_concurrency': CONCURRENCIES,
+}
+
+def format_size(size_bytes):
+    """Format bytes into a human-readable form"""
+    units = ['B', 'KB', 'MB', 'GB', 'TB']
+    unit_index = 0
+    size = float(size_bytes)
+
+    while size >= 1024 and unit_index < len(units) - 1:
+        size /= 1024
+        unit_index += 1
+
+    return f"{size:.2f} {units[unit_index]}"
+
+def upload_parts(s3, bucket, sample_path, key, profile):
+    """auto_upload.py's path for files above the threshold: parallel, individually routed parts"""
+    auto_upload.upload_large_file(s3, bucket, sample_path, key, os.path.getsize(sample_path), profile)
+
+def upload_streaming(s3, bucket, sample_path, key, profile):
+    """app.py's path: parts read one after another, up to max_concurrency of them in flight"""
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+    parts = []
+    in_flight = {}
+    part_number = 0
+
+    def upload_part(part_number, chunk):
+        part = s3.upload_part(Bucket=bucket, Key=key, PartNumber=part_number, UploadId=upload_id, Body=chunk)
+        return {'PartNumber': part_number, 'ETag': part['ETag']}
+
+    with open(sample_path, 'rb') as f, ThreadPoolExecutor(max_workers=profile['max_concurrency']) as executor:
+        chunk = True
+        while chunk or in_flight:
+            if chunk and len(in_flight) < profile['max_concurrency']:
+                chunk = f.read(profile['multipart_chunksize'])
+                if chunk:
+                    part_number += 1
+                    in_flight[executor.submit(upload_part, part_number, chunk)] = part_number
+                continue
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                del in_flight[future]
+                parts.append(future.result())
+
+    parts.sort(key=lambda part: part['PartNumber'])
+    s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id,
+                                 MultipartUpload={'Parts': parts})
+
+# Per code path: how a sample is uploaded, which settings it actually uses, and the
+# worst-case buffer memory of a profile on that path
+CODE_PATHS = {
+    'cli': {
+        'target': 'cli',
+        'upload': upload_parts,
+        'sweep': ('multipart_chunksize', 'max_concurrency'),
+        'memory': lambda p: p['multipart_chunksize'] * p['max_concurrency'],
+    },
+    'app': {
+        'target': 'app',
+        'upload': upload_streaming,
+        'sweep': ('multipart_chunksize', 'max_concurrency'),
+        'memory': lambda p: p['multipart_chunksize'] * p['max_concurrency'],
+    },
+}
+
+def estimate_memory(profile, code_path):
+    """Worst-case buffer memory of a profile on a code path"""
+    return CODE_PATHS[code_path]['memory'](profile)
+
+def fit_to_budget(profile, code_path, memory_budget):
+    """
+    Shrink a starting profile until it fits the memory budget: halve the concurrency
+    (down to 1), then the part size (down to the smallest candidate).
+
+    Returns:
+        The fitted profile, or None if even the smallest settings don't fit
+    """
+    profile = dict(profile)
+    while estimate_memory(profile, code_path) > memory_budget:
+        if profile['max_concurrency'] > 1:
+            profile['max_concurrency'] //= 2
+        elif profile['multipart_chunksize'] > PART_SIZES[0]:
+            profile['multipart_chunksize'] = max(PART_SIZES[0], profile['multipart_chunksize'] // 2)
+        else:
+            return None
+    return profile
+
+def create_sample_file(size):
+    """Create a (sparse) sample file of the given size and return its path"""
+    fd, path = tempfile.mkstemp(prefix='calibrate_', suffix='.bin')
+    with os.fdopen(fd, 'wb') as f:
+        f.truncate(size)
+    return path
+
+def measure(s3, bucket, sample_path, sample_size, profile, code_path, prefix, repeats):
+    """Upload the sample file with the given profile and return the median throughput (bytes/s)"""
+    upload = CODE_PATHS[code_path]['upload']
+    key = f"{prefix}{uuid.uuid4().hex}.bin"
+    results = []
+
+    for _ in range(repeats):
+        start = time.time()
+        upload(s3, bucket, sample_path, key, profile)
+        results.append(sample_size / max(time.time() - start, 1e-6))
+        s3.delete_object(Bucket=bucket, Key=key)
+
+    return statistics.median(results)
+
+def sweep(s3, bucket, sample_path, sample_size, profile, code_path, memory_budget, prefix, repeats):
+    """Coordinate-descent sweep over the settings the code path uses"""
+    best = fit_to_budget(profile, code_path, memory_budget)
+    if best is None:
+        return profile, 0
+    if best != profile:
+        logger.info(f"Starting from {best['multipart_chunksize'] // MB}MB parts, concurrency "
+                    f"{best['max_concurrency']} to fit the {format_size(memory_budget)} budget")
+    best_throughput = 0
+
+    for key in CODE_PATHS[code_path]['sweep']:
+        stage_best = best[key]
+        for value in SWEEPS[key]:
+            candidate = dict(best, **{key: value})
+            if estimate_memory(candidate, code_path) > memory_budget:
+                logger.info(f"Skipping {key}={value}: needs {format_size(estimate_memory(candidate, code_path))}")
+                continue
+
+            throughput = measure(s3, bucket, sample_path, sample_size, candidate, code_path, prefix, repeats)
+            logger.info(f"{key}={value}: {format_size(throughput)}/s")
+
+            if throughput > best_throughput:
+                best_throughput = throughput
+                stage_best = value
+        best[key] = stage_best
+
+    # multipart_threshold isn't swept (the sample is always multipart), so it keeps the
+    # starting value: it decides which files are sent as a single request, not how fast
+    return best, best_throughput
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibrate transfer settings and write a transfer profile')
+    parser.add_argument('--target', choices=['cli', 'app'], default='cli',
+                        help='Which uploader the profile is for (selects the code path and starting defaults)')
+    parser.add_argument('--sample-mb', type=int, default=512, help='Size of the sample upload')
+    parser.add_argument('--memory-budget-mb', type=int, default=1024, help='Maximum buffer memory for a profile')
+    parser.add_argument('--repeats', type=int, default=1, help='Uploads per measurement (median is used)')
+    parser.add_argument('--prefix', default='_calibration/', help='Key prefix for the sample objects')
+    parser.add_argument('--output', default=DEFAULT_PROFILE_PATH, help='Where to write the profile')
+    parser.add_argument('--simulate', action='store_true', help='Calibrate against a local S3 stand-in instead')
+    add_simulation_args(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    code_path = args.target
+
+    # Enough connections for the largest concurrency tried (plus hedged duplicates)
+    connections = pool_connections({'max_concurrency': max(CONCURRENCIES)})
+
+    server = None
+    if args.simulate:
+        server, endpoint_url = start_standin(**simulation_kwargs(args))
+        logger.info(f"Calibrating against local S3 stand-in at {endpoint_url}")
+        s3 = boto3.client('s3', endpoint_url=endpoint_url, region_name='us-east-1',
+                          aws_access_key_id='calibrate', aws_secret_access_key='calibrate',
+                          config=boto3.session.Config(max_pool_connections=connections))
+        bucket = 'calibration'
+    else:
+        s3, bucket = auto_upload.get_s3_client(max_pool_connections=connections)
+        endpoint_url = s3.meta.endpoint_url
+
+    logger.info(f"Calibrating the '{code_path}' code path")
+    defaults = TARGET_DEFAULTS[args.target]
+    sample_size = args.sample_mb * MB
+    sample_path = create_sample_file(sample_size)
+
+    try:
+        best, throughput = sweep(s3, bucket, sample_path, sample_size, defaults, code_path,
+                                 args.memory_budget_mb * MB, args.prefix, args.repeats)
+    finally:
+        os.remove(sample_path)
+        if server:
+            server.shutdown()
+
+    if not throughput:
+        logger.error("No configuration fit in the memory budget")
+        return 1
+
+    path = save_transfer_profile(
+        best, args.target, args.output,
+        calibrated_at=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        code_path=code_path,
+        endpoint=endpoint_url,
+        simulated=args.simulate,
+        throughput_bytes_per_sec=round(throughput),
+        memory_bytes=estimate_memory(best, code_path),
+        swept=list(CODE_PATHS[code_path]['sweep'])  # The other settings are the target's defaults
+    )
+    logger.info(f"Best: {best['multipart_chunksize'] // MB}MB parts, concurrency {best['max_concurrency']} "
+                f"at {format_size(throughput)}/s")
+    logger.info(f"'{args.target}' transfer profile written to {path}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import os
+import time
+import select
+import signal
+import socket
+import ssl
+import logging
+import weakref
+import threading
+
+logger = logging.getLogger(__name__)
+
+# How often waiting code and the disconnect monitor look at a token / the client socket
+CANCEL_POLL_INTERVAL = float(os.getenv('CANCEL_POLL_INTERVAL', 0.5))
+
+class TransferCancelled(Exception):
+    """Raised inside a transfer (or a request body) that was cancelled"""
+
+class CancellationToken:
+    """
+    Shared flag that tells every part of one transfer to stop.
+
+    Part requests check it as their body is read, retry loops sleep on it instead of
+    time.sleep, and the code driving the transfer aborts the multipart upload. A child
+    token (e.g. one file of a run) is cancelled along with its parent but can also be
+    cancelled on its own.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.reason = None
+        self.lock = threading.Lock()
+        self.children = weakref.WeakSet()
+
+    def cancel(self, reason='cancelled'):
+        """Cancel the transfer (and its child tokens); returns False if it was already cancelled"""
+        with self.lock:
+            if self.event.is_set():
+                return False
+            self.reason = reason
+            self.event.set()
+            children = list(self.children)
+        for child in children:
+            child.cancel(reason)
+        return True
+
+    def child(self):
+        """New token that is cancelled with this one; cancelling the child leaves this one alone"""
+        token = CancellationToken()
+        with self.lock:
+            if not self.event.is_set():
+                self.children.add(token)
+                return token
+        token.cancel(self.reason)
+        return token
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.event.is_set():
+            raise TransferCancelled(self.reason)
+
+    def sleep(self, seconds):
+        """Sleep like time.sleep, but raise TransferCancelled as soon as the token is cancelled"""
+        if self.event.wait(seconds):
+            raise TransferCancelled(self.reason)
+
+class CancellationRegistry:
+    """
+    Tokens of running uploads by upload ID, so a cancel request can reach them.
+
+    A cancel that arrives before its upload has registered (the client cancelled while
+    the request was still queued) is remembered for ttl seconds, and the upload starts
+    out cancelled. An upload ID can only be running once: a second upload with the same
+    ID is refused rather than taking over the first one's token.
+    """
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.running = {}    # upload_id -> token
+        self.early = {}      # upload_id -> (token, cancelled_at)
+
+    def register(self, upload_id):
+        """Return the token for a new upload, or None if an upload with this ID is already running"""
+        with self.lock:
+            if upload_id in self.running:
+                return None
+            early = self.early.pop(upload_id, None)
+            token = early[0] if early else CancellationToken()
+            self.running[upload_id] = token
+            return token
+
+    def unregister(self, upload_id, token):
+        """Remove a finished upload (only if the ID still belongs to its token)"""
+        with self.lock:
+            if self.running.get(upload_id) is token:
+                del self.running[upload_id]
+
+    def cancel(self, upload_id, reason='cancelled'):
+        """Cancel an upload; returns True if it was running in this process"""
+        with self.lock:
+            token = self.running.get(upload_id)
+            running = token is not None
+            if not running:
+                now = time.time()
+                self.early = {k: v for k, v in self.early.items() if now - v[1] < self.ttl}
+                token = CancellationToken()
+                self.early[upload_id] = (token, now)
+        token.cancel(reason)
+        return running
+
+class CancellableInput:
+    """
+    WSGI input stream that raises TransferCancelled on read once the token is cancelled.
+
+    With a content_length it also catches a client that disconnects mid-body: servers
+    that mark their input as terminated (gunicorn) just return EOF, which the form
+    parser would take for a short, valid body. An early EOF cancels the token with
+    'client disconnected' and raises TransferCancelled instead.
+    """
+
+    def __init__(self, stream, token, content_length=None):
+        self.stream = stream
+        self.token = token
+        self.content_length = content_length
+        self.received = 0
+
+    def _check(self, data, ended):
+        """Count what a read returned and raise if the stream ended before content_length"""
+        self.received += len(data)
+        if ended and self.content_length is not None and self.received < self.content_length:
+            self.token.cancel('client disconnected')
+            raise TransferCancelled(f"client disconnected after {self.received} of "
+                                    f"{self.content_length} bytes")
+        return data
+
+    def read(self, size=-1):
+        self.token.raise_if_cancelled()
+        data = self.stream.read(size)
+        # Reading everything, or getting nothing for a non-empty read, means the stream ended
+        return self._check(data, size is None or size < 0 or (size > 0 and not data))
+
+    def readline(self, size=-1):
+        self.token.raise_if_cancelled()
+        line = self.stream.readline(size)
+        cut = line.endswith(b'\n') or (size is not None and 0 <= size <= len(line))
+        return self._check(line, not cut)
+
+    def readinto(self, buffer):
+        self.token.raise_if_cancelled()
+        count = self.stream.readinto(buffer)
+        self._check(memoryview(buffer)[:count], len(buffer) > 0 and count == 0)
+        return count
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def client_socket(environ):
+    """The client connection of a WSGI request, if the server exposes it (gunicorn, werkzeug)"""
+    return environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+
+def client_disconnected(sock):
+    """
+    Check without blocking whether the client has closed its side of the connection.
+
+    Returns False when the socket can't be checked (SSL sockets raise ValueError on
+    MSG_PEEK), so an unsupported socket never cancels an upload.
+    """
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        # Readable with no data means the peer closed the connection
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except (BlockingIOError, ValueError):
+        return False
+    except OSError:
+        return True
+
+class DisconnectMonitor:
+    """
+    Cancels a token when the client goes away while the server is still uploading.
+
+    After the request body has been read the server no longer reads from the client,
+    so a browser that aborted its request would otherwise go unnoticed until the
+    response is written. Does nothing if the server doesn't expose the socket, or
+    exposes an SSL socket (whose buffered data select() and MSG_PEEK can't see).
+    """
+
+    def __init__(self, environ, token, interval=CANCEL_POLL_INTERVAL):
+        self.sock = client_socket(environ)
+        self.token = token
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            if client_disconnected(self.sock):
+                if self.token.cancel('client disconnected'):
+                    logger.warning("Client disconnected, cancelling upload")
+                return
+
+    def start(self):
+        if self.sock is not None and not isinstance(self.sock, ssl.SSLSocket):
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+def install_sigint_handler(token):
+    """
+    Make Ctrl-C cancel the token instead of killing the process mid-upload.
+
+    The first SIGINT cancels: in-flight parts stop and multipart uploads are aborted
+    cleanly. A second SIGINT raises KeyboardInterrupt as usual.
+    """
+    def handle_sigint(signum, frame):
+        if token.cancel('interrupted (SIGINT)'):
+            logger.warning("Cancelling uploads, press Ctrl-C again to quit immediately")
+            return
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGINT, handle_sigint)
@@ -0,0 +1,288 @@
+import os
+import time
+import random
+import logging
+import threading
+import boto3
+import botocore.config
+import botocore.exceptions
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the latency / error-rate moving averages
+EWMA_ALPHA = 0.2
+# Fraction of calls sent to a random healthy endpoint to keep its stats fresh
+EXPLORE_RATE = 0.05
+# Cooldown after a failure, doubled per consecutive failure up to the cap
+BASE_COOLDOWN = 30
+MAX_COOLDOWN = 600
+
+# Error codes that say something about the endpoint rather than the request
+ENDPOINT_ERROR_CODES = ('RequestTimeout', 'InternalError', 'ServiceUnavailable', 'SlowDown',
+                        'ThrottlingException', 'RequestLimitExceeded')
+
+# Calls whose Body size is used to normalise latency into seconds per MB
+BODY_OPERATIONS = ('upload_part', 'put_object')
+
+# Read timeout (seconds) for BODY_OPERATIONS: a hedged part that lost keeps waiting for
+# its response once its body has been sent, so it must not hold a connection forever
+PART_READ_TIMEOUT = int(os.getenv('PART_READ_TIMEOUT', 300))
+
+# boto3 managed transfers: they consume a stream and retry internally, so they are routed
+# to one endpoint and not failed over (only their outcome is recorded)
+MANAGED_OPERATIONS = ('upload_file', 'upload_fileobj', 'download_file', 'download_fileobj', 'copy')
+
+def is_config_error(e):
+    """Check whether an exception means the endpoint can't serve the bucket at all (acceleration not configured)"""
+    if not isinstance(e, botocore.exceptions.ClientError):
+        return False
+    error = e.response.get('Error', {})
+    return error.get('Code') == 'InvalidRequest' and 'Accelerat' in error.get('Message', '')
+
+def is_endpoint_error(e):
+    """Check whether an exception means the endpoint (not the request) is unhealthy"""
+    if isinstance(e, botocore.exceptions.ClientError):
+        error = e.response.get('Error', {})
+        status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        if status >= 500 or error.get('Code') in ENDPOINT_ERROR_CODES:
+            return True
+        return is_config_error(e)
+
+    return isinstance(e, (botocore.exceptions.ConnectionError,
+                          botocore.exceptions.ConnectTimeoutError,
+                          botocore.exceptions.ReadTimeoutError,
+                          OSError))
+
+class Endpoint:
+    """One S3 endpoint with its clients (part_client is used for BODY_OPERATIONS) and health statistics"""
+
+    def __init__(self, name, url, client, part_client=None):
+        self.name = name
+        self.url = url
+        self.client = client
+        self.part_client = part_client or client
+        self.latency = None          # EWMA seconds per MB of request body
+        self.error_rate = 0.0        # EWMA of failures
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.cooldown_until = 0
+        self.last_error = None
+
+    def is_available(self, now):
+        return now >= self.cooldown_until
+
+    def score(self):
+        """Sort key, lower is better; endpoints without latency samples come after sampled ones"""
+        if self.latency is None:
+            return (1, self.error_rate)
+        return (0, self.latency * (1 + 10 * self.error_rate))
+
+class EndpointPool:
+    """
+    Routes S3 calls to the healthiest of several endpoints.
+
+    Behaves like a boto3 client: ``pool.upload_part(...)`` picks an endpoint per call,
+    records its latency and outcome, and on an endpoint-level error (connection
+    problems, 5xx, throttling, acceleration not configured) immediately retries the
+    same call on the next endpoint. Failing endpoints go into an exponentially growing
+    cooldown and are reconsidered once it expires; an endpoint that isn't configured for
+    the bucket (acceleration off) goes straight to the longest cooldown. Multipart upload
+    IDs are bucket-wide, so parts of one upload can go through different endpoints.
+    """
+
+    def __init__(self, endpoints):
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def candidates(self):
+        """Endpoints in the order they should be tried for the next call"""
+        now = time.time()
+        with self.lock:
+            available = sorted((e for e in self.endpoints if e.is_available(now)), key=Endpoint.score)
+            cooling = sorted((e for e in self.endpoints if not e.is_available(now)),
+                             key=lambda e: e.cooldown_until)
+
+        if len(available) > 1 and random.random() < EXPLORE_RATE:
+            available.insert(0, available.pop(random.randrange(1, len(available))))
+
+        # Endpoints in cooldown are only used when nothing else is left
+        return available + cooling
+
+    def best(self):
+        """The endpoint the next call would go to"""
+        return self.candidates()[0]
+
+    def last_endpoint(self):
+        """The endpoint that served this thread's last successful call (None before the first)"""
+        return getattr(self.local, 'endpoint', None)
+
+    def record(self, endpoint, elapsed, error=None, body_bytes=None):
+        """Update an endpoint's statistics after a call (elapsed=None skips the latency sample)"""
+        with self.lock:
+            endpoint.requests += 1
+            if error is None:
+                if elapsed is not None:
+                    sample = elapsed / max((body_bytes or 0) / (1024 * 1024), 1)
+                    endpoint.latency = sample if endpoint.latency is None else (
+                        EWMA_ALPHA * sample + (1 - EWMA_ALPHA) * endpoint.latency)
+                endpoint.error_rate *= (1 - EWMA_ALPHA)
+                endpoint.consecutive_errors = 0
+                endpoint.cooldown_until = 0
+            else:
+                endpoint.errors += 1
+                endpoint.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * endpoint.error_rate
+                endpoint.consecutive_errors += 1
+                endpoint.last_error = str(error)
+                cooldown = min(BASE_COOLDOWN * 2 ** (endpoint.consecutive_errors - 1), MAX_COOLDOWN)
+                if is_config_error(error):
+                    # Retrying sooner would just fail again
+                    cooldown = MAX_COOLDOWN
+                endpoint.cooldown_until = time.time() + cooldown
+
+    def call(self, operation, *args, **kwargs):
+        """Run a client method on the healthiest endpoint, failing over on endpoint errors"""
+        if operation in MANAGED_OPERATIONS:
+            endpoint = self.best()
+            try:
+                result = getattr(endpoint.client, operation)(*args, **kwargs)
+            except Exception as e:
+                if is_endpoint_error(e):
+                    self.record(endpoint, None, error=e)
+                raise
+            self.record(endpoint, None)
+            self.local.endpoint = endpoint
+            return result
+
+        body = kwargs.get('Body') if operation in BODY_OPERATIONS else None
+        # bytes, or a sized stream such as hedging's CancellableBody
+        body_bytes = len(body) if hasattr(body, '__len__') else None
+        last_error = None
+
+        for endpoint in self.candidates():
+            client = endpoint.part_client if operation in BODY_OPERATIONS else endpoint.client
+            start = time.time()
+            try:
+                result = getattr(client, operation)(*args, **kwargs)
+            except Exception as e:
+                if not is_endpoint_error(e):
+                    raise
+                self.record(endpoint, time.time() - start, error=e)
+                logger.warning(f"{operation} failed on {endpoint.name} endpoint ({str(e)}), failing over")
+                last_error = e
+                if hasattr(body, 'seek'):
+                    body.seek(0)
+                continue
+
+            # Only calls that carry a body give comparable latency samples (seconds per MB)
+            self.record(endpoint, time.time() - start if body_bytes else None, body_bytes=body_bytes)
+            self.local.endpoint = endpoint
+            return result
+
+        raise last_error
+
+    def health(self):
+        """Per-endpoint health snapshot for monitoring"""
+        now = time.time()
+        with self.lock:
+            return [{
+                'name': e.name,
+                'url': e.url,
+                'available': e.is_available(now),
+                'cooldown_seconds': max(0, round(e.cooldown_until - now, 1)),
+                'latency': round(e.latency, 4) if e.latency is not None else None,
+                'error_rate': round(e.error_rate, 4),
+                'requests': e.requests,
+                'errors': e.errors,
+                'last_error': e.last_error,
+            } for e in self.endpoints]
+
+    def __getattr__(self, name):
+        # Proxy client methods through call(); plain attributes (e.g. meta) come from the best client
+        if name.startswith('_') or name in ('endpoints', 'local'):
+            raise AttributeError(name)
+        attr = getattr(self.endpoints[0].client, name)
+        if not callable(attr):
+            return getattr(self.best().client, name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+def create_endpoint_pool(bucket, region, key, secret, standard_endpoint, use_acceleration,
+                         config, extra_endpoints=None):
+    """
+    Build an EndpointPool for a bucket.
+
+    The standard endpoint is always included; the S3 Transfer Acceleration endpoint is
+    added when use_acceleration is set, and starts in cooldown if acceleration can't be
+    enabled on the bucket (so it is retried later instead of being dropped for good).
+
+    Args:
+        bucket: Bucket name
+        region: Region name
+        key: Access key
+        secret: Secret key
+        standard_endpoint: Regular endpoint URL
+        use_acceleration: Whether to add the acceleration endpoint
+        config: botocore Config shared by all clients (BODY_OPERATIONS use it with the
+            read timeout capped at PART_READ_TIMEOUT)
+        extra_endpoints: Optional list of additional endpoint URLs
+
+    Returns:
+        EndpointPool
+    """
+    part_config = config.merge(botocore.config.Config(
+        read_timeout=min(config.read_timeout, PART_READ_TIMEOUT)))
+
+    def make_client(url, client_config=config):
+        return boto3.client('s3',
+                            region_name=region,
+                            endpoint_url=url,
+                            aws_access_key_id=key,
+                            aws_secret_access_key=secret,
+                            config=client_config)
+
+    def make_endpoint(name, url):
+        return Endpoint(name, url, make_client(url), make_client(url, part_config))
+
+    endpoints = []
+    accelerated = None
+    if use_acceleration:
+        url = f'https://{bucket}.s3-accelerate.amazonaws.com'
+        accelerated = make_endpoint('accelerated', url)
+        endpoints.append(accelerated)
+        logger.info(f"Using S3 Transfer Acceleration endpoint: {url}")
+
+    endpoints.append(make_endpoint('standard', standard_endpoint))
+    logger.info(f"Using standard S3 endpoint: {standard_endpoint}")
+
+    for index, url in enumerate(extra_endpoints or []):
+        endpoints.append(make_endpoint(f'extra-{index + 1}', url))
+        logger.info(f"Using additional S3 endpoint: {url}")
+
+    pool = EndpointPool(endpoints)
+
+    # Enable transfer acceleration on the bucket if needed
+    if accelerated:
+        start = time.time()
+        try:
+            logger.info(f"Checking Transfer Acceleration status for bucket: {bucket}")
+            acceleration_status = accelerated.client.get_bucket_accelerate_configuration(Bucket=bucket)
+            current_status = acceleration_status.get('Status', 'None')
+
+            if current_status != 'Enabled':
+                logger.info(f"Enabling Transfer Acceleration for bucket: {bucket}")
+                accelerated.client.put_bucket_accelerate_configuration(
+                    Bucket=bucket,
+                    AccelerateConfiguration={'Status': 'Enabled'}
+                )
+                logger.info("Transfer Acceleration enabled successfully")
+            else:
+                logger.info("Transfer Acceleration already enabled")
+        except Exception as e:
+            logger.warning(f"Could not enable Transfer Acceleration: {str(e)}")
+            logger.warning("Standard endpoint will be preferred until the accelerated endpoint recovers")
+            pool.record(accelerated, time.time() - start, error=e)
+
+    return pool
@@ -0,0 +1,148 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+logger = logging.getLogger(__name__)
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+def iter_files(root):
+    """Yield every non-hidden file under root (same rule as upload_directory)"""
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if not name.startswith('.'):
+                yield os.path.join(dirpath, name)
+
+class PollingWatcher:
+    """Fallback watcher that reports every file under the roots on each poll"""
+
+    def __init__(self, roots, interval=10.0):
+        self.roots = roots
+        self.interval = interval
+        self.next_poll = 0
+
+    def wait(self, timeout):
+        """Return the files that may have changed, waiting at most timeout seconds"""
+        now = time.monotonic()
+        if now < self.next_poll:
+            time.sleep(min(timeout, self.next_poll - now))
+            return []
+
+        self.next_poll = now + self.interval
+        return [path for root in self.roots for path in iter_files(root)]
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """Linux inotify watcher (via libc) covering every directory under the roots"""
+
+    def __init__(self, roots):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError(errno.ENOSYS, "libc not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify not available")
+
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.roots = roots
+        self.watches = {}  # watch descriptor -> directory
+        self.pending = []  # paths found while adding watches
+        for root in roots:
+            self._add_tree(root)
+
+    def _add_watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            logger.warning(f"Could not watch {directory}: {os.strerror(ctypes.get_errno())}")
+            return
+        self.watches[wd] = directory
+
+    def _add_tree(self, root):
+        """Watch a directory tree and queue the files already in it (they may predate the watch)"""
+        for dirpath, _, files in os.walk(root):
+            self._add_watch(dirpath)
+            self.pending.extend(os.path.join(dirpath, name) for name in files if not name.startswith('.'))
+
+    def wait(self, timeout):
+        """Return the files that changed, waiting at most timeout seconds"""
+        changed, self.pending = self.pending, []
+        if changed:
+            return changed
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped; rescan everything
+                logger.warning("inotify queue overflowed, rescanning watched directories")
+                changed.extend(path for root in self.roots for path in iter_files(root))
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+
+            directory = self.watches.get(wd)
+            if directory is None or not name or name.startswith('.'):
+                continue
+
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path)
+            else:
+                changed.append(path)
+
+        changed.extend(self.pending)
+        self.pending = []
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+def create_watcher(roots, poll_interval=10.0, force_polling=False):
+    """Create an inotify watcher for the roots, falling back to polling where unavailable"""
+    if not force_polling:
+        try:
+            watcher = InotifyWatcher(roots)
+            logger.info("Watching for new files with inotify")
+            return watcher
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify unavailable ({str(e)}), falling back to polling")
+
+    logger.info(f"Watching for new files by polling every {poll_interval:.0f} seconds")
+    return PollingWatcher(roots, poll_interval)
@@ -0,0 +1,247 @@
+import os
+import io
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from cancellation import TransferCancelled, CANCEL_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Hedging settings, overridable through environment variables
+HEDGING_ENABLED = os.getenv('HEDGE_PARTS', 'True').lower() in ('true', 'yes', '1')
+HEDGE_MULTIPLIER = float(os.getenv('HEDGE_MULTIPLIER', 3.0))  # Hedge after this many times the p95
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', 5))  # Completed parts needed before hedging
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 2.0))  # Never hedge sooner than this (seconds)
+HEDGE_MAX_EXTRA = float(os.getenv('HEDGE_MAX_EXTRA', 0.1))  # Hedged bytes as a fraction of all part bytes
+HEDGE_MIN_PER_TRANSFER = int(os.getenv('HEDGE_MIN_PER_TRANSFER', 1))  # Hedges per transfer allowed outside the budget
+
+# Protects the stats dicts passed to hedged_upload_part (parts may run in parallel)
+_stats_lock = threading.Lock()
+
+def _count(stats, key):
+    if stats is not None:
+        with _stats_lock:
+            stats[key] = stats.get(key, 0) + 1
+
+class CancellableBody(io.RawIOBase):
+    """
+    Read-only request body over an in-memory part that can be cancelled mid-send.
+
+    botocore streams file-like bodies in small blocks, so once cancel() is called (or
+    the transfer's CancellationToken is cancelled) the next read raises
+    TransferCancelled and the request (and its connection) is dropped.
+    """
+
+    def __init__(self, data, cancel_event=None, token=None):
+        self.data = memoryview(data)
+        self.position = 0
+        self.cancel_event = cancel_event or threading.Event()
+        self.token = token
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def __len__(self):
+        return len(self.data)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = len(self.data) + offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        if self.cancel_event.is_set():
+            raise TransferCancelled("Request body cancelled")
+        if self.token is not None:
+            self.token.raise_if_cancelled()
+        end = len(self.data) if size is None or size < 0 else min(len(self.data), self.position + size)
+        chunk = self.data[self.position:end].tobytes()
+        self.position = end
+        return chunk
+
+    def readinto(self, buffer):
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+class PartLatencyTracker:
+    """Sliding window of part upload times (seconds per MB) used to spot stragglers"""
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds, nbytes):
+        with self.lock:
+            self.samples.append(seconds / max(nbytes / (1024 * 1024), 1))
+
+    def p95(self):
+        with self.lock:
+            if len(self.samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def hedge_after(self, nbytes):
+        """Seconds after which a part of this size counts as a straggler (None until enough samples)"""
+        p95 = self.p95()
+        if p95 is None:
+            return None
+        return max(HEDGE_MIN_DELAY, HEDGE_MULTIPLIER * p95 * max(nbytes / (1024 * 1024), 1))
+
+class HedgeBudget:
+    """Caps hedged (duplicate) bytes at a fraction of all part bytes sent"""
+
+    def __init__(self, max_extra=HEDGE_MAX_EXTRA):
+        self.max_extra = max_extra
+        self.sent = 0
+        self.hedged = 0
+        self.lock = threading.Lock()
+
+    def add_sent(self, nbytes):
+        with self.lock:
+            self.sent += nbytes
+
+    def available(self, nbytes):
+        """Check whether a hedge of nbytes currently fits in the budget (without reserving it)"""
+        with self.lock:
+            return self.hedged + nbytes <= self.max_extra * self.sent
+
+    def try_acquire(self, nbytes, force=False):
+        """Reserve budget for a hedge of nbytes; returns False if it would exceed the cap (unless forced)"""
+        with self.lock:
+            if not force and self.hedged + nbytes > self.max_extra * self.sent:
+                return False
+            self.hedged += nbytes
+            return True
+
+def _free_hedge(stats):
+    """Whether a transfer still has hedges that don't need budget (stats=None has none)"""
+    return stats is not None and stats.get('hedged_parts', 0) < HEDGE_MIN_PER_TRANSFER
+
+def _acquire_hedge(budget, nbytes, stats):
+    """
+    Reserve a hedge of nbytes and count it in stats. The first HEDGE_MIN_PER_TRANSFER
+    hedges of a transfer are always allowed (the budget is empty until enough bytes have
+    been sent); later ones need budget.
+    """
+    with _stats_lock:
+        if not budget.try_acquire(nbytes, force=_free_hedge(stats)):
+            return False
+        if stats is not None:
+            stats['hedged_parts'] = stats.get('hedged_parts', 0) + 1
+        return True
+
+def _run_in_thread(func, *args, **kwargs):
+    """Run func in its own daemon thread and return a Future for the result"""
+    future = Future()
+
+    def runner():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=runner, daemon=True).start()
+    return future
+
+def _wait_first(futures, timeout, bodies, token):
+    """
+    wait(FIRST_COMPLETED) that gives up once the token is cancelled: every request's
+    body is cancelled and TransferCancelled is raised without waiting for them.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        step = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if token is not None:
+            step = CANCEL_POLL_INTERVAL if step is None else min(step, CANCEL_POLL_INTERVAL)
+
+        done, pending = wait(futures, timeout=step, return_when=FIRST_COMPLETED)
+        if done or (deadline is not None and time.monotonic() >= deadline):
+            return done, pending
+        if token is not None and token.cancelled:
+            for body in bodies.values():
+                body.cancel()
+            raise TransferCancelled(token.reason)
+
+def hedged_upload_part(upload_part, tracker, budget, Body, stats=None, token=None, **kwargs):
+    """
+    Upload one part, sending a duplicate request if it turns into a straggler.
+
+    Once the part has been in flight longer than HEDGE_MULTIPLIER times the running p95
+    (scaled to its size), the same part number is sent again on another connection. The
+    first request to succeed wins and the other one is cancelled. S3 keeps whichever
+    copy of a part number arrived last, and both copies have identical content, so
+    either ETag is valid. When no hedge is possible (too few samples, no budget left)
+    the part is uploaded inline, without a thread.
+
+    Args:
+        upload_part: Client method to call (e.g. s3.upload_part)
+        tracker: PartLatencyTracker with recent part times
+        budget: HedgeBudget limiting duplicate bytes
+        Body: Part data (bytes)
+        stats: Optional dict; 'hedged_parts' and 'hedge_wins' counters are incremented
+        token: Optional CancellationToken; cancelling it stops every request of the part
+        **kwargs: Remaining upload_part arguments
+
+    Returns:
+        The upload_part response of the winning request
+    """
+    nbytes = len(Body)
+    budget.add_sent(nbytes)
+
+    primary_body = CancellableBody(Body, token=token)
+    hedge_after = tracker.hedge_after(nbytes) if HEDGING_ENABLED else None
+    if hedge_after is None or not (_free_hedge(stats) or budget.available(nbytes)):
+        start = time.monotonic()
+        response = upload_part(Body=primary_body, **kwargs)
+        tracker.record(time.monotonic() - start, nbytes)
+        return response
+
+    primary = _run_in_thread(upload_part, Body=primary_body, **kwargs)
+    bodies = {primary: primary_body}
+    started = {primary: time.monotonic()}
+
+    done, _ = _wait_first([primary], hedge_after, bodies, token)
+    if not done and _acquire_hedge(budget, nbytes, stats):
+        logger.info(f"Part {kwargs.get('PartNumber')} of {kwargs.get('Key')} still running after "
+                    f"{hedge_after:.1f}s, sending a hedged request")
+        hedge_body = CancellableBody(Body, token=token)
+        hedge = _run_in_thread(upload_part, Body=hedge_body, **kwargs)
+        bodies[hedge] = hedge_body
+        started[hedge] = time.monotonic()
+
+    pending = set(bodies)
+    while pending:
+        done, pending = _wait_first(pending, None, bodies, token)
+        for future in done:
+            if future.exception() is not None:
+                continue
+
+            # First success wins; the other request is aborted at its next body read, or by
+            # the part clients' read timeout if its body has already been sent
+            for loser in pending:
+                bodies[loser].cancel()
+            tracker.record(time.monotonic() - started[future], nbytes)
+            if future is not primary:
+                _count(stats, 'hedge_wins')
+            return future.result()
+
+    raise primary.exception()
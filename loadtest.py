@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+Load-test the web upload endpoint with many concurrent browser-style clients.
+
+Starts a local S3 stand-in and a gunicorn instance serving app:app against it, then runs
+N clients that each log in through /login and POST files to /api/upload as multipart
+form data (file + filepath), the same way static/app.js does. Reports requests/s,
+latency percentiles, errors, the RSS of the gunicorn processes and the disk used in
+UPLOAD_TEMP_DIR while the test runs.
+
+Usage:
+    python loadtest.py --clients 8 --sizes 1MB,50MB,200MB --uploads-per-client 5
+    python loadtest.py --clients 4 --duration 60 --server-threads 4 --latency-ms 40 --connection-mbps 100
+    python loadtest.py --url http://localhost:5000 --server-pid 1234   # an already running server
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import signal
+import socket
+import shutil
+import argparse
+import logging
+import tempfile
+import threading
+import subprocess
+import requests
+from s3_standin import start_standin, add_simulation_args, simulation_kwargs
+
+logger = logging.getLogger(__name__)
+
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+# Block size used when streaming a generated file into the request body
+BODY_BLOCK = 1024 * 1024
+
+def parse_size(text):
+    """Parse a size like 512KB, 50MB or 1GB into bytes"""
+    text = text.strip().upper()
+    for unit in sorted(SIZE_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(text)
+
+def format_size(size_bytes):
+    """Format bytes into a human-readable form"""
+    units = ['B', 'KB', 'MB', 'GB', 'TB']
+    unit_index = 0
+    size = float(size_bytes)
+
+    while size >= 1024 and unit_index < len(units) - 1:
+        size /= 1024
+        unit_index += 1
+
+    return f"{size:.2f} {units[unit_index]}"
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (None if empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct * len(ordered) / 100.0) - 1))
+    return ordered[index]
+
+class MultipartBody:
+    """
+    Streaming multipart/form-data body with a 'filepath' field and a generated 'file'.
+
+    The file content is produced block by block, so many clients can send large
+    uploads without the load generator holding them in memory. len() gives the exact
+    body size, so requests sends a Content-Length header like a browser would.
+    """
+
+    def __init__(self, filename, filepath, size):
+        self.boundary = f"----loadtest{uuid.uuid4().hex}"
+        self.head = (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="filepath"\r\n\r\n'
+            f'{filepath}\r\n'
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode()
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode()
+        self.size = size
+        self.block = os.urandom(min(size, BODY_BLOCK)) if size else b''
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return len(self.head) + self.size + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        remaining = self.size
+        while remaining > 0:
+            chunk = self.block[:remaining]
+            remaining -= len(chunk)
+            yield chunk
+        yield self.tail
+
+class Results:
+    """Thread-safe collection of per-request outcomes"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.uploads = []   # (latency seconds, bytes, ok, error kind or None)
+        self.logins = []    # (latency seconds, ok)
+
+    def add_upload(self, latency, nbytes, error=None):
+        with self.lock:
+            self.uploads.append((latency, nbytes, error is None, error))
+
+    def add_login(self, latency, ok):
+        with self.lock:
+            self.logins.append((latency, ok))
+
+class ResourceSampler(threading.Thread):
+    """Periodically samples server RSS and temp-dir disk usage, keeping peaks"""
+
+    def __init__(self, server_pid, temp_dir, interval=0.5):
+        super().__init__(daemon=True)
+        self.server_pid = server_pid
+        self.temp_dir = temp_dir
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.peak_rss = 0
+        self.peak_worker_rss = {}
+        self.peak_temp_bytes = 0
+        self.peak_temp_files = 0
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.sample()
+            self.stop_event.wait(self.interval)
+
+    def sample(self):
+        pids = [self.server_pid] + child_pids(self.server_pid) if self.server_pid else []
+        if pids:
+            rss = {pid: process_rss(pid) for pid in pids}
+            self.peak_rss = max(self.peak_rss, sum(rss.values()))
+            for pid, value in rss.items():
+                if pid != self.server_pid:
+                    self.peak_worker_rss[pid] = max(self.peak_worker_rss.get(pid, 0), value)
+
+        if self.temp_dir:
+            used, files = disk_usage(self.temp_dir, pids)
+            self.peak_temp_bytes = max(self.peak_temp_bytes, used)
+            self.peak_temp_files = max(self.peak_temp_files, files)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        self.sample()
+
+def process_rss(pid):
+    """Resident set size of a process in bytes (0 if it is gone or /proc is unavailable)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def child_pids(pid):
+    """Direct children of a process (gunicorn workers of the master)"""
+    children = []
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return children
+
+def disk_usage(path, pids=()):
+    """
+    Bytes actually allocated on disk and number of files under a directory.
+
+    Spooled request bodies are anonymous temp files (unlinked as soon as they are
+    created), so files the given processes hold open under the directory are counted
+    too, through /proc/<pid>/fd.
+    """
+    seen = {}
+    path = os.path.abspath(path)
+
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue  # Removed while walking
+            seen[(st.st_dev, st.st_ino)] = st.st_blocks * 512
+
+    for pid in pids:
+        fd_dir = f'/proc/{pid}/fd'
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                if not os.readlink(f'{fd_dir}/{fd}').startswith(path + os.sep):
+                    continue
+                st = os.stat(f'{fd_dir}/{fd}')
+            except OSError:
+                continue  # Closed while scanning
+            seen[(st.st_dev, st.st_ino)] = st.st_blocks * 512
+
+    return sum(seen.values()), len(seen)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(args, endpoint_url, temp_dir):
+    """Start gunicorn serving app:app against the stand-in and wait until it answers"""
+    port = free_port()
+    env = dict(os.environ,
+               DO_SPACES_KEY='loadtest',
+               DO_SPACES_SECRET='loadtest',
+               DO_SPACES_BUCKET='loadtest',
+               DO_SPACES_REGION='us-east-1',
+               DO_SPACES_ENDPOINT=endpoint_url,
+               USE_ACCELERATION='false',
+               APP_PASSWORD=args.password,
+               UPLOAD_TEMP_DIR=temp_dir)
+
+    command = [sys.executable, '-m', 'gunicorn',
+               '--bind', f'127.0.0.1:{port}',
+               '--workers', str(args.server_workers),
+               '--threads', str(args.server_threads),
+               '--timeout', str(args.server_timeout),
+               '--log-level', 'warning',
+               'app:app']
+    logger.info(f"Starting: {' '.join(command[2:])}")
+    process = subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            requests.get(f'{url}/api/health', timeout=2)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError("gunicorn did not start within 60 seconds")
+
+def login(session, url, password, results):
+    """Log in like the browser login form; returns True on success"""
+    start = time.time()
+    try:
+        response = session.post(f'{url}/login', data={'password': password},
+                                allow_redirects=False, timeout=60)
+        ok = response.status_code in (302, 303) and 'session' in session.cookies
+    except requests.RequestException:
+        ok = False
+    results.add_login(time.time() - start, ok)
+    return ok
+
+def upload(session, url, client_id, sequence, size, prefix, timeout):
+    """POST one generated file to /api/upload; returns None on success or an error kind"""
+    filename = f'file_{client_id}_{sequence}.bin'
+    body = MultipartBody(filename, f'{prefix}client_{client_id}/{filename}', size)
+    try:
+        response = session.post(f'{url}/api/upload', data=body, timeout=timeout,
+                                headers={'Content-Type': body.content_type})
+    except requests.Timeout:
+        return 'timeout'
+    except requests.RequestException as e:
+        return f'connection: {type(e).__name__}'
+
+    if response.status_code != 200:
+        return f'http {response.status_code}'
+    try:
+        if not response.json().get('success'):
+            return 'success=false'
+    except ValueError:
+        return 'invalid json'
+    return None
+
+def run_client(client_id, args, url, sizes, results, deadline):
+    """One simulated browser: log in, then upload files until done"""
+    session = requests.Session()
+    rng = random.Random(args.seed + client_id)
+    if not login(session, url, args.password, results):
+        return
+
+    sequence = 0
+    while True:
+        if args.duration:
+            if time.time() >= deadline:
+                break
+        elif sequence >= args.uploads_per_client:
+            break
+
+        size = rng.choice(sizes)
+        start = time.time()
+        error = upload(session, url, client_id, sequence, size, args.prefix, args.request_timeout)
+        results.add_upload(time.time() - start, size, error)
+
+        # Like app.js, log in again when the session has expired
+        if error == 'http 401':
+            login(session, url, args.password, results)
+        sequence += 1
+
+def build_report(results, elapsed, sampler, args, sizes):
+    """Summarise the run as a dict (also written with --json)"""
+    latencies = [u[0] for u in results.uploads]
+    ok = [u for u in results.uploads if u[2]]
+    errors = {}
+    for u in results.uploads:
+        if not u[2]:
+            errors[u[3]] = errors.get(u[3], 0) + 1
+
+    def rounded(value):
+        return round(value, 3) if value is not None else None
+
+    return {
+        'clients': args.clients,
+        'sizes': sizes,
+        'server_workers': args.server_workers,
+        'server_threads': args.server_threads,
+        'elapsed_seconds': round(elapsed, 3),
+        'requests': len(results.uploads),
+        'succeeded': len(ok),
+        'requests_per_second': round(len(results.uploads) / elapsed, 3) if elapsed else 0,
+        'throughput_bytes_per_second': round(sum(u[1] for u in ok) / elapsed) if elapsed else 0,
+        'latency_p50': rounded(percentile(latencies, 50)),
+        'latency_p95': rounded(percentile(latencies, 95)),
+        'latency_p99': rounded(percentile(latencies, 99)),
+        'latency_max': rounded(max(latencies) if latencies else None),
+        'error_rate': round(1 - len(ok) / len(results.uploads), 4) if results.uploads else 0,
+        'errors': errors,
+        'logins': len(results.logins),
+        'login_failures': sum(1 for l in results.logins if not l[1]),
+        'login_p95': rounded(percentile([l[0] for l in results.logins], 95)),
+        'peak_server_rss_bytes': sampler.peak_rss,
+        'peak_worker_rss_bytes': max(sampler.peak_worker_rss.values(), default=0),
+        'peak_temp_bytes': sampler.peak_temp_bytes,
+        'peak_temp_files': sampler.peak_temp_files,
+    }
+
+def log_report(report, leftover):
+    """Print the load-test summary"""
+    def seconds(value):
+        return f"{value:.2f}s" if value is not None else 'n/a'
+
+    logger.info("=" * 50)
+    logger.info("LOAD TEST SUMMARY")
+    logger.info("=" * 50)
+    logger.info(f"Clients: {report['clients']} | server: {report['server_workers']} worker(s) x "
+                f"{report['server_threads']} thread(s)")
+    logger.info(f"Uploads: {report['requests']} in {report['elapsed_seconds']:.1f}s "
+                f"({report['requests_per_second']:.2f} req/s, "
+                f"{format_size(report['throughput_bytes_per_second'])}/s)")
+    logger.info(f"Latency: p50 {seconds(report['latency_p50'])} | p95 {seconds(report['latency_p95'])} | "
+                f"p99 {seconds(report['latency_p99'])} | max {seconds(report['latency_max'])}")
+    logger.info(f"Errors: {report['requests'] - report['succeeded']} ({report['error_rate'] * 100:.1f}%)")
+    for kind, count in sorted(report['errors'].items(), key=lambda item: -item[1]):
+        logger.info(f"  {kind}: {count}")
+    logger.info(f"Logins: {report['logins']} ({report['login_failures']} failed, p95 {seconds(report['login_p95'])})")
+    logger.info(f"Peak RSS: {format_size(report['peak_server_rss_bytes'])} total, "
+                f"{format_size(report['peak_worker_rss_bytes'])} largest worker")
+    logger.info(f"Peak temp disk: {format_size(report['peak_temp_bytes'])} in {report['peak_temp_files']} files")
+    if leftover is not None:
+        logger.info(f"Temp files left after the run: {leftover[1]} ({format_size(leftover[0])})")
+    logger.info("=" * 50)
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test /api/upload with concurrent browser-style clients')
+    parser.add_argument('--clients', type=int, default=4, help='Number of concurrent clients')
+    parser.add_argument('--sizes', default='1MB,20MB,120MB',
+                        help='Comma-separated upload sizes; each upload picks one at random')
+    parser.add_argument('--uploads-per-client', type=int, default=5, help='Uploads per client (ignored with --duration)')
+    parser.add_argument('--duration', type=float, default=None, help='Keep uploading for this many seconds')
+    parser.add_argument('--request-timeout', type=float, default=3600, help='Per-upload client timeout (seconds)')
+    parser.add_argument('--password', default=os.getenv('APP_PASSWORD', 'upload123'), help='App password')
+    parser.add_argument('--prefix', default='_loadtest/', help='Key prefix for uploaded objects')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for size selection')
+    parser.add_argument('--server-workers', type=int, default=1, help='gunicorn workers')
+    parser.add_argument('--server-threads', type=int, default=1, help='gunicorn threads per worker')
+    parser.add_argument('--server-timeout', type=int, default=0, help='gunicorn worker timeout (0 = none)')
+    parser.add_argument('--temp-dir', default=None,
+                        help='UPLOAD_TEMP_DIR for the server (a fresh directory by default)')
+    parser.add_argument('--url', default=None, help='Test an already running server instead of starting one')
+    parser.add_argument('--server-pid', type=int, default=None, help='gunicorn master PID for RSS sampling with --url')
+    parser.add_argument('--json', default=None, help='Also write the report as JSON to this path')
+    parser.add_argument('--max-p95', type=float, default=None, help='Exit non-zero if p95 latency exceeds this (seconds)')
+    parser.add_argument('--max-error-rate', type=float, default=None, help='Exit non-zero if the error rate exceeds this')
+    add_simulation_args(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    temp_dir = args.temp_dir
+    created_temp_dir = False
+    if not temp_dir and not args.url:
+        temp_dir = tempfile.mkdtemp(prefix='loadtest_spool_')
+        created_temp_dir = True
+    elif temp_dir:
+        os.makedirs(temp_dir, exist_ok=True)
+
+    standin = None
+    process = None
+    server_pid = args.server_pid
+    url = args.url
+    try:
+        if not url:
+            standin, endpoint_url = start_standin(**simulation_kwargs(args))
+            logger.info(f"S3 stand-in listening on {endpoint_url}")
+            process, url = start_server(args, endpoint_url, temp_dir)
+            server_pid = process.pid
+
+        logger.info(f"Running {args.clients} clients against {url} with sizes "
+                    f"{', '.join(format_size(size) for size in sizes)}")
+
+        sampler = ResourceSampler(server_pid, temp_dir)
+        sampler.start()
+        results = Results()
+        start = time.time()
+        deadline = start + (args.duration or 0)
+        threads = [threading.Thread(target=run_client, args=(i, args, url, sizes, results, deadline))
+                   for i in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        sampler.stop()
+    finally:
+        if process:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if standin:
+            standin.shutdown()
+
+    report = build_report(results, elapsed, sampler, args, sizes)
+    leftover = disk_usage(temp_dir) if temp_dir else None
+    if leftover is not None:
+        report['temp_bytes_after'], report['temp_files_after'] = leftover
+    log_report(report, leftover)
+
+    if created_temp_dir:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.json}")
+
+    failed = False
+    if args.max_p95 is not None and (report['latency_p95'] or 0) > args.max_p95:
+        logger.error(f"p95 latency {report['latency_p95']}s exceeds {args.max_p95}s")
+        failed = True
+    if args.max_error_rate is not None and report['error_rate'] > args.max_error_rate:
+        logger.error(f"Error rate {report['error_rate']} exceeds {args.max_error_rate}")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
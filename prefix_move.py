@@ -0,0 +1,409 @@
+import os
+import json
+import math
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Objects above this size are copied with parallel UploadPartCopy instead of CopyObject
+COPY_MULTIPART_THRESHOLD = int(os.getenv('COPY_MULTIPART_THRESHOLD', 256 * MB))
+# Part size for UploadPartCopy (raised automatically to stay under the 10,000 part limit)
+COPY_PART_SIZE = int(os.getenv('COPY_PART_SIZE', 256 * MB))
+COPY_CONCURRENCY = int(os.getenv('COPY_CONCURRENCY', 16))  # Objects copied at the same time
+COPY_PART_CONCURRENCY = int(os.getenv('COPY_PART_CONCURRENCY', 8))  # Parts per large object
+
+MAX_PARTS = 10000
+MAX_COPY_PART_SIZE = 5 * 1024 * MB  # S3 limit for one UploadPartCopy range
+DELETE_BATCH = 1000  # Keys per DeleteObjects request
+
+# User metadata key holding the source ETag on copies whose own ETag differs from the
+# source's (multipart copies, copies of multipart objects), so a re-run can recognise them
+SOURCE_ETAG_METADATA = 'source-etag'
+
+def _direct(func, *args, max_retries=None, initial_backoff=None, **kwargs):
+    """Default retry hook: call once and let botocore's own retries handle transient errors"""
+    return func(*args, **kwargs)
+
+def normalize_prefix(prefix):
+    """Strip leading slashes and make sure the prefix ends with exactly one '/'"""
+    prefix = (prefix or '').strip().lstrip('/')
+    return prefix.rstrip('/') + '/' if prefix else ''
+
+def check_prefixes(source, destination):
+    """
+    Validate a source/destination prefix pair.
+
+    Returns:
+        (source, destination) normalized, or raises ValueError
+    """
+    source = normalize_prefix(source)
+    destination = normalize_prefix(destination)
+    if not source or not destination:
+        raise ValueError("Both a source and a destination prefix are required")
+    if source == destination:
+        raise ValueError("Source and destination are the same prefix")
+    if destination.startswith(source) or source.startswith(destination):
+        raise ValueError("Source and destination prefixes must not contain each other")
+    return source, destination
+
+def list_prefix(s3, bucket, prefix):
+    """Return {key: (size, etag)} for every object under a prefix (paginated ListObjectsV2)"""
+    objects = {}
+    kwargs = {'Bucket': bucket, 'Prefix': prefix, 'MaxKeys': 1000}
+
+    while True:
+        response = s3.list_objects_v2(**kwargs)
+        for obj in response.get('Contents', []):
+            objects[obj['Key']] = (obj['Size'], obj.get('ETag'))
+        if not response.get('IsTruncated'):
+            return objects
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+def is_copy_of(s3, bucket, source, target_key, target, retry=_direct):
+    """
+    Check whether an existing destination object already is a copy of a source object.
+
+    Args:
+        source: (size, etag) of the source object
+        target_key: Destination key
+        target: (size, etag) of the destination object
+
+    Returns:
+        True if sizes match and either the ETags match or the destination's source-etag
+        metadata names the source's ETag
+    """
+    if source[0] != target[0]:
+        return False
+    if source[1] and source[1] == target[1]:
+        return True
+    head = retry(s3.head_object, Bucket=bucket, Key=target_key, max_retries=5, initial_backoff=1)
+    return bool(source[1]) and head.get('Metadata', {}).get(SOURCE_ETAG_METADATA) == source[1]
+
+def copy_part_size(size, part_size=COPY_PART_SIZE):
+    """Part size for a multipart copy of an object of the given size"""
+    return min(max(part_size, math.ceil(size / MAX_PARTS)), MAX_COPY_PART_SIZE)
+
+def copy_large_object(s3, bucket, source_key, destination_key, size, part_size=COPY_PART_SIZE,
+                      part_concurrency=COPY_PART_CONCURRENCY, retry=_direct):
+    """
+    Copy one object server-side with parallel UploadPartCopy requests.
+
+    Content type and user metadata are carried over (CopyObject does that by itself,
+    a multipart copy does not), plus the source ETag as source-etag metadata. The
+    multipart upload is aborted if any part fails.
+
+    Returns:
+        Number of parts copied
+    """
+    head = retry(s3.head_object, Bucket=bucket, Key=source_key, max_retries=5, initial_backoff=1)
+    metadata = dict(head.get('Metadata', {}), **{SOURCE_ETAG_METADATA: head['ETag']})
+    create_args = {'Bucket': bucket, 'Key': destination_key, 'Metadata': metadata}
+    if head.get('ContentType'):
+        create_args['ContentType'] = head['ContentType']
+
+    mpu = retry(s3.create_multipart_upload, **create_args, max_retries=10, initial_backoff=2)
+    upload_id = mpu['UploadId']
+    part_size = copy_part_size(size, part_size)
+    ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+    def copy_part(part_number, first, last):
+        response = retry(
+            s3.upload_part_copy,
+            Bucket=bucket,
+            Key=destination_key,
+            CopySource={'Bucket': bucket, 'Key': source_key},
+            CopySourceRange=f'bytes={first}-{last}',
+            PartNumber=part_number,
+            UploadId=upload_id,
+            max_retries=10,
+            initial_backoff=2
+        )
+        return {'PartNumber': part_number, 'ETag': response['CopyPartResult']['ETag']}
+
+    executor = ThreadPoolExecutor(max_workers=part_concurrency)
+    try:
+        futures = [executor.submit(copy_part, number, first, last)
+                   for number, (first, last) in enumerate(ranges, start=1)]
+        parts = [future.result() for future in futures]
+        executor.shutdown()
+
+        retry(s3.complete_multipart_upload, Bucket=bucket, Key=destination_key, UploadId=upload_id,
+              MultipartUpload={'Parts': parts}, max_retries=10, initial_backoff=2)
+    except BaseException:
+        # Don't start the remaining parts, then drop the ones already copied
+        executor.shutdown(cancel_futures=True)
+        try:
+            s3.abort_multipart_upload(Bucket=bucket, Key=destination_key, UploadId=upload_id)
+        except Exception as abort_error:
+            logger.error(f"Failed to abort multipart copy to {destination_key}: {str(abort_error)}")
+        raise
+
+    return len(parts)
+
+def copy_object(s3, bucket, source_key, destination_key, size, threshold=COPY_MULTIPART_THRESHOLD,
+                part_size=COPY_PART_SIZE, part_concurrency=COPY_PART_CONCURRENCY, retry=_direct,
+                etag=None):
+    """
+    Copy one object server-side: CopyObject when small, parallel UploadPartCopy when large.
+
+    A CopyObject of a multipart object (etag ending in -N) gets a new ETag, so its
+    metadata is replaced with the source's plus source-etag.
+    """
+    if size > threshold:
+        return copy_large_object(s3, bucket, source_key, destination_key, size,
+                                 part_size, part_concurrency, retry)
+
+    copy_args = {'Bucket': bucket, 'Key': destination_key, 'CopySource': {'Bucket': bucket, 'Key': source_key}}
+    if etag and '-' in etag:
+        head = retry(s3.head_object, Bucket=bucket, Key=source_key, max_retries=5, initial_backoff=1)
+        copy_args['MetadataDirective'] = 'REPLACE'
+        copy_args['Metadata'] = dict(head.get('Metadata', {}), **{SOURCE_ETAG_METADATA: head['ETag']})
+        if head.get('ContentType'):
+            copy_args['ContentType'] = head['ContentType']
+
+    retry(s3.copy_object, **copy_args, max_retries=10, initial_backoff=2)
+    return 1
+
+def delete_keys(s3, bucket, keys, retry=_direct):
+    """Delete keys in batches of 1000; returns (deleted keys, {key: error})"""
+    deleted = []
+    errors = {}
+
+    for start in range(0, len(keys), DELETE_BATCH):
+        batch = keys[start:start + DELETE_BATCH]
+        response = retry(s3.delete_objects, Bucket=bucket,
+                         Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True},
+                         max_retries=5, initial_backoff=1)
+        failed = {e['Key']: e.get('Message', e.get('Code', 'unknown error')) for e in response.get('Errors', [])}
+        errors.update(failed)
+        deleted.extend(key for key in batch if key not in failed)
+
+    return deleted, errors
+
+def move_prefix(s3, bucket, source, destination, delete_source=True, overwrite=False, dry_run=False,
+                concurrency=COPY_CONCURRENCY, threshold=COPY_MULTIPART_THRESHOLD,
+                part_size=COPY_PART_SIZE, part_concurrency=COPY_PART_CONCURRENCY, retry=_direct,
+                progress=None):
+    """
+    Copy (and by default move) every object under one prefix to another, server-side.
+
+    No object data passes through this host: small objects use CopyObject and large
+    ones parallel UploadPartCopy, so a move costs requests rather than bandwidth.
+    Originals are deleted only after their copy succeeded. A destination object that
+    already is a copy of its source (same size and ETag, or matching source-etag
+    metadata, e.g. from an interrupted earlier run) is not copied again; for a move its
+    original is deleted. Other objects whose destination key already exists are
+    conflicts and left alone unless overwrite is set.
+
+    Args:
+        s3: S3 client (or endpoint pool)
+        bucket: Bucket name
+        source: Source prefix (e.g. ``jaemin_jetson5/calbi_2024-05-01_day1/``)
+        destination: Destination prefix
+        delete_source: Delete the originals after copying (move); False just copies
+        overwrite: Replace objects that already exist at the destination
+        dry_run: Only report what would be copied
+        concurrency: Objects copied at the same time
+        threshold: Size above which UploadPartCopy is used
+        part_size: UploadPartCopy part size
+        part_concurrency: Parts copied at the same time per large object
+        retry: retry_with_backoff-style wrapper for the S3 calls
+        progress: Optional callback(done, total), called as each object's copy finishes
+
+    Returns:
+        Result dict with counts, bytes and per-key errors
+    """
+    source, destination = check_prefixes(source, destination)
+    start_time = time.time()
+
+    objects = list_prefix(s3, bucket, source)
+    existing = list_prefix(s3, bucket, destination) if objects and not overwrite else {}
+    plan = {key: destination + key[len(source):] for key in objects}
+    to_copy = {key: target for key, target in plan.items() if target not in existing}
+
+    # Destination keys that exist: copies from an earlier run, or real conflicts
+    taken = [key for key in plan if key not in to_copy]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        matches = list(executor.map(
+            lambda key: is_copy_of(s3, bucket, objects[key], plan[key], existing[plan[key]], retry), taken))
+    already_copied = sorted(key for key, match in zip(taken, matches) if match)
+    conflicts = sorted(key for key, match in zip(taken, matches) if not match)
+    total_bytes = sum(objects[key][0] for key in to_copy)
+
+    result = {
+        'source': source,
+        'destination': destination,
+        'objects': len(objects),
+        'bytes': total_bytes,
+        'copied': 0,
+        'copied_bytes': 0,
+        'copy_requests': 0,
+        'deleted': 0,
+        'to_copy': len(to_copy),
+        'already_copied': len(already_copied),
+        'conflicts': conflicts,
+        'errors': {},
+        'dry_run': dry_run,
+        'moved': delete_source,
+    }
+
+    action = 'Moving' if delete_source else 'Copying'
+    logger.info(f"{action} {len(to_copy)} objects ({total_bytes} bytes) from {source} to {destination}"
+                f"{f', {len(already_copied)} already copied' if already_copied else ''}"
+                f"{f', {len(conflicts)} conflicting objects at the destination' if conflicts else ''}")
+    if dry_run or not (to_copy or (delete_source and already_copied)):
+        result['seconds'] = round(time.time() - start_time, 3)
+        return result
+
+    copied = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(copy_object, s3, bucket, key, target, objects[key][0],
+                            threshold, part_size, part_concurrency, retry, objects[key][1]): key
+            for key, target in to_copy.items()
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            key = futures[future]
+            if progress:
+                progress(done, len(to_copy))
+            try:
+                result['copy_requests'] += future.result()
+            except Exception as e:
+                logger.error(f"Failed to copy {key}: {str(e)}")
+                result['errors'][key] = str(e)
+                continue
+            copied.append(key)
+            result['copied'] += 1
+            result['copied_bytes'] += objects[key][0]
+            if result['copied'] % 100 == 0:
+                logger.info(f"Copied {result['copied']}/{len(to_copy)} objects")
+
+    if delete_source and (copied or already_copied):
+        deleted, delete_errors = delete_keys(s3, bucket, sorted(copied + already_copied), retry)
+        result['deleted'] = len(deleted)
+        for key, message in delete_errors.items():
+            logger.error(f"Copied {key} but failed to delete the original: {message}")
+            result['errors'][key] = f"delete failed: {message}"
+
+    result['seconds'] = round(time.time() - start_time, 3)
+    logger.info(f"{action} {source} -> {destination} finished: {result['copied']} copied, "
+                f"{result['deleted']} deleted, {len(result['errors'])} errors in {result['seconds']:.2f}s")
+    return result
+
+class MoveJobRegistry:
+    """
+    Prefix moves running in background threads, so a web request only starts one and
+    the client polls for its progress. Finished jobs are kept for ttl seconds.
+
+    Job state lives in a SQLite file rather than in memory, so under a multi-worker
+    server (gunicorn) a poll answered by any worker sees the job, not only the worker
+    running it. A running job touches its row every heartbeat seconds; a job whose
+    worker stopped (restart, crash) is reported as failed once it misses a few.
+    """
+
+    COLUMNS = ('job_id', 'status', 'done', 'total', 'started_at', 'updated_at',
+               'finished_at', 'result', 'error')
+
+    def __init__(self, path, ttl=3600, heartbeat=10):
+        self.path = path
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS move_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    done INTEGER NOT NULL,
+                    total INTEGER,
+                    started_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    finished_at REAL,
+                    result TEXT,
+                    error TEXT
+                )
+            ''')
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call: the registry is used from request
+        # threads, job threads and other processes
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _update(self, job_id, **fields):
+        fields.setdefault('updated_at', time.time())
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE move_jobs SET {assignments} WHERE job_id = ?', (*fields.values(), job_id))
+
+    def start(self, run):
+        """
+        Start a job in a daemon thread.
+
+        Args:
+            run: Callable taking a progress(done, total) callback and returning the
+                move_prefix result
+
+        Returns:
+            The job ID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('DELETE FROM move_jobs WHERE finished_at IS NOT NULL AND finished_at < ?',
+                         (now - self.ttl,))
+            conn.execute('INSERT INTO move_jobs (job_id, status, done, started_at, updated_at) '
+                         'VALUES (?, ?, 0, ?, ?)', (job_id, 'running', now, now))
+
+        finished = threading.Event()
+
+        def progress(done, total):
+            self._update(job_id, done=done, total=total)
+
+        def keep_alive():
+            while not finished.wait(self.heartbeat):
+                self._update(job_id)
+
+        def runner():
+            try:
+                result = run(progress)
+            except Exception as e:
+                logger.error(f"Move job {job_id} failed: {str(e)}")
+                self._update(job_id, status='failed', error=str(e), finished_at=time.time())
+                return
+            finally:
+                finished.set()
+            self._update(job_id, status='done', result=json.dumps(result), finished_at=time.time())
+
+        threading.Thread(target=runner, daemon=True).start()
+        threading.Thread(target=keep_alive, daemon=True).start()
+        return job_id
+
+    def get(self, job_id):
+        """Snapshot of a job (None if unknown or expired)"""
+        with self._connect() as conn:
+            row = conn.execute(f'SELECT {", ".join(self.COLUMNS)} FROM move_jobs WHERE job_id = ?',
+                               (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        if job['finished_at'] and time.time() - job['finished_at'] > self.ttl:
+            return None
+        if job['status'] == 'running' and time.time() - job['updated_at'] > 3 * self.heartbeat:
+            job.update(status='failed', error='The worker running this move stopped')
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        del job['updated_at']
+        return job
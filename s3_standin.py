@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Minimal local S3 stand-in for calibration and load testing.
+
+Implements just enough of the S3 REST API (path-style) for boto3 uploads: PutObject,
+multipart uploads, CopyObject/UploadPartCopy, HeadObject, DeleteObject(s), ListObjectsV2
+and the bucket accelerate probe. Object data is discarded; only sizes and ETags are kept. Link conditions can be simulated with a
+fixed per-request latency, a shared bandwidth cap, a per-connection bandwidth cap (to
+model TCP window limits), random 503 SlowDown errors and random straggler requests that
+stall before their body is read.
+
+Usage:
+    python s3_standin.py --port 9000 --latency-ms 40 --bandwidth-mbps 200
+"""
+import sys
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+import logging
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.sax.saxutils import escape
+from xml.etree import ElementTree
+
+logger = logging.getLogger(__name__)
+
+# Size of each socket read while draining a request body
+READ_CHUNK = 256 * 1024
+
+class Throttle:
+    """Token-bucket style limiter shared by every caller of consume()"""
+
+    def __init__(self, bytes_per_sec):
+        self.bytes_per_sec = bytes_per_sec
+        self.lock = threading.Lock()
+        self.next_free = time.monotonic()
+
+    def consume(self, nbytes):
+        """Block until nbytes can pass at the configured rate"""
+        if not self.bytes_per_sec:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_free)
+            self.next_free = start + nbytes / self.bytes_per_sec
+            wait = self.next_free - now
+
+        if wait > 0:
+            time.sleep(wait)
+
+class StandinState:
+    """In-memory bucket contents and simulated link settings"""
+
+    def __init__(self, latency=0.0, bandwidth=None, connection_bandwidth=None, error_rate=0.0,
+                 straggler_rate=0.0, straggler_delay=30.0):
+        self.latency = latency
+        self.connection_bandwidth = connection_bandwidth
+        self.error_rate = error_rate
+        self.straggler_rate = straggler_rate
+        self.straggler_delay = straggler_delay
+        self.link = Throttle(bandwidth)
+        self.lock = threading.Lock()
+        self.objects = {}      # (bucket, key) -> {'size', 'etag', 'last_modified', 'metadata', 'content_type'}
+        self.uploads = {}      # upload_id -> {'bucket', 'key', 'parts': {n: (size, md5_digest)}, 'attributes'}
+        self.requests = 0
+        self.bytes_received = 0
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Request handler for the S3 stand-in (state is attached to the server)"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    # --- helpers -------------------------------------------------------------
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _parse(self):
+        parts = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+        path = unquote(parts.path).lstrip('/')
+        bucket, _, key = path.partition('/')
+        return bucket, key, query
+
+    def _read_body(self, md5=None):
+        """Drain the request body through the simulated link and return its size"""
+        per_connection = Throttle(self.state.connection_bandwidth)
+        received = 0
+
+        if self.state.straggler_rate and random.random() < self.state.straggler_rate:
+            time.sleep(self.state.straggler_delay)
+
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = self._iter_chunked()
+        else:
+            chunks = self._iter_fixed(int(self.headers.get('Content-Length', 0)))
+
+        for data in chunks:
+            self.state.link.consume(len(data))
+            per_connection.consume(len(data))
+            if md5 is not None:
+                md5.update(data)
+            received += len(data)
+
+        with self.state.lock:
+            self.state.bytes_received += received
+        return received
+
+    def _iter_fixed(self, remaining):
+        while remaining > 0:
+            data = self.rfile.read(min(READ_CHUNK, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+    def _iter_chunked(self):
+        while True:
+            size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+            if size == 0:
+                # Skip trailers up to the terminating blank line
+                while self.rfile.readline().strip():
+                    pass
+                return
+            yield from self._iter_fixed(size)
+            self.rfile.readline()
+
+    def _attributes(self):
+        """User metadata (x-amz-meta-*) and Content-Type sent with a request"""
+        metadata = {name[len('x-amz-meta-'):].lower(): value for name, value in self.headers.items()
+                    if name.lower().startswith('x-amz-meta-')}
+        return {'metadata': metadata, 'content_type': self.headers.get('Content-Type')}
+
+    def _read_content(self):
+        """Read a small request body (XML documents) into memory"""
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _copy_source(self):
+        """The object named by x-amz-copy-source, or None if it doesn't exist"""
+        source = unquote(self.headers['x-amz-copy-source'].split('?')[0]).lstrip('/')
+        bucket, _, key = source.partition('/')
+        return self.state.objects.get((bucket, key))
+
+    def _copy(self, bucket, key, query):
+        """CopyObject or UploadPartCopy: no data is transferred, only sizes and ETags"""
+        self._read_body()
+        source = self._copy_source()
+        if source is None:
+            self._error(404, 'NoSuchKey', 'The specified copy source does not exist')
+            return
+        last_modified = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+
+        if 'partNumber' in query and 'uploadId' in query:
+            upload = self.state.uploads.get(query['uploadId'])
+            if upload is None:
+                self._error(404, 'NoSuchUpload', 'The specified upload does not exist')
+                return
+            byte_range = self.headers.get('x-amz-copy-source-range')
+            if byte_range:
+                first, _, last = byte_range.split('=', 1)[1].partition('-')
+                size = int(last) - int(first) + 1
+            else:
+                size = source['size']
+            md5 = hashlib.md5(f"{source['etag']}{byte_range}".encode())
+            with self.state.lock:
+                upload['parts'][int(query['partNumber'])] = (size, md5.digest())
+            self._send(200, '<?xml version="1.0" encoding="UTF-8"?>\n<CopyPartResult>'
+                            f'<ETag>&quot;{md5.hexdigest()}&quot;</ETag>'
+                            f'<LastModified>{last_modified}</LastModified></CopyPartResult>')
+        else:
+            copy = dict(source, last_modified=time.time())
+            if '-' in source['etag']:
+                # A copy is stored as one part, so a multipart source gets a new ETag
+                copy['etag'] = f'"{hashlib.md5(source["etag"].encode()).hexdigest()}"'
+            if self.headers.get('x-amz-metadata-directive', 'COPY').upper() == 'REPLACE':
+                copy.update(self._attributes())
+            with self.state.lock:
+                self.state.objects[(bucket, key)] = copy
+            self._send(200, '<?xml version="1.0" encoding="UTF-8"?>\n<CopyObjectResult>'
+                            f'<ETag>{escape(copy["etag"])}</ETag>'
+                            f'<LastModified>{last_modified}</LastModified></CopyObjectResult>')
+
+    def _delete_objects(self, bucket):
+        """DeleteObjects: remove every key in the request document"""
+        document = ElementTree.fromstring(self._read_content())
+        keys = [element.text or '' for element in document.iter() if element.tag.endswith('Key')]
+        with self.state.lock:
+            for key in keys:
+                self.state.objects.pop((bucket, key), None)
+        deleted = ''.join(f'<Deleted><Key>{escape(key)}</Key></Deleted>' for key in keys)
+        self._send(200, f'<?xml version="1.0" encoding="UTF-8"?>\n<DeleteResult>{deleted}</DeleteResult>')
+
+    def _send(self, status, body=b'', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body:
+            self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _error(self, status, code, message):
+        body = (f'<?xml version="1.0" encoding="UTF-8"?>\n<Error><Code>{code}</Code>'
+                f'<Message>{escape(message)}</Message></Error>')
+        self._send(status, body)
+
+    def _simulate(self):
+        """Apply request latency and random throttling errors; returns False if the request was rejected"""
+        with self.state.lock:
+            self.state.requests += 1
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        if self.state.error_rate and random.random() < self.state.error_rate:
+            # Drain the body so the connection can be reused
+            self._read_body()
+            self._error(503, 'SlowDown', 'Simulated throttling')
+            return False
+        return True
+
+    # --- verbs ---------------------------------------------------------------
+
+    def do_PUT(self):
+        if not self._simulate():
+            return
+        bucket, key, query = self._parse()
+
+        if 'accelerate' in query:
+            self._read_body()
+            self._send(200)
+        elif 'x-amz-copy-source' in self.headers:
+            self._copy(bucket, key, query)
+        elif 'partNumber' in query and 'uploadId' in query:
+            upload = self.state.uploads.get(query['uploadId'])
+            md5 = hashlib.md5()
+            size = self._read_body(md5)
+            if upload is None:
+                self._error(404, 'NoSuchUpload', 'The specified upload does not exist')
+                return
+            with self.state.lock:
+                upload['parts'][int(query['partNumber'])] = (size, md5.digest())
+            self._send(200, headers={'ETag': f'"{md5.hexdigest()}"'})
+        else:
+            md5 = hashlib.md5()
+            size = self._read_body(md5)
+            etag = f'"{md5.hexdigest()}"'
+            with self.state.lock:
+                self.state.objects[(bucket, key)] = dict(
+                    self._attributes(), size=size, etag=etag, last_modified=time.time())
+            self._send(200, headers={'ETag': etag})
+
+    def do_POST(self):
+        if not self._simulate():
+            return
+        bucket, key, query = self._parse()
+
+        if 'uploads' in query:
+            self._read_body()
+            upload_id = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.uploads[upload_id] = {'bucket': bucket, 'key': key, 'parts': {},
+                                                 'attributes': self._attributes()}
+            self._send(200, '<?xml version="1.0" encoding="UTF-8"?>\n<InitiateMultipartUploadResult>'
+                            f'<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>'
+                            f'<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>')
+        elif 'uploadId' in query:
+            self._read_body()
+            with self.state.lock:
+                upload = self.state.uploads.pop(query['uploadId'], None)
+            if upload is None:
+                self._error(404, 'NoSuchUpload', 'The specified upload does not exist')
+                return
+            parts = [upload['parts'][n] for n in sorted(upload['parts'])]
+            combined = hashlib.md5(b''.join(digest for _, digest in parts))
+            etag = f'"{combined.hexdigest()}-{len(parts)}"'
+            with self.state.lock:
+                self.state.objects[(bucket, key)] = dict(
+                    upload['attributes'], size=sum(size for size, _ in parts), etag=etag,
+                    last_modified=time.time())
+            self._send(200, '<?xml version="1.0" encoding="UTF-8"?>\n<CompleteMultipartUploadResult>'
+                            f'<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>'
+                            f'<ETag>{escape(etag)}</ETag></CompleteMultipartUploadResult>')
+        elif 'delete' in query:
+            self._delete_objects(bucket)
+        else:
+            self._read_body()
+            self._error(400, 'InvalidRequest', 'Unsupported POST')
+
+    def do_DELETE(self):
+        if not self._simulate():
+            return
+        bucket, key, query = self._parse()
+
+        with self.state.lock:
+            if 'uploadId' in query:
+                self.state.uploads.pop(query['uploadId'], None)
+            else:
+                self.state.objects.pop((bucket, key), None)
+        self._send(204)
+
+    def do_HEAD(self):
+        if not self._simulate():
+            return
+        bucket, key, _ = self._parse()
+
+        obj = self.state.objects.get((bucket, key))
+        if obj is None:
+            self._send(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(obj['size']))
+        self.send_header('ETag', obj['etag'])
+        self.send_header('Last-Modified', formatdate(obj['last_modified'], usegmt=True))
+        if obj.get('content_type'):
+            self.send_header('Content-Type', obj['content_type'])
+        for name, value in obj.get('metadata', {}).items():
+            self.send_header(f'x-amz-meta-{name}', value)
+        self.end_headers()
+
+    def do_GET(self):
+        if not self._simulate():
+            return
+        bucket, key, query = self._parse()
+
+        if 'accelerate' in query:
+            self._send(200, '<?xml version="1.0" encoding="UTF-8"?>\n<AccelerateConfiguration/>')
+        elif query.get('list-type') == '2':
+            self._list_objects(bucket, query)
+        else:
+            self._error(400, 'InvalidRequest', 'Unsupported GET')
+
+    def _list_objects(self, bucket, query):
+        """ListObjectsV2 (continuation tokens are simply the last key returned)"""
+        prefix = query.get('prefix', '')
+        max_keys = int(query.get('max-keys', 1000))
+        after = query.get('continuation-token') or query.get('start-after') or ''
+
+        with self.state.lock:
+            keys = sorted(k for b, k in self.state.objects if b == bucket and k.startswith(prefix) and k > after)
+            page = [(k, self.state.objects[(bucket, k)]) for k in keys[:max_keys]]
+        truncated = len(keys) > max_keys
+
+        contents = ''.join(
+            f'<Contents><Key>{escape(key)}</Key>'
+            f'<LastModified>{time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(obj["last_modified"]))}</LastModified>'
+            f'<ETag>{escape(obj["etag"])}</ETag><Size>{obj["size"]}</Size>'
+            f'<StorageClass>STANDARD</StorageClass></Contents>'
+            for key, obj in page
+        )
+        token = f'<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>' if truncated else ''
+        self._send(200, '<?xml version="1.0" encoding="UTF-8"?>\n<ListBucketResult>'
+                        f'<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>'
+                        f'<KeyCount>{len(page)}</KeyCount><MaxKeys>{max_keys}</MaxKeys>'
+                        f'<IsTruncated>{"true" if truncated else "false"}</IsTruncated>'
+                        f'{contents}{token}</ListBucketResult>')
+
+def start_standin(host='127.0.0.1', port=0, latency=0.0, bandwidth=None,
+                  connection_bandwidth=None, error_rate=0.0, straggler_rate=0.0, straggler_delay=30.0):
+    """
+    Start the stand-in in a background thread.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+        latency: Seconds added to every request
+        bandwidth: Shared upload bandwidth cap in bytes/second (None for unlimited)
+        connection_bandwidth: Per-connection bandwidth cap in bytes/second
+        error_rate: Fraction of requests answered with 503 SlowDown
+        straggler_rate: Fraction of requests that stall before their body is read
+        straggler_delay: How long a straggler stalls (seconds)
+
+    Returns:
+        (server, endpoint_url) - call server.shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.state = StandinState(latency, bandwidth, connection_bandwidth, error_rate,
+                                straggler_rate, straggler_delay)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    endpoint_url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    return server, endpoint_url
+
+def add_simulation_args(parser):
+    """Add the link simulation options shared by the stand-in and the tools that embed it"""
+    parser.add_argument('--latency-ms', type=float, default=0, help='Latency added to every request')
+    parser.add_argument('--bandwidth-mbps', type=float, help='Shared upload bandwidth cap (megabits/s)')
+    parser.add_argument('--connection-mbps', type=float, help='Per-connection bandwidth cap (megabits/s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests rejected with 503 SlowDown')
+    parser.add_argument('--straggler-rate', type=float, default=0.0, help='Fraction of requests that stall before reading the body')
+    parser.add_argument('--straggler-delay', type=float, default=30.0, help='Seconds a straggler request stalls')
+
+def simulation_kwargs(args):
+    """Convert parsed simulation options into start_standin() keyword arguments"""
+    to_bytes = lambda mbps: mbps * 1000 * 1000 / 8 if mbps else None
+    return {
+        'latency': args.latency_ms / 1000.0,
+        'bandwidth': to_bytes(args.bandwidth_mbps),
+        'connection_bandwidth': to_bytes(args.connection_mbps),
+        'error_rate': args.error_rate,
+        'straggler_rate': args.straggler_rate,
+        'straggler_delay': args.straggler_delay
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local S3 stand-in with simulated link conditions')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind')
+    parser.add_argument('--port', type=int, default=9000, help='Port to bind')
+    add_simulation_args(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    server, endpoint_url = start_standin(args.host, args.port, **simulation_kwargs(args))
+    logger.info(f"S3 stand-in listening on {endpoint_url}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -56,6 +56,7 @@ document.addEventListener('DOMContentLoaded', () => {
     let completedUploads = 0;
     let failedUploads = 0;
     let cancelUpload = false;
+    const activeRequests = new Map(); // Upload ID -> XHR of uploads in progress
     
     // Support drag and drop
     uploadArea.addEventListener('dragover', (e) => {
@@ -188,6 +189,14 @@ document.addEventListener('DOMContentLoaded', () => {
         uploadBtn.disabled = false;
         cancelBtn.disabled = true;
         cancelBtn.textContent = 'Canceling...';
+        
+        // Stop uploads in progress: drop the connection and tell the server to abort
+        activeRequests.forEach((xhr, uploadId) => {
+            console.log(`Canceling upload ${uploadId}`);
+            xhr.abort();
+            fetch(`/api/upload/${encodeURIComponent(uploadId)}/cancel`, { method: 'POST' })
+                .catch(error => console.warn(`Cancel request failed for ${uploadId}:`, error));
+        });
     });
     
     // Handle files selected via input
@@ -657,11 +666,28 @@ document.addEventListener('DOMContentLoaded', () => {
             // Concurrency for files within a directory
             const MAX_CONCURRENT_FILES = 2;
             let activeFiles = 0;
-            const fileQueue = [...dirData.files];
             let dirCompleted = 0;
             let dirFailed = 0;
             let dirUploadedBytes = 0;
             
+            // Skip files that are already in the bucket
+            statusElement.textContent = 'Checking for already uploaded files...';
+            const fileQueue = await preflightFiles(dirData.files, metadata);
+            const skippedFiles = dirData.files.length - fileQueue.length;
+            if (skippedFiles > 0) {
+                const pending = new Set(fileQueue);
+                dirData.files.forEach(file => {
+                    if (!pending.has(file)) {
+                        dirUploadedBytes += file.size;
+                    }
+                });
+                dirCompleted += skippedFiles;
+                completedUploads += skippedFiles;
+                progressBar.style.width = `${Math.round((dirUploadedBytes / dirData.totalBytes) * 100)}%`;
+                updateSummary();
+                console.log(`Skipping ${skippedFiles} already uploaded files in ${dirName}`);
+            }
+            
             return new Promise((resolveDir) => {
                 function processFiles() {
                     if (cancelUpload) {
@@ -682,7 +708,9 @@ document.addEventListener('DOMContentLoaded', () => {
                             statusElement.textContent = `Failed (${dirFailed} files could not be uploaded)`;
                         } else {
                             statusElement.className = 'upload-status status-success';
-                            statusElement.textContent = 'Completed successfully';
+                            statusElement.textContent = skippedFiles > 0
+                                ? `Completed successfully (${skippedFiles} already uploaded)`
+                                : 'Completed successfully';
                         }
                         
                         // Ensure progress bar is at 100%
@@ -747,11 +775,8 @@ document.addEventListener('DOMContentLoaded', () => {
         processDirectories();
     }
     
-    // Upload a single file
-    async function uploadFile(file, metadata, retryCount = 0) {
-        const MAX_RETRIES = 5;  // Maximum number of retries
-        const RETRY_DELAY = 2000;  // Delay between retries in milliseconds
-        
+    // Build the bucket key for a file: User_Camera/Task_Date_OriginalTopDir/rest/of/path
+    function buildTargetPath(file, metadata) {
         // Extract filename and original relative path
         const originalRelativePath = file.webkitRelativePath;
         
@@ -767,9 +792,56 @@ document.addEventListener('DOMContentLoaded', () => {
         const newTopDir = `${metadata.task}_${metadata.date}_${originalTopDir}`;
         
         // Create the full new path: User_Camera/Task_Date_OriginalTopDir/rest/of/path
-        const newFilePath = remainingPath 
+        return remainingPath 
             ? `${metadata.basePath}/${newTopDir}/${remainingPath}`
             : `${metadata.basePath}/${newTopDir}`;
+    }
+    
+    // Ask the server which files are not in the bucket yet (e.g. after a browser crash)
+    // Returns the files that still need uploading; on any error, all of them
+    async function preflightFiles(files, metadata) {
+        const BATCH_SIZE = 5000;  // Files per preflight request
+        const toUpload = [];
+        
+        try {
+            for (let i = 0; i < files.length; i += BATCH_SIZE) {
+                const batch = files.slice(i, i + BATCH_SIZE);
+                const pathToFile = new Map(batch.map(file => [buildTargetPath(file, metadata), file]));
+                
+                const response = await fetch('/api/preflight', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({
+                        files: Array.from(pathToFile.entries()).map(([path, file]) => ({
+                            path,
+                            size: file.size,
+                            mtime: file.lastModified
+                        }))
+                    })
+                });
+                
+                const result = await response.json();
+                if (!response.ok || !result.success) {
+                    throw new Error(result.error || `Server error (${response.status})`);
+                }
+                
+                result.upload.forEach(path => toUpload.push(pathToFile.get(path)));
+                console.log(`Preflight: ${result.skipped} files already uploaded (${formatFileSize(result.skipped_bytes)})`);
+            }
+            return toUpload;
+        } catch (error) {
+            console.warn('Preflight check failed, uploading all files:', error);
+            return files;
+        }
+    }
+    
+    // Upload a single file
+    async function uploadFile(file, metadata, retryCount = 0) {
+        const MAX_RETRIES = 5;  // Maximum number of retries
+        const RETRY_DELAY = 2000;  // Delay between retries in milliseconds
+        
+        const originalRelativePath = file.webkitRelativePath;
+        const newFilePath = buildTargetPath(file, metadata);
         
         console.log(`Starting upload for file: ${originalRelativePath} (Attempt ${retryCount + 1}/${MAX_RETRIES + 1})`);
         console.log(`Target path: ${newFilePath}`);
@@ -782,10 +854,11 @@ document.addEventListener('DOMContentLoaded', () => {
             
             console.log(`Preparing XHR request for: ${newFilePath}`);
             
-            // Upload with progress tracking
+            // Upload with progress tracking (the ID lets the Cancel button stop it on the server)
+            const uploadId = newUploadId();
             const response = await uploadWithProgress(formData, (progress) => {
                 // Progress is handled at the directory level
-            });
+            }, uploadId);
             
             console.log(`Upload response for ${newFilePath}:`, response);
             
@@ -799,6 +872,10 @@ document.addEventListener('DOMContentLoaded', () => {
         } catch (error) {
             console.error(`Upload failed for: ${newFilePath}`, error);
             
+            if (cancelUpload) {
+                return { success: false, error: 'Canceled' };
+            }
+            
             // Check if we should retry
             if (retryCount < MAX_RETRIES) {
                 console.log(`Retrying upload in ${RETRY_DELAY/1000} seconds...`);
@@ -811,12 +888,22 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
+    // Generate an ID for one upload request
+    function newUploadId() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+    }
+    
     // Upload with progress tracking
-    async function uploadWithProgress(formData, progressCallback) {
+    async function uploadWithProgress(formData, progressCallback, uploadId) {
         console.log('Starting uploadWithProgress');
         
         return new Promise((resolve, reject) => {
             const xhr = new XMLHttpRequest();
+            activeRequests.set(uploadId, xhr);
+            xhr.addEventListener('loadend', () => activeRequests.delete(uploadId));
             
             xhr.upload.addEventListener('progress', (event) => {
                 if (event.lengthComputable) {
@@ -876,6 +963,7 @@ document.addEventListener('DOMContentLoaded', () => {
             
             console.log('Opening XHR connection to /api/upload');
             xhr.open('POST', '/api/upload', true);
+            xhr.setRequestHeader('X-Upload-Id', uploadId);
             
             // Set an extremely long timeout that will never be hit
             // Note: This doesn't affect the actual upload time, only waiting for a response
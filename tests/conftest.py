@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+import boto3
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep the modules under test away from real credentials, transfer profiles and log files
+SCRATCH = tempfile.mkdtemp(prefix='uploady_tests_')
+os.environ.update({
+    'UPLOAD_LOG_FILE': os.path.join(SCRATCH, 'upload_log.txt'),
+    'TRANSFER_PROFILE': os.path.join(SCRATCH, 'transfer_profile.json'),
+    'MOVE_JOBS_DB': os.path.join(SCRATCH, 'move_jobs.db'),
+    'USE_ACCELERATION': 'False',
+    'DO_SPACES_KEY': 'test',
+    'DO_SPACES_SECRET': 'test',
+    'DO_SPACES_REGION': 'us-east-1',
+    'DO_SPACES_BUCKET': 'test-bucket',
+})
+
+from s3_standin import start_standin
+from endpoint_pool import create_endpoint_pool
+
+@pytest.fixture
+def standin():
+    """A local S3 stand-in: yields (server, endpoint_url)"""
+    server, endpoint_url = start_standin()
+    yield server, endpoint_url
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def s3(standin):
+    """Plain boto3 client for the stand-in"""
+    _, endpoint_url = standin
+    return boto3.client('s3', endpoint_url=endpoint_url, region_name='us-east-1',
+                        aws_access_key_id='test', aws_secret_access_key='test')
+
+@pytest.fixture
+def pool(standin, bucket):
+    """EndpointPool with the stand-in as its only endpoint (what the uploaders use)"""
+    _, endpoint_url = standin
+    return create_endpoint_pool(bucket, 'us-east-1', 'test', 'test', endpoint_url, False,
+                                boto3.session.Config())
+
+@pytest.fixture
+def bucket():
+    return 'test-bucket'
+
+@pytest.fixture
+def app_client(pool, bucket, monkeypatch):
+    """Logged-in Flask test client of app.py, uploading to the stand-in"""
+    import app
+    from bucket_index import PrefixIndex
+    monkeypatch.setattr(app, 's3', pool)
+    monkeypatch.setattr(app, 'SPACES_BUCKET', bucket)
+    monkeypatch.setattr(app, 'bucket_index', PrefixIndex(pool, bucket))
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+    return client
+
+def list_keys(s3, bucket, prefix=''):
+    """Every key under a prefix in the stand-in"""
+    response = s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
+    return sorted(obj['Key'] for obj in response.get('Contents', []))
@@ -0,0 +1,174 @@
+import time
+import logging
+import argparse
+import pytest
+import botocore.exceptions
+import auto_upload
+from transfer_profile import CLI_DEFAULTS
+from conftest import list_keys
+
+def client_error(code, status):
+    return botocore.exceptions.ClientError(
+        {'Error': {'Code': code, 'Message': ''}, 'ResponseMetadata': {'HTTPStatusCode': status}}, 'UploadPart')
+
+METADATA = {'user': 'jaemin', 'camera': 'jetson5', 'task': 'calbi', 'date': '2024-05-01'}
+
+def make_tree(root, count=40, size=1024):
+    """Create a capture directory with files spread over a few subdirectories"""
+    capture = root / 'day1'
+    for i in range(count):
+        subdir = capture / f"cam{i % 3}"
+        subdir.mkdir(parents=True, exist_ok=True)
+        (subdir / f"frame_{i:04d}.bin").write_bytes(b'x' * (size + i))
+    return capture
+
+# --- user-026: sharding and worker batches --------------------------------------
+
+def test_parse_shard():
+    assert auto_upload.parse_shard('0/4') == (0, 4)
+    assert auto_upload.parse_shard('3/4') == (3, 4)
+    for value in ('4/4', '-1/2', '1/0', 'a/b', '1'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            auto_upload.parse_shard(value)
+
+def test_shard_of_is_deterministic_and_path_separator_independent():
+    key = 'jaemin_jetson5/calbi_2024-05-01_day1/cam0/frame_0001.bin'
+    assert auto_upload.shard_of(key, 8) == auto_upload.shard_of(key, 8)
+    assert auto_upload.shard_of(key.replace('/', '\\'), 8) == auto_upload.shard_of(key, 8)
+
+def test_shard_of_spreads_keys_evenly():
+    counts = [0] * 4
+    for i in range(4000):
+        counts[auto_upload.shard_of(f"user_cam/task_date_dir/file_{i}.bin", 4)] += 1
+    assert min(counts) > 800
+
+def test_split_for_workers_balances_bytes():
+    files = [{'local_path': str(i), 'size': size} for i, size in enumerate([100, 90, 50, 40, 30, 10, 5])]
+    batches = auto_upload.split_for_workers(files, 3)
+
+    assert sorted(f['local_path'] for batch in batches for f in batch) == sorted(f['local_path'] for f in files)
+    totals = [sum(f['size'] for f in batch) for batch in batches]
+    assert max(totals) - min(totals) <= 50
+
+def test_split_for_workers_drops_empty_batches():
+    assert auto_upload.split_for_workers([{'size': 1}], 4) == [[{'size': 1}]]
+
+def test_shards_cover_every_file_exactly_once(tmp_path, s3, bucket):
+    capture = make_tree(tmp_path)
+    uploaded = []
+    for index in range(3):
+        result = auto_upload.upload_directory(s3, bucket, str(capture), METADATA, shard=(index, 3))
+        assert result['success']
+        keys = list_keys(s3, bucket)
+        uploaded.append(set(keys) - set().union(*uploaded) if uploaded else set(keys))
+        assert len(uploaded[-1]) == result['uploaded_files']
+
+    _, file_list = auto_upload.list_directory_files(str(capture), METADATA)
+    assert set().union(*uploaded) == {f['s3_path'] for f in file_list}
+    assert sum(len(keys) for keys in uploaded) == len(file_list)
+
+class FailingPartClient:
+    """Part 1 is refused outright; every other part gets SlowDown and would retry for minutes"""
+
+    def __init__(self):
+        self.aborted = False
+
+    def create_multipart_upload(self, **kwargs):
+        return {'UploadId': 'mpu-1'}
+
+    def upload_part(self, Body, PartNumber, **kwargs):
+        Body.read()
+        if PartNumber == 1:
+            time.sleep(0.2)
+            raise client_error('AccessDenied', 403)
+        raise client_error('SlowDown', 503)
+
+    def abort_multipart_upload(self, **kwargs):
+        self.aborted = True
+
+def test_failed_part_stops_its_siblings(tmp_path, small_parts):
+    path = tmp_path / 'clip.bin'
+    path.write_bytes(b'x' * 20000)
+    client = FailingPartClient()
+    start = time.time()
+
+    with pytest.raises(botocore.exceptions.ClientError, match='AccessDenied'):
+        auto_upload.upload_large_file(client, 'bucket', str(path), 'user_cam/clip.bin', 20000)
+
+    # The other parts were in a 5s retry sleep; they stop as soon as part 1 fails
+    assert time.time() - start < 3
+    assert client.aborted and not auto_upload.cancel_token.cancelled
+
+def dir_result(uploaded, failed):
+    return {'success': failed == 0, 'uploaded_files': uploaded, 'failed_files': failed,
+            'total_files': uploaded + failed, 'uploaded_size': uploaded * 10, 'total_size': (uploaded + failed) * 10}
+
+def test_merge_summaries_adds_up_shards(tmp_path, caplog):
+    paths = []
+    for index, (uploaded, failed) in enumerate([(5, 0), (4, 1)]):
+        paths.append(str(tmp_path / f'shard{index}.json'))
+        auto_upload.write_summary(paths[-1], [{'directory': 'day1', 'result': dir_result(uploaded, failed)}],
+                                  (index, 2))
+
+    with caplog.at_level(logging.INFO):
+        assert auto_upload.merge_main(paths) == 1
+
+    assert 'day1: FAILED - 9/10 files uploaded' in caplog.text
+    assert 'Total files failed: 1' in caplog.text
+
+def test_merge_summaries_needs_every_shard(tmp_path, caplog):
+    path = str(tmp_path / 'shard0.json')
+    auto_upload.write_summary(path, [{'directory': 'day1', 'result': dir_result(5, 0)}], (0, 2))
+
+    assert auto_upload.merge_main([path]) == 1
+    assert 'Missing summaries for shard(s) 1/2' in caplog.text
+
+# --- user-027: structured part records ------------------------------------------
+
+def part_records(caplog):
+    return [r.event_fields for r in caplog.records
+            if getattr(r, 'event_fields', {}).get('event') == 'part']
+
+@pytest.fixture
+def small_parts(monkeypatch):
+    """4KB multipart threshold and parts, every part record kept"""
+    monkeypatch.setattr(auto_upload, 'transfer_profile',
+                        dict(CLI_DEFAULTS, multipart_threshold=4096, multipart_chunksize=4096))
+    monkeypatch.setattr(auto_upload, 'PART_SAMPLE_RATE', 1.0)
+
+def test_multipart_upload_logs_one_record_per_part(tmp_path, s3, bucket, small_parts, caplog):
+    path = tmp_path / 'clip.bin'
+    path.write_bytes(b'x' * 10000)
+
+    with caplog.at_level(logging.INFO):
+        assert auto_upload.upload_file(s3, bucket, str(path), 'user_cam/clip.bin')
+
+    parts = part_records(caplog)
+    assert sorted(p['part_number'] for p in parts) == [1, 2, 3]
+    assert sum(p['bytes'] for p in parts) == 10000
+    assert {p['status'] for p in parts} == {'success'}
+    assert all(p['s3_path'] == 'user_cam/clip.bin' and p['upload_id'] for p in parts)
+
+def test_single_part_upload_logs_a_part_record(tmp_path, s3, bucket, small_parts, caplog):
+    path = tmp_path / 'small.bin'
+    path.write_bytes(b'x' * 100)
+
+    with caplog.at_level(logging.INFO):
+        assert auto_upload.upload_file(s3, bucket, str(path), 'user_cam/small.bin')
+
+    assert [(p['part_number'], p['bytes'], p['status']) for p in part_records(caplog)] == [(1, 100, 'success')]
+
+def test_failed_part_is_logged_at_error(tmp_path, s3, bucket, small_parts, caplog, monkeypatch):
+    path = tmp_path / 'clip.bin'
+    path.write_bytes(b'x' * 5000)
+
+    def refuse(*args, **kwargs):
+        raise ValueError('disk on fire')
+    monkeypatch.setattr(auto_upload, 'hedged_upload_part', refuse)
+
+    with caplog.at_level(logging.INFO):
+        assert not auto_upload.upload_file(s3, bucket, str(path), 'user_cam/clip.bin')
+
+    failed = [p for p in part_records(caplog) if p['status'] == 'failed']
+    assert failed and all(p['error'] == 'disk on fire' for p in failed)
+    assert not list_keys(s3, bucket)
@@ -0,0 +1,104 @@
+import time
+import hashlib
+import pytest
+from bucket_index import PrefixIndex, manifest_prefix, etag_matches
+
+class CountingClient:
+    """Passes calls through to the stand-in and records the prefixes that were listed"""
+
+    def __init__(self, s3):
+        self.s3 = s3
+        self.listed = []
+
+    def list_objects_v2(self, **kwargs):
+        self.listed.append(kwargs['Prefix'])
+        return self.s3.list_objects_v2(**kwargs)
+
+@pytest.fixture
+def counting(s3):
+    return CountingClient(s3)
+
+def put(s3, bucket, key, data=b'x'):
+    return s3.put_object(Bucket=bucket, Key=key, Body=data)['ETag']
+
+def manifest_entry(path, size=1, mtime=None, md5=None):
+    return {'path': path, 'size': size, 'mtime': mtime if mtime is not None else 0, 'md5': md5}
+
+def wait_for_refresh(index, prefix):
+    deadline = time.time() + 5
+    while index.prefixes[prefix]['refreshing'] and time.time() < deadline:
+        time.sleep(0.01)
+
+def test_manifest_prefix():
+    assert manifest_prefix(['u_c/t_d_day1/cam0/a.bin', 'u_c/t_d_day1/cam0/b.bin']) == 'u_c/t_d_day1/cam0/'
+    assert manifest_prefix(['u_c/t_d_day1/cam0/a.bin', 'u_c/t_d_day1/cam1/b.bin']) == 'u_c/t_d_day1/'
+    assert manifest_prefix(['a.bin']) == ''
+
+def test_etag_matches():
+    md5 = hashlib.md5(b'data').hexdigest()
+    assert etag_matches(f'"{md5}"', md5) is True
+    assert etag_matches('"' + '0' * 32 + '"', md5) is False
+    assert etag_matches(f'"{hashlib.md5(bytes.fromhex(md5)).hexdigest()}-1"', md5) is True
+    assert etag_matches('"abc-3"', md5) is None
+    assert etag_matches('"abc"', None) is None
+
+def test_lists_only_the_capture_directory(counting, s3, bucket):
+    put(s3, bucket, 'u_c/t_d_day1/a.bin')
+    put(s3, bucket, 'u_c/t_d_day2/b.bin')
+    index = PrefixIndex(counting, bucket)
+
+    to_upload, skipped = index.filter_manifest([manifest_entry('u_c/t_d_day1/a.bin'),
+                                                manifest_entry('u_c/t_d_day1/c.bin')])
+
+    assert counting.listed == ['u_c/t_d_day1/']
+    assert [f['path'] for f in to_upload] == ['u_c/t_d_day1/c.bin']
+    assert [f['path'] for f in skipped] == ['u_c/t_d_day1/a.bin']
+
+    # A narrower manifest reuses the listing that covers it
+    index.filter_manifest([manifest_entry('u_c/t_d_day1/cam0/d.bin')])
+    assert counting.listed == ['u_c/t_d_day1/']
+
+def test_stale_prefix_is_served_and_refreshed_in_the_background(counting, s3, bucket):
+    put(s3, bucket, 'u_c/t_d_day1/a.bin')
+    put(s3, bucket, 'u_c/t_d_day1/gone.bin')
+    index = PrefixIndex(counting, bucket, ttl=0)
+    assert set(index.get('u_c/t_d_day1/')) == {'u_c/t_d_day1/a.bin', 'u_c/t_d_day1/gone.bin'}
+
+    put(s3, bucket, 'u_c/t_d_day1/b.bin')
+    s3.delete_object(Bucket=bucket, Key='u_c/t_d_day1/gone.bin')
+    index.record_upload('u_c/t_d_day1/b.bin', 1)
+
+    # Served from the cache while a background listing merges the changes
+    assert 'u_c/t_d_day1/b.bin' in index.get('u_c/t_d_day1/')
+    wait_for_refresh(index, 'u_c/t_d_day1/')
+
+    assert set(index.prefixes['u_c/t_d_day1/']['objects']) == {
+        'u_c/t_d_day1/a.bin', 'u_c/t_d_day1/b.bin'}
+
+def test_invalidate_lists_again_synchronously(counting, s3, bucket):
+    index = PrefixIndex(counting, bucket)
+    index.get('u_c/t_d_day1/')
+    put(s3, bucket, 'u_c/t_d_day1/a.bin')
+
+    index.invalidate('u_c/')
+
+    assert 'u_c/t_d_day1/a.bin' in index.get('u_c/t_d_day1/')
+    assert counting.listed == ['u_c/t_d_day1/', 'u_c/t_d_day1/']
+
+def test_md5_decides_over_mtime(s3, bucket):
+    etag = put(s3, bucket, 'u_c/t_d_day1/a.bin', b'data')
+    index = PrefixIndex(s3, bucket)
+    later = int((time.time() + 3600) * 1000)
+
+    # Same content, modified after the upload: still skipped
+    _, skipped = index.filter_manifest([manifest_entry('u_c/t_d_day1/a.bin', 4, later, etag.strip('"'))])
+    assert len(skipped) == 1
+
+    # Different content of the same size, modified before the upload: uploaded
+    to_upload, _ = index.filter_manifest([manifest_entry('u_c/t_d_day1/a.bin', 4, 0,
+                                                         hashlib.md5(b'diff').hexdigest())])
+    assert len(to_upload) == 1
+
+    # No md5: newer local file is uploaded
+    to_upload, _ = index.filter_manifest([manifest_entry('u_c/t_d_day1/a.bin', 4, later)])
+    assert len(to_upload) == 1
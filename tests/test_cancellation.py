@@ -0,0 +1,101 @@
+import io
+import socket
+import pytest
+from cancellation import (CancellationToken, CancellationRegistry, CancellableInput, TransferCancelled,
+                          client_disconnected)
+from loadtest import MultipartBody
+
+def test_registry_refuses_an_id_that_is_running():
+    registry = CancellationRegistry()
+    token = registry.register('upload-1')
+
+    assert registry.register('upload-1') is None
+    assert registry.cancel('upload-1') and token.cancelled
+
+def test_unregister_only_removes_its_own_token():
+    registry = CancellationRegistry()
+    first = registry.register('upload-1')
+    registry.unregister('upload-1', first)
+    second = registry.register('upload-1')
+
+    # A late unregister of the finished upload leaves the new one registered
+    registry.unregister('upload-1', first)
+    assert registry.cancel('upload-1') and second.cancelled and not first.cancelled
+
+def test_early_cancel_is_remembered():
+    registry = CancellationRegistry()
+    assert not registry.cancel('upload-1', 'cancelled by client')
+
+    token = registry.register('upload-1')
+    assert token.cancelled and token.reason == 'cancelled by client'
+
+def test_truncated_body_cancels():
+    token = CancellationToken()
+    stream = CancellableInput(io.BytesIO(b'x' * 10), token, content_length=100)
+
+    assert stream.read(8) == b'x' * 8
+    assert stream.read(8) == b'xx'
+    with pytest.raises(TransferCancelled):
+        stream.read(8)
+    assert token.reason == 'client disconnected'
+
+def test_complete_body_reads_normally():
+    stream = CancellableInput(io.BytesIO(b'line\nrest'), CancellationToken(), content_length=9)
+    assert stream.readline() == b'line\n'
+    assert stream.read() == b'rest'
+    assert stream.read(8) == b''
+
+def test_unsupported_socket_is_not_a_disconnect():
+    class PeekFails:
+        """Like an SSL socket: readable, but recv with flags raises ValueError"""
+        def __init__(self, sock):
+            self.sock = sock
+
+        def fileno(self):
+            return self.sock.fileno()
+
+        def recv(self, size, flags=0):
+            raise ValueError("non-zero flags not allowed in calls to recv() on SSLSocket")
+
+    local, remote = socket.socketpair()
+    with local, remote:
+        remote.sendall(b'x')
+        assert client_disconnected(PeekFails(local)) is False
+        assert client_disconnected(local) is False
+        remote.close()
+        local.recv(1)
+        assert client_disconnected(local) is True
+
+def test_duplicate_upload_id_is_rejected(app_client):
+    import app
+    token = app.upload_registry.register('upload-1')
+    body = MultipartBody('a.bin', 'u_c/t_d_dir/a.bin', 3000)
+    try:
+        response = app_client.post('/api/upload', data=b''.join(body), content_type=body.content_type,
+                                   headers={'X-Upload-Id': 'upload-1'})
+        assert response.status_code == 409
+        assert app.upload_registry.cancel('upload-1') and token.cancelled
+    finally:
+        app.upload_registry.unregister('upload-1', token)
+
+def test_body_cut_short_is_a_cancel(app_client):
+    body = MultipartBody('a.bin', 'u_c/t_d_dir/a.bin', 3000)
+    data = b''.join(body)
+
+    # gunicorn marks its input as terminated and just returns EOF when the client goes away
+    response = app_client.post('/api/upload', input_stream=io.BytesIO(data[:1000]), content_type=body.content_type,
+                               environ_overrides={'wsgi.input_terminated': True, 'CONTENT_LENGTH': str(len(data))})
+
+    assert response.status_code == 499
+    assert response.get_json()['status'] == 'cancelled'
+
+def test_child_token_follows_its_parent():
+    parent = CancellationToken()
+    first, second = parent.child(), parent.child()
+
+    first.cancel('part 1 failed')
+    assert first.cancelled and not parent.cancelled and not second.cancelled
+
+    parent.cancel('interrupted')
+    assert second.cancelled and second.reason == 'interrupted'
+    assert parent.child().cancelled
@@ -0,0 +1,142 @@
+import io
+import time
+import boto3
+import pytest
+import botocore.exceptions
+import endpoint_pool
+from endpoint_pool import Endpoint, EndpointPool, is_endpoint_error, is_config_error
+
+# Nothing listens here, so every call fails with a connection error
+DEAD_URL = 'http://127.0.0.1:9'
+
+def make_client(url):
+    return boto3.client('s3', endpoint_url=url, region_name='us-east-1',
+                        aws_access_key_id='test', aws_secret_access_key='test',
+                        config=boto3.session.Config(retries={'max_attempts': 0}, connect_timeout=1))
+
+def client_error(code, status=400, message=''):
+    return botocore.exceptions.ClientError(
+        {'Error': {'Code': code, 'Message': message}, 'ResponseMetadata': {'HTTPStatusCode': status}},
+        'PutObject')
+
+ACCELERATION_OFF = client_error('InvalidRequest', message='S3 Transfer Acceleration is not configured on this bucket')
+
+@pytest.fixture
+def failover_pool(standin, monkeypatch):
+    """Dead 'accelerated' endpoint in front of the stand-in (no random exploration)"""
+    monkeypatch.setattr(endpoint_pool.random, 'random', lambda: 1.0)
+    _, endpoint_url = standin
+    return EndpointPool([Endpoint('accelerated', DEAD_URL, make_client(DEAD_URL)),
+                         Endpoint('standard', endpoint_url, make_client(endpoint_url))])
+
+def test_error_classification():
+    assert is_endpoint_error(client_error('SlowDown', 503))
+    assert is_endpoint_error(ACCELERATION_OFF) and is_config_error(ACCELERATION_OFF)
+    assert not is_endpoint_error(client_error('NoSuchKey', 404))
+    assert not is_config_error(client_error('InternalError', 500))
+    assert not is_endpoint_error(ValueError('bad argument'))
+
+def test_fails_over_within_the_same_call(failover_pool, bucket):
+    failover_pool.put_object(Bucket=bucket, Key='a.bin', Body=b'x' * 100)
+
+    dead, standard = failover_pool.endpoints
+    assert failover_pool.last_endpoint() is standard
+    assert dead.errors == 1 and not dead.is_available(time.time())
+    assert failover_pool.best() is standard
+
+def test_cooldown_doubles_and_resets(monkeypatch):
+    monkeypatch.setattr(endpoint_pool.random, 'random', lambda: 1.0)
+    endpoint = Endpoint('standard', 'url', None)
+    pool = EndpointPool([endpoint])
+    error = client_error('ServiceUnavailable', 503)
+
+    pool.record(endpoint, 1.0, error=error)
+    first = endpoint.cooldown_until - time.time()
+    pool.record(endpoint, 1.0, error=error)
+    second = endpoint.cooldown_until - time.time()
+    assert first == pytest.approx(endpoint_pool.BASE_COOLDOWN, abs=1)
+    assert second == pytest.approx(2 * endpoint_pool.BASE_COOLDOWN, abs=1)
+
+    pool.record(endpoint, 1.0)
+    assert endpoint.is_available(time.time()) and endpoint.consecutive_errors == 0
+
+def test_config_error_gets_the_longest_cooldown():
+    endpoint = Endpoint('accelerated', 'url', None)
+    EndpointPool([endpoint]).record(endpoint, None, error=ACCELERATION_OFF)
+    assert endpoint.cooldown_until - time.time() == pytest.approx(endpoint_pool.MAX_COOLDOWN, abs=1)
+
+def test_unsampled_endpoints_rank_after_sampled_ones(monkeypatch):
+    monkeypatch.setattr(endpoint_pool.random, 'random', lambda: 1.0)
+    fresh = Endpoint('accelerated', 'url', None)
+    measured = Endpoint('standard', 'url', None)
+    pool = EndpointPool([fresh, measured])
+    assert pool.best() is fresh
+
+    pool.record(measured, 5.0, body_bytes=1024 * 1024)
+    assert pool.best() is measured
+
+def test_only_calls_with_a_body_are_latency_samples(failover_pool, bucket):
+    _, standard = failover_pool.endpoints
+    failover_pool.list_objects_v2(Bucket=bucket)
+    assert standard.latency is None
+
+    failover_pool.put_object(Bucket=bucket, Key='a.bin', Body=b'x' * 100)
+    assert standard.latency is not None
+
+def test_managed_call_ignores_request_errors(standin, bucket, tmp_path):
+    _, endpoint_url = standin
+    standard = Endpoint('standard', endpoint_url, make_client(endpoint_url))
+    pool = EndpointPool([standard])
+
+    with pytest.raises(botocore.exceptions.ClientError):
+        pool.download_file(bucket, 'missing.bin', str(tmp_path / 'missing.bin'))
+    assert standard.errors == 0 and standard.is_available(time.time())
+
+    pool.upload_fileobj(io.BytesIO(b'x' * 100), bucket, 'b.bin')
+    assert pool.last_endpoint() is standard
+
+def test_endpoint_health_requires_login():
+    import app
+    client = app.app.test_client()
+    assert client.get('/api/health/endpoints').status_code == 401
+    assert 'endpoints' not in client.get('/api/health').get_json()
+
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+    assert client.get('/api/health/endpoints').get_json()['endpoints']
+
+class FailingParts:
+    """boto3 client whose upload_part fails with a connection error after the first few parts"""
+
+    def __init__(self, client, after):
+        self.client = client
+        self.after = after
+        self.parts = 0
+
+    def upload_part(self, **kwargs):
+        self.parts += 1
+        if self.parts > self.after:
+            raise botocore.exceptions.EndpointConnectionError(endpoint_url=DEAD_URL)
+        return self.client.upload_part(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+def test_web_upload_fails_over_between_parts(standin, bucket, app_client, monkeypatch):
+    import app
+    from loadtest import MultipartBody
+    monkeypatch.setattr(endpoint_pool.random, 'random', lambda: 1.0)
+    _, endpoint_url = standin
+    pool = EndpointPool([Endpoint('accelerated', endpoint_url, FailingParts(make_client(endpoint_url), after=2)),
+                         Endpoint('standard', endpoint_url, make_client(endpoint_url))])
+    monkeypatch.setattr(app, 's3', pool)
+    monkeypatch.setattr(app, 'transfer_profile', dict(app.transfer_profile, multipart_threshold=4096,
+                                                      multipart_chunksize=4096, max_concurrency=1))
+    body = MultipartBody('a.bin', 'u_c/t_d_dir/a.bin', 5 * 4096)
+
+    payload = app_client.post('/api/upload', data=b''.join(body), content_type=body.content_type).get_json()
+
+    # The third part moved to the standard endpoint; nothing was sent twice
+    assert payload['success'] and payload['parts'] == 5
+    assert payload['endpoints'] == {'accelerated': 2, 'standard': 3}
+    assert pool.head_object(Bucket=bucket, Key='u_c/t_d_dir/a.bin')['ContentLength'] == 5 * 4096
@@ -0,0 +1,127 @@
+import time
+import threading
+import boto3
+import pytest
+import hedging
+import endpoint_pool
+from hedging import HedgeBudget, PartLatencyTracker, hedged_upload_part
+from cancellation import TransferCancelled
+
+PART = b'x' * 1024
+
+@pytest.fixture
+def fast_hedging(monkeypatch):
+    """Hedge after 50ms, with a tracker that has already seen enough quick parts"""
+    monkeypatch.setattr(hedging, 'HEDGE_MIN_DELAY', 0.05)
+    tracker = PartLatencyTracker()
+    for _ in range(hedging.HEDGE_MIN_SAMPLES):
+        tracker.record(0.001, len(PART))
+    return tracker
+
+class FakeUploadPart:
+    """upload_part stand-in: the first request straggles (reading its body slowly), later ones are quick"""
+
+    def __init__(self, straggle=True):
+        self.straggle = straggle
+        self.calls = []
+        self.cancelled = threading.Event()
+
+    def __call__(self, Body, **kwargs):
+        self.calls.append(threading.current_thread())
+        if self.straggle and len(self.calls) == 1:
+            try:
+                for _ in range(500):
+                    Body.read(1)
+                    time.sleep(0.01)
+            except TransferCancelled:
+                self.cancelled.set()
+                raise
+        Body.read()
+        return {'ETag': f'"etag-{len(self.calls)}"'}
+
+def test_budget_caps_hedged_bytes():
+    budget = HedgeBudget(max_extra=0.1)
+    assert not budget.available(100)
+    budget.add_sent(1000)
+    assert budget.available(100) and budget.try_acquire(100)
+    assert not budget.try_acquire(1)
+    assert budget.try_acquire(100, force=True) and budget.hedged == 200
+
+def test_uploads_inline_until_hedging_is_possible():
+    upload_part = FakeUploadPart(straggle=False)
+    tracker = PartLatencyTracker()
+
+    hedged_upload_part(upload_part, tracker, HedgeBudget(), PART, stats={}, PartNumber=1)
+
+    assert upload_part.calls == [threading.current_thread()]
+    assert len(tracker.samples) == 1
+
+def test_first_hedge_of_a_transfer_needs_no_budget(fast_hedging):
+    upload_part = FakeUploadPart()
+    stats = {'hedged_parts': 0, 'hedge_wins': 0}
+
+    response = hedged_upload_part(upload_part, fast_hedging, HedgeBudget(), PART, stats=stats, PartNumber=1)
+
+    assert response == {'ETag': '"etag-2"'}
+    assert stats == {'hedged_parts': 1, 'hedge_wins': 1}
+    assert upload_part.cancelled.wait(2)
+
+def test_later_hedges_need_budget(fast_hedging):
+    upload_part = FakeUploadPart(straggle=False)
+    stats = {'hedged_parts': hedging.HEDGE_MIN_PER_TRANSFER, 'hedge_wins': 0}
+
+    hedged_upload_part(upload_part, fast_hedging, HedgeBudget(), PART, stats=stats, PartNumber=2)
+
+    # No budget left and no free hedge: not even a thread
+    assert upload_part.calls == [threading.current_thread()]
+    assert stats['hedged_parts'] == hedging.HEDGE_MIN_PER_TRANSFER
+
+def test_part_clients_cap_the_read_timeout(standin, bucket, monkeypatch):
+    monkeypatch.setattr(endpoint_pool, 'PART_READ_TIMEOUT', 7)
+    _, endpoint_url = standin
+    pool = endpoint_pool.create_endpoint_pool(bucket, 'us-east-1', 'test', 'test', endpoint_url, False,
+                                              boto3.session.Config(read_timeout=86400))
+    endpoint = pool.endpoints[0]
+
+    assert endpoint.client.meta.config.read_timeout == 86400
+    assert endpoint.part_client.meta.config.read_timeout == 7
+
+    pool.put_object(Bucket=bucket, Key='a.bin', Body=PART)
+    assert pool.head_object(Bucket=bucket, Key='a.bin')['ContentLength'] == len(PART)
+
+class StragglingPart:
+    """Client whose first request for part 2 straggles; every other request goes to the stand-in"""
+
+    def __init__(self, client):
+        self.client = client
+        self.part_numbers = []
+
+    def upload_part(self, Body, **kwargs):
+        self.part_numbers.append(kwargs['PartNumber'])
+        if self.part_numbers.count(2) == 1 and kwargs['PartNumber'] == 2:
+            for _ in range(500):
+                Body.read(1)
+                time.sleep(0.01)
+        return self.client.upload_part(Body=Body, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+def test_web_upload_of_a_large_file_is_hedged(standin, bucket, app_client, fast_hedging, monkeypatch):
+    import app
+    from loadtest import MultipartBody
+    _, endpoint_url = standin
+    client = StragglingPart(boto3.client('s3', endpoint_url=endpoint_url, region_name='us-east-1',
+                                         aws_access_key_id='test', aws_secret_access_key='test'))
+    pool = endpoint_pool.EndpointPool([endpoint_pool.Endpoint('standard', endpoint_url, client)])
+    monkeypatch.setattr(app, 's3', pool)
+    monkeypatch.setattr(app, 'part_tracker', fast_hedging)
+    monkeypatch.setattr(app, 'transfer_profile', dict(app.transfer_profile, multipart_threshold=4096,
+                                                      multipart_chunksize=4096, max_concurrency=2))
+    body = MultipartBody('a.bin', 'u_c/t_d_dir/a.bin', 4 * 4096)
+
+    payload = app_client.post('/api/upload', data=b''.join(body), content_type=body.content_type).get_json()
+
+    assert payload['success'] and payload['parts'] == 4
+    assert payload['hedged_parts'] == 1 and payload['hedge_wins'] == 1
+    assert client.part_numbers.count(2) == 2
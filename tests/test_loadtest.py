@@ -0,0 +1,40 @@
+import pytest
+import loadtest
+from loadtest import parse_size, percentile, MultipartBody, Results
+from conftest import list_keys
+
+def test_parse_size():
+    assert parse_size('512KB') == 512 * 1024
+    assert parse_size('1.5mb') == int(1.5 * 1024 ** 2)
+    assert parse_size(' 2GB ') == 2 * 1024 ** 3
+    assert parse_size('100') == 100
+    with pytest.raises(ValueError):
+        parse_size('lots')
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile(values, 7) == 7
+    assert percentile([7], 95) == 7
+    assert percentile([], 50) is None
+
+def test_multipart_body_length_matches_content(monkeypatch):
+    monkeypatch.setattr(loadtest, 'BODY_BLOCK', 1000)
+    body = MultipartBody('a.bin', 'u_c/t_d_dir/a.bin', 2500)
+    assert len(body) == len(b''.join(body))
+
+def test_results_count_errors_by_kind():
+    results = Results()
+    results.add_upload(0.1, 100)
+    results.add_upload(0.2, 100, error='http_500')
+    assert [ok for _, _, ok, _ in results.uploads] == [True, False]
+
+def test_multipart_body_uploads_through_the_app(app_client, s3, bucket):
+    body = MultipartBody('a.bin', 'u_c/t_d_dir/a.bin', 3000)
+
+    response = app_client.post('/api/upload', data=b''.join(body), content_type=body.content_type)
+
+    assert response.status_code == 200, response.get_json()
+    assert list_keys(s3, bucket) == ['u_c/t_d_dir/a.bin']
@@ -0,0 +1,148 @@
+import time
+import sqlite3
+import threading
+import pytest
+from conftest import list_keys
+from prefix_move import move_prefix, copy_object, check_prefixes, MoveJobRegistry, SOURCE_ETAG_METADATA
+
+SOURCE = 'u_c/t_d_day1/'
+DESTINATION = 'u_c/t_d_day2/'
+
+def put(s3, bucket, key, data=b'x'):
+    s3.put_object(Bucket=bucket, Key=key, Body=data)
+
+def put_multipart(s3, bucket, key, data):
+    mpu = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType='video/mp4')
+    part = s3.upload_part(Bucket=bucket, Key=key, UploadId=mpu['UploadId'], PartNumber=1, Body=data)
+    s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=mpu['UploadId'],
+                                 MultipartUpload={'Parts': [{'PartNumber': 1, 'ETag': part['ETag']}]})
+
+def wait_for_job(client, job_id):
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        job = client.get(f'/api/move/{job_id}').get_json()
+        if job['status'] != 'running':
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'move job {job_id} did not finish')
+
+def test_check_prefixes():
+    assert check_prefixes('/a/b', 'c/') == ('a/b/', 'c/')
+    with pytest.raises(ValueError):
+        check_prefixes('a/', 'a/b/')
+
+def test_moves_every_object(s3, bucket):
+    put(s3, bucket, SOURCE + 'a.bin')
+    put(s3, bucket, SOURCE + 'cam0/b.bin')
+    progress = []
+
+    result = move_prefix(s3, bucket, SOURCE, DESTINATION, progress=lambda done, total: progress.append(done))
+
+    assert result['copied'] == 2 and result['deleted'] == 2 and not result['errors']
+    assert progress == [1, 2]
+    assert list_keys(s3, bucket, SOURCE) == []
+    assert list_keys(s3, bucket, DESTINATION) == [DESTINATION + 'a.bin', DESTINATION + 'cam0/b.bin']
+
+def test_rerun_deletes_already_copied_originals(s3, bucket):
+    put(s3, bucket, SOURCE + 'a.bin')
+    put(s3, bucket, SOURCE + 'b.bin')
+    # An interrupted run copied a.bin but never deleted it
+    copy_object(s3, bucket, SOURCE + 'a.bin', DESTINATION + 'a.bin', 1)
+
+    result = move_prefix(s3, bucket, SOURCE, DESTINATION)
+
+    assert result['already_copied'] == 1 and result['copied'] == 1
+    assert result['conflicts'] == [] and result['deleted'] == 2
+    assert list_keys(s3, bucket, SOURCE) == []
+
+def test_different_destination_object_is_a_conflict(s3, bucket):
+    put(s3, bucket, SOURCE + 'a.bin', b'new')
+    put(s3, bucket, DESTINATION + 'a.bin', b'old')
+
+    result = move_prefix(s3, bucket, SOURCE, DESTINATION)
+
+    assert result['conflicts'] == [SOURCE + 'a.bin']
+    assert result['copied'] == 0 and result['deleted'] == 0
+    assert list_keys(s3, bucket, SOURCE) == [SOURCE + 'a.bin']
+
+    result = move_prefix(s3, bucket, SOURCE, DESTINATION, overwrite=True)
+    assert result['copied'] == 1 and result['conflicts'] == []
+
+def test_copy_of_a_multipart_object_is_recognized(s3, bucket):
+    put_multipart(s3, bucket, SOURCE + 'a.mp4', b'v' * 1024)
+
+    first = move_prefix(s3, bucket, SOURCE, DESTINATION, delete_source=False)
+    head = s3.head_object(Bucket=bucket, Key=DESTINATION + 'a.mp4')
+    source_etag = s3.head_object(Bucket=bucket, Key=SOURCE + 'a.mp4')['ETag']
+    assert first['copied'] == 1
+    assert head['Metadata'][SOURCE_ETAG_METADATA] == source_etag
+    assert head['ContentType'] == 'video/mp4'
+
+    # The copy's ETag differs from the original's, but source-etag ties them together
+    second = move_prefix(s3, bucket, SOURCE, DESTINATION)
+    assert second['already_copied'] == 1 and second['conflicts'] == [] and second['deleted'] == 1
+
+def test_dry_run_changes_nothing(s3, bucket):
+    put(s3, bucket, SOURCE + 'a.bin')
+
+    result = move_prefix(s3, bucket, SOURCE, DESTINATION, dry_run=True)
+
+    assert result['to_copy'] == 1 and result['copied'] == 0
+    assert list_keys(s3, bucket) == [SOURCE + 'a.bin']
+
+def test_move_runs_as_a_background_job(app_client, s3, bucket):
+    put(s3, bucket, SOURCE + 'a.bin')
+
+    response = app_client.post('/api/move', json={'source': SOURCE, 'destination': DESTINATION})
+    assert response.status_code == 202
+    job = wait_for_job(app_client, response.get_json()['job_id'])
+
+    assert job['status'] == 'done' and job['success']
+    assert job['done'] == job['total'] == 1
+    assert job['result']['deleted'] == 1
+    assert list_keys(s3, bucket) == [DESTINATION + 'a.bin']
+    assert app_client.get('/api/move/unknown').status_code == 404
+
+def test_move_flags_must_be_booleans(app_client, s3, bucket):
+    put(s3, bucket, SOURCE + 'a.bin')
+
+    response = app_client.post('/api/move', json={'source': SOURCE, 'destination': DESTINATION, 'copy': 'false'})
+
+    assert response.status_code == 400
+    assert list_keys(s3, bucket) == [SOURCE + 'a.bin']
+
+def test_move_job_is_visible_from_another_worker(tmp_path):
+    path = str(tmp_path / 'move_jobs.db')
+    running, polling = MoveJobRegistry(path), MoveJobRegistry(path)
+    release = threading.Event()
+
+    def run(progress):
+        progress(1, 2)
+        release.wait(5)
+        return {'copied': 2, 'errors': []}
+
+    job_id = running.start(run)
+    deadline = time.time() + 5
+    while polling.get(job_id)['done'] != 1 and time.time() < deadline:
+        time.sleep(0.01)
+    assert polling.get(job_id)['status'] == 'running' and polling.get(job_id)['total'] == 2
+
+    release.set()
+    while polling.get(job_id)['status'] == 'running' and time.time() < deadline:
+        time.sleep(0.01)
+    assert polling.get(job_id)['result'] == {'copied': 2, 'errors': []}
+    assert polling.get('unknown') is None
+
+def test_job_of_a_stopped_worker_is_failed(tmp_path):
+    path = str(tmp_path / 'move_jobs.db')
+    registry = MoveJobRegistry(path, heartbeat=10)
+    # A running job whose worker was killed a minute ago: its heartbeat stopped
+    stopped = time.time() - 60
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO move_jobs (job_id, status, done, started_at, updated_at) "
+                     "VALUES ('job-1', 'running', 3, ?, ?)", (stopped, stopped))
+
+    job = registry.get('job-1')
+
+    assert job['status'] == 'failed' and job['done'] == 3
+    assert 'stopped' in job['error']
@@ -0,0 +1,67 @@
+import json
+import pytest
+import calibrate
+from transfer_profile import (load_transfer_profile, save_transfer_profile, pool_connections,
+                              APP_DEFAULTS, CLI_DEFAULTS)
+from conftest import list_keys
+
+MB = 1024 * 1024
+
+def test_missing_profile_uses_target_defaults(tmp_path):
+    path = str(tmp_path / 'profile.json')
+    assert load_transfer_profile('app', path) == APP_DEFAULTS
+    assert load_transfer_profile('cli', path) == CLI_DEFAULTS
+
+def test_targets_do_not_overwrite_each_other(tmp_path):
+    path = str(tmp_path / 'profile.json')
+    save_transfer_profile(dict(APP_DEFAULTS, max_concurrency=3), 'app', path, code_path='app')
+    save_transfer_profile(dict(CLI_DEFAULTS, max_concurrency=7), 'cli', path, code_path='cli')
+
+    assert load_transfer_profile('app', path)['max_concurrency'] == 3
+    assert load_transfer_profile('cli', path)['max_concurrency'] == 7
+    with open(path) as f:
+        assert json.load(f)['app']['code_path'] == 'app'
+
+def test_unreadable_profile_falls_back(tmp_path):
+    path = tmp_path / 'profile.json'
+    path.write_text('[1, 2]')
+    assert load_transfer_profile('cli', str(path)) == CLI_DEFAULTS
+
+def test_pool_has_room_for_hedged_parts():
+    assert pool_connections({'max_concurrency': 4}) == 30
+    assert pool_connections({'max_concurrency': max(calibrate.CONCURRENCIES)}) >= 2 * max(calibrate.CONCURRENCIES)
+
+@pytest.mark.parametrize('code_path', ['cli', 'app'])
+def test_defaults_are_fitted_to_the_budget(code_path):
+    budget = 1024 * MB
+    for defaults in (APP_DEFAULTS, CLI_DEFAULTS):
+        fitted = calibrate.fit_to_budget(defaults, code_path, budget)
+        assert calibrate.estimate_memory(fitted, code_path) <= budget
+
+def test_fit_gives_up_when_nothing_fits():
+    assert calibrate.fit_to_budget(CLI_DEFAULTS, 'cli', MB) is None
+
+def test_app_memory_counts_parts_in_flight():
+    assert calibrate.estimate_memory(APP_DEFAULTS, 'app') == (APP_DEFAULTS['multipart_chunksize'] *
+                                                              APP_DEFAULTS['max_concurrency'])
+
+@pytest.mark.parametrize('code_path', ['cli', 'app'])
+def test_measure_runs_each_code_path(tmp_path, s3, bucket, code_path):
+    sample_size = 3 * MB
+    sample = tmp_path / 'sample.bin'
+    sample.write_bytes(b'x' * sample_size)
+    profile = dict(CLI_DEFAULTS, multipart_threshold=MB, multipart_chunksize=MB, max_concurrency=2)
+
+    throughput = calibrate.measure(s3, bucket, str(sample), sample_size, profile, code_path, '_cal/', 1)
+
+    assert throughput > 0
+    assert not list_keys(s3, bucket, '_cal/')
+
+def test_sweep_keeps_the_default_threshold(monkeypatch):
+    # Bigger parts are always faster here, so the sweep settles on the largest one
+    monkeypatch.setattr(calibrate, 'measure', lambda s3, bucket, path, size, profile, *args: profile['multipart_chunksize'])
+
+    best, _ = calibrate.sweep(None, 'bucket', 'sample', 1, CLI_DEFAULTS, 'cli', 64 * 100 * MB, '_cal/', 1)
+
+    assert best['multipart_chunksize'] == calibrate.PART_SIZES[-1]
+    assert best['multipart_threshold'] == CLI_DEFAULTS['multipart_threshold']
@@ -0,0 +1,97 @@
+import os
+import json
+import logging
+import logging.handlers
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+import upload_logging
+from upload_logging import setup_logging, setup_worker_logging, worker_log_queue, shutdown_logging, log_event
+
+@pytest.fixture
+def restore_logging():
+    """Put the root logger back the way pytest configured it"""
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    shutdown_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+def read_records(log_file):
+    """JSON records from a log file and all of its rotated backups"""
+    records = []
+    directory = os.path.dirname(log_file)
+    for name in os.listdir(directory):
+        if name.startswith(os.path.basename(log_file)):
+            with open(os.path.join(directory, name)) as f:
+                records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+def _log_in_worker(count):
+    logger = logging.getLogger('worker_test')
+    for i in range(count):
+        log_event(logger, 'part', part_number=i, pid=os.getpid(), padding='x' * 200)
+    return os.getpid()
+
+def test_worker_records_are_written_by_the_parent_only(tmp_path, restore_logging):
+    log_file = str(tmp_path / 'upload_log.txt')
+    setup_logging(log_file=log_file, max_bytes=20000, backup_count=100)
+
+    # spawn is what the CLI gets on Windows: workers import the modules afresh
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=3, mp_context=context, initializer=setup_worker_logging,
+                             initargs=(worker_log_queue(context),)) as pool:
+        pids = set(pool.map(_log_in_worker, [200] * 6))
+    log_event(logging.getLogger('parent_test'), 'transfer', status='success')
+    shutdown_logging()
+
+    records = read_records(log_file)
+    parts = [r for r in records if r.get('event') == 'part']
+    # Several rotations happened, yet no record was lost or duplicated
+    assert len(os.listdir(tmp_path)) > 3
+    assert len(parts) == 1200
+    assert {r['pid'] for r in parts} == pids
+    assert [r['event'] for r in records].count('transfer') == 1
+
+def test_setup_worker_logging_does_not_own_the_listener(restore_logging):
+    setup_logging()
+    queue = worker_log_queue()
+    setup_worker_logging(queue)
+    assert upload_logging._listener is None
+    assert isinstance(logging.getLogger().handlers[0], logging.handlers.QueueHandler)
+
+def test_log_event_sampling(caplog):
+    logger = logging.getLogger('sampling_test')
+    with caplog.at_level(logging.INFO, logger='sampling_test'):
+        for _ in range(100):
+            log_event(logger, 'part', sample_rate=0.0)
+        log_event(logger, 'transfer', status='success', bytes=10)
+
+    assert len(caplog.records) == 1
+    assert caplog.records[0].event_fields['event'] == 'transfer'
+    assert caplog.records[0].event_fields['bytes'] == 10
+
+def _log_after_fork(log_file):
+    log_event(logging.getLogger('forked_test'), 'transfer', pid=os.getpid())
+    # multiprocessing children skip atexit, so flush here (gunicorn workers exit normally)
+    shutdown_logging()
+
+def test_forked_process_starts_its_own_listener(tmp_path, restore_logging):
+    log_file = str(tmp_path / 'upload_log.txt')
+    setup_logging(log_file=log_file, rotate=False)
+
+    # What gunicorn --preload does: the app is imported (and logging set up) before the fork
+    child = multiprocessing.get_context('fork').Process(target=_log_after_fork, args=(log_file,))
+    child.start()
+    child.join(10)
+    shutdown_logging()
+
+    assert [r['pid'] for r in read_records(log_file)] == [child.pid]
+
+def test_shared_file_is_not_rotated(tmp_path, restore_logging):
+    setup_logging(log_file=str(tmp_path / 'upload_log.txt'), rotate=False)
+    assert any(isinstance(h, logging.handlers.WatchedFileHandler) for h in upload_logging._handlers)
@@ -0,0 +1,108 @@
+import os
+import time
+import threading
+import pytest
+import auto_upload
+import upload_state
+from upload_state import UploadStateStore
+from cancellation import CancellationToken
+from conftest import list_keys
+
+@pytest.fixture
+def store(tmp_path):
+    store = UploadStateStore(str(tmp_path / 'state.db'))
+    yield store
+    store.close()
+
+def test_uploaded_only_while_size_and_mtime_match(store):
+    store.mark_uploaded('/data/a.bin', 'k/a.bin', 10, 1.5)
+    assert store.is_uploaded('/data/a.bin', 10, 1.5)
+    assert not store.is_uploaded('/data/a.bin', 11, 1.5)
+
+def test_failures_back_off_exponentially(store):
+    first = store.record_failure('/data/a.bin', 10, 1.5) - time.time()
+    second = store.record_failure('/data/a.bin', 10, 1.5) - time.time()
+    assert first == pytest.approx(upload_state.FAILURE_BACKOFF, abs=1)
+    assert second == pytest.approx(2 * upload_state.FAILURE_BACKOFF, abs=1)
+
+    for _ in range(20):
+        last = store.record_failure('/data/a.bin', 10, 1.5) - time.time()
+    assert last == pytest.approx(upload_state.MAX_FAILURE_BACKOFF, abs=1)
+
+def test_rewritten_file_is_retried_right_away(store):
+    store.record_failure('/data/a.bin', 10, 1.5)
+    assert store.retry_at('/data/a.bin', 10, 1.5) is not None
+    assert store.retry_at('/data/a.bin', 12, 2.5) is None
+    assert store.record_failure('/data/a.bin', 12, 2.5) - time.time() == pytest.approx(upload_state.FAILURE_BACKOFF, abs=1)
+
+def test_upload_clears_failure(store):
+    store.record_failure('/data/a.bin', 10, 1.5)
+    store.mark_uploaded('/data/a.bin', 'k/a.bin', 10, 1.5)
+    assert store.retry_at('/data/a.bin', 10, 1.5) is None
+
+def test_directory_date_is_fixed_when_first_seen(tmp_path):
+    path = str(tmp_path / 'state.db')
+    store = UploadStateStore(path)
+    assert store.directory_date('/data/day1', '2024-05-01') == '2024-05-01'
+    assert store.directory_date('/data/day1', '2024-05-02') == '2024-05-01'
+    store.close()
+
+    # Survives a restart
+    store = UploadStateStore(path)
+    assert store.directory_date('/data/day1', '2024-05-02') == '2024-05-01'
+    assert store.directory_date('/data/day2', '2024-05-02') == '2024-05-02'
+    store.close()
+
+def run_watch(monkeypatch, pool, bucket, root, state_path, until, timeout=10):
+    """Run watch mode on one directory until `until()` is true"""
+    token = CancellationToken()
+    monkeypatch.setattr(auto_upload, 'cancel_token', token)
+    metadata = {'user': 'jaemin', 'camera': 'jetson5', 'task': 'calib', 'date': None}
+    thread = threading.Thread(target=auto_upload.watch_directories,
+                              args=(pool, bucket, [str(root)], metadata, state_path),
+                              kwargs={'settle_seconds': 0, 'batch_interval': 0, 'poll_interval': 0.1,
+                                      'force_polling': True})
+    thread.start()
+    try:
+        deadline = time.time() + timeout
+        while not until() and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        token.cancel()
+        thread.join()
+
+def test_watch_keeps_one_date_across_midnight(tmp_path, s3, pool, bucket, monkeypatch):
+    root = tmp_path / 'day1'
+    root.mkdir()
+    state_path = str(tmp_path / 'state.db')
+    (root / 'before.bin').write_bytes(b'a')
+    os.utime(root / 'before.bin', (0, time.mktime((2024, 5, 1, 23, 59, 0, 0, 0, -1))))
+    run_watch(monkeypatch, pool, bucket, root, state_path, lambda: len(list_keys(s3, bucket)) == 1)
+
+    # Written "after midnight", picked up by a restarted watcher
+    (root / 'after.bin').write_bytes(b'b')
+    run_watch(monkeypatch, pool, bucket, root, state_path, lambda: len(list_keys(s3, bucket)) == 2)
+
+    assert list_keys(s3, bucket) == ['jaemin_jetson5/calib_2024-05-01_day1/after.bin',
+                                     'jaemin_jetson5/calib_2024-05-01_day1/before.bin']
+
+def test_watch_backs_off_after_a_failed_upload(tmp_path, s3, pool, bucket, monkeypatch):
+    root = tmp_path / 'day1'
+    root.mkdir()
+    (root / 'a.bin').write_bytes(b'a')
+    attempts = []
+
+    def fail(*args):
+        attempts.append(time.time())
+        return False
+    monkeypatch.setattr(auto_upload, 'upload_file', fail)
+
+    run_watch(monkeypatch, pool, bucket, root, str(tmp_path / 'state.db'), lambda: False, timeout=2)
+
+    assert len(attempts) == 1
+
+def test_watch_rejects_workers(monkeypatch):
+    monkeypatch.setattr('sys.argv', ['auto_upload.py', '--user', 'u', '--camera', 'c', '--task', 't',
+                                     '--watch', '--workers', '2'])
+    with pytest.raises(SystemExit):
+        auto_upload.main()
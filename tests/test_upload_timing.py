@@ -0,0 +1,50 @@
+import os
+import time
+import pytest
+import upload_timing
+from upload_timing import UploadTimer, start_profiler, stop_profiler
+from loadtest import MultipartBody
+
+def test_timer_attributes_phases():
+    timer = UploadTimer()
+    with timer.phase('read'):
+        time.sleep(0.02)
+    timer.add('upload_part', 0.5)
+    timer.add('upload_part', 0.25)
+
+    timings = timer.as_dict()
+    assert timings['read'] >= 0.02
+    assert timings['upload_part'] == 0.75
+    assert timer.counts['upload_part'] == 2
+    assert timings['other'] >= 0 and timings['total'] >= timings['read']
+
+def test_profiler_is_off_unless_enabled(monkeypatch):
+    monkeypatch.setattr(upload_timing, 'PROFILER_ENABLED', False)
+    timer = UploadTimer()
+    assert start_profiler(timer, 'cprofile') is None
+    assert stop_profiler(timer, 'x') is None
+
+@pytest.mark.parametrize('mode', ['cprofile', 'sample'])
+def test_profiler_writes_output(tmp_path, monkeypatch, mode):
+    monkeypatch.setattr(upload_timing, 'PROFILER_ENABLED', True)
+    monkeypatch.setattr(upload_timing, 'PROFILER_OUTPUT_DIR', str(tmp_path))
+    timer = UploadTimer()
+    assert start_profiler(timer, mode) is not None
+    sum(i * i for i in range(200000))
+
+    path = stop_profiler(timer, 'upload-1')
+
+    assert os.path.dirname(path) == str(tmp_path) and os.path.exists(path)
+    assert timer.profiler is None
+
+def test_unknown_profiler_is_ignored(monkeypatch):
+    monkeypatch.setattr(upload_timing, 'PROFILER_ENABLED', True)
+    assert start_profiler(UploadTimer(), 'perf') is None
+
+def test_upload_response_has_phase_timings(app_client):
+    body = MultipartBody('a.bin', 'u_c/t_d_dir/a.bin', 3000)
+
+    payload = app_client.post('/api/upload', data=b''.join(body), content_type=body.content_type).get_json()
+
+    assert payload['success']
+    assert {'receive', 'upload_part', 'complete', 'other', 'total'} <= set(payload['timings'])
@@ -0,0 +1,125 @@
+import os
+import json
+import logging
+from boto3.s3.transfer import TransferConfig
+
+logger = logging.getLogger(__name__)
+
+# Where calibrate.py writes the tuned profiles and where the uploaders look for them
+# (one section per target, so calibrating one uploader leaves the other's settings alone)
+DEFAULT_PROFILE_PATH = os.getenv(
+    'TRANSFER_PROFILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'transfer_profile.json')
+)
+
+# Transfer settings that a profile may override
+PROFILE_KEYS = (
+    'multipart_threshold',
+    'multipart_chunksize',
+    'max_concurrency',
+    'max_io_queue',
+    'io_chunksize',
+)
+
+# Built-in settings for the web app (terabyte-scale files streamed from the browser)
+APP_DEFAULTS = {
+    'multipart_threshold': 100 * 1024 * 1024,  # 100MB
+    'multipart_chunksize': 100 * 1024 * 1024,  # 100MB chunks
+    'max_concurrency': 20,
+    'max_io_queue': 200,
+    'io_chunksize': 524288,  # 512KB chunks for reading
+}
+
+# Built-in settings for auto_upload.py (local files)
+CLI_DEFAULTS = {
+    'multipart_threshold': 10 * 1024 * 1024,  # 10MB
+    'multipart_chunksize': 25 * 1024 * 1024,  # 25MB chunks
+    'max_concurrency': 10,
+    'max_io_queue': 100,
+    'io_chunksize': 262144,  # 256KB chunks for reading
+}
+
+# Built-in settings per target ('app' is app.py, 'cli' is auto_upload.py)
+TARGET_DEFAULTS = {
+    'app': APP_DEFAULTS,
+    'cli': CLI_DEFAULTS,
+}
+
+def _read_profiles(path):
+    """The {target: settings} sections of a profile file ({} if it doesn't exist)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("not a JSON object")
+    return data
+
+def load_transfer_profile(target, path=None):
+    """
+    Load the calibrated transfer profile of a target, falling back to its defaults.
+
+    Unknown keys are ignored and a missing or unreadable profile file (or one without
+    a section for this target) simply means the defaults are used.
+
+    Args:
+        target: 'app' or 'cli' (selects the section and the built-in defaults)
+        path: Profile file (defaults to TRANSFER_PROFILE env var or transfer_profile.json)
+
+    Returns:
+        Dict with one value for every key in PROFILE_KEYS
+    """
+    path = path or DEFAULT_PROFILE_PATH
+    profile = dict(TARGET_DEFAULTS[target])
+
+    try:
+        calibrated = _read_profiles(path).get(target)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read transfer profile {path}: {str(e)}")
+        logger.warning("Using built-in transfer settings")
+        return profile
+
+    if not isinstance(calibrated, dict):
+        logger.info(f"No '{target}' transfer profile in {path}, using built-in transfer settings")
+        return profile
+
+    for key in PROFILE_KEYS:
+        if isinstance(calibrated.get(key), int) and calibrated[key] > 0:
+            profile[key] = calibrated[key]
+
+    logger.info(f"Loaded '{target}' transfer profile from {path}: "
+                f"{profile['multipart_chunksize'] // (1024 * 1024)}MB parts, "
+                f"concurrency {profile['max_concurrency']}, io_chunksize {profile['io_chunksize']}")
+    return profile
+
+def save_transfer_profile(profile, target, path=None, **details):
+    """Write the transfer profile of one target (plus any calibration details), keeping the others"""
+    path = path or DEFAULT_PROFILE_PATH
+    try:
+        profiles = _read_profiles(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Replacing unreadable transfer profile {path}: {str(e)}")
+        profiles = {}
+
+    profiles[target] = {key: profile[key] for key in PROFILE_KEYS}
+    profiles[target].update(details)
+
+    with open(path, 'w') as f:
+        json.dump(profiles, f, indent=2)
+
+    return path
+
+def pool_connections(profile):
+    """HTTP connections a client needs for a profile: every in-flight part plus a hedged duplicate of each"""
+    return max(30, 2 * profile['max_concurrency'])
+
+def build_transfer_config(profile):
+    """Create a boto3 TransferConfig from a transfer profile"""
+    return TransferConfig(
+        multipart_threshold=profile['multipart_threshold'],
+        max_concurrency=profile['max_concurrency'],
+        multipart_chunksize=profile['multipart_chunksize'],
+        use_threads=True,
+        max_io_queue=profile['max_io_queue'],
+        io_chunksize=profile['io_chunksize']
+    )
@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+import logging.handlers
+import multiprocessing
+
+# Human-readable format used for the console (same as the original basicConfig format)
+CONSOLE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Defaults, overridable through environment variables
+DEFAULT_LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+DEFAULT_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 50 * 1024 * 1024))  # 50MB per log file
+DEFAULT_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+PART_SAMPLE_RATE = float(os.getenv('LOG_PART_SAMPLE_RATE', 0.1))  # Log ~1 in 10 successful parts
+
+# Logger for per-upload trace records; they go to their own file when one is configured
+TRACE_LOGGER = 'upload_trace'
+DEFAULT_TRACE_FILE = os.getenv('UPLOAD_TRACE_FILE')
+
+# Chatty third-party loggers that stay at INFO even when LOG_LEVEL=DEBUG
+QUIET_LOGGERS = ('boto3', 'botocore', 's3transfer', 'urllib3')
+
+# The active listener, the process that started it and its handlers (see setup_logging)
+_listener = None
+_listener_pid = None
+_handlers = []
+
+# Arguments of the last setup_logging call: a process forked after it (gunicorn --preload
+# workers) builds its own handlers and listener from them on its first record
+_config = None
+_start_lock = threading.Lock()
+
+# Listener that writes the records of worker processes (see worker_log_queue)
+_worker_listener = None
+
+class _EventMessage:
+    """Log message for a structured event; only rendered if a handler actually formats it"""
+
+    def __init__(self, event, fields):
+        self.event = event
+        self.fields = fields
+
+    def __str__(self):
+        rendered = ' '.join(f"{key}={value}" for key, value in self.fields.items() if key != 'event')
+        return f"{self.event} {rendered}"
+
+class JsonFormatter(logging.Formatter):
+    """Format each record as a single JSON object per line"""
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+        }
+
+        fields = getattr(record, 'event_fields', None)
+        if fields:
+            payload.update(fields)
+        else:
+            payload['message'] = record.getMessage()
+
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+
+        return json.dumps(payload, default=str)
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that hands the record over untouched.
+
+    The stock QueueHandler formats the message in the calling thread; we skip that so
+    %-style arguments and event messages are only rendered by the listener thread.
+    A listener thread is not inherited through fork, so a forked process starts its
+    own (with a fresh queue) before enqueueing its first record.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def emit(self, record):
+        if _listener_pid != os.getpid():
+            _start_listener(self)
+        super().emit(record)
+
+def _parse_level(level):
+    level = level or DEFAULT_LOG_LEVEL
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    return level
+
+def _install_root_handler(handler, level):
+    """Make handler the only handler of the root logger"""
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(level, logging.INFO))
+
+class _ExcludeLoggerFilter(logging.Filter):
+    """Drop records from one logger (and its children)"""
+
+    def filter(self, record):
+        return not super().filter(record)
+
+def _file_handler(path, rotate, max_bytes, backup_count):
+    """Size-rotated file handler, or a WatchedFileHandler when several processes share the file"""
+    if not rotate:
+        return logging.handlers.WatchedFileHandler(path, encoding='utf-8')
+    return logging.handlers.RotatingFileHandler(
+        path,
+        maxBytes=max_bytes or DEFAULT_MAX_BYTES,
+        backupCount=backup_count if backup_count is not None else DEFAULT_BACKUP_COUNT,
+        encoding='utf-8'
+    )
+
+def _build_handlers(log_file, max_bytes, backup_count, trace_file, rotate):
+    """Console handler plus the JSON log and trace file handlers of a setup_logging configuration"""
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    handlers = [console_handler]
+
+    if log_file:
+        file_handler = _file_handler(log_file, rotate, max_bytes, backup_count)
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    if trace_file:
+        for handler in handlers:
+            handler.addFilter(_ExcludeLoggerFilter(TRACE_LOGGER))
+        trace_handler = _file_handler(trace_file, rotate, max_bytes, backup_count)
+        trace_handler.setFormatter(JsonFormatter())
+        trace_handler.addFilter(logging.Filter(TRACE_LOGGER))
+        handlers.append(trace_handler)
+
+    return handlers
+
+def _start_listener(queue_handler):
+    """Start this process's listener thread for queue_handler (once per process)"""
+    global _listener, _listener_pid, _handlers, _worker_listener
+
+    with _start_lock:
+        if _listener_pid == os.getpid():
+            return _listener
+
+        # A listener inherited through fork has no running thread here, so it is simply
+        # replaced; records the parent had queued at fork time stay with the parent
+        if _listener_pid is not None:
+            queue_handler.queue = queue.SimpleQueue()
+            _worker_listener = None
+
+        handlers = _build_handlers(**_config)
+        _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+        _handlers = handlers
+        return _listener
+
+def setup_logging(log_file=None, level=None, max_bytes=None, backup_count=None, trace_file=None,
+                  rotate=True):
+    """
+    Configure non-blocking logging for the current process.
+
+    Callers only enqueue records; a background QueueListener thread writes them to the
+    console (human-readable) and, if log_file is given, to a size-rotated JSON-lines file.
+    Records of the upload_trace logger are written only to trace_file when one is set.
+    A process forked afterwards (e.g. gunicorn --preload workers) starts its own listener
+    on its first record. Worker processes log through worker_log_queue() /
+    setup_worker_logging() instead.
+
+    Args:
+        log_file: Optional path of the rotating JSON log file
+        level: Log level name or number (defaults to LOG_LEVEL env var, then INFO)
+        max_bytes: Rotate the log file after this many bytes
+        backup_count: Number of rotated log files to keep
+        trace_file: Optional JSON-lines file for upload traces (defaults to UPLOAD_TRACE_FILE)
+        rotate: False when several processes write the same files (gunicorn workers): a
+            WatchedFileHandler is used instead, which never rotates but reopens the file
+            after an external tool (logrotate) has moved it
+
+    Returns:
+        The started QueueListener
+    """
+    global _listener, _listener_pid, _config, _worker_listener
+
+    level = _parse_level(level)
+
+    # Stop the previous listeners in this process; a listener inherited through fork
+    # has no running thread, so it is simply replaced
+    if _listener_pid == os.getpid():
+        if _listener is not None:
+            _listener.stop()
+        if _worker_listener is not None:
+            _worker_listener.stop()
+    _worker_listener = None
+    _listener = None
+    _listener_pid = None
+
+    _config = {
+        'log_file': log_file,
+        'max_bytes': max_bytes,
+        'backup_count': backup_count,
+        'trace_file': trace_file or DEFAULT_TRACE_FILE,
+        'rotate': rotate,
+    }
+
+    queue_handler = _DeferredQueueHandler(queue.SimpleQueue())
+    _install_root_handler(queue_handler, level)
+    return _start_listener(queue_handler)
+
+def worker_log_queue(context=None):
+    """
+    Queue for the records of worker processes started by this process.
+
+    Pass it to setup_worker_logging() in each worker. Workers never open the log files
+    themselves: a second listener thread here writes their records to the handlers of
+    setup_logging(), so this process is the only one that writes and rotates the files.
+
+    Args:
+        context: multiprocessing context the workers are started with (default context if None)
+    """
+    global _worker_listener
+
+    if _worker_listener is None:
+        log_queue = (context or multiprocessing).Queue()
+        _worker_listener = logging.handlers.QueueListener(log_queue, *_handlers, respect_handler_level=True)
+        _worker_listener.start()
+
+    return _worker_listener.queue
+
+def setup_worker_logging(log_queue, level=None):
+    """
+    Configure logging in a worker process (e.g. a ProcessPoolExecutor initializer).
+
+    Records are rendered in the worker and put on log_queue (from worker_log_queue() in
+    the parent), whose listener writes them to the console and log files.
+
+    Args:
+        log_queue: Queue returned by worker_log_queue() in the parent process
+        level: Log level name or number (defaults to LOG_LEVEL env var, then INFO)
+    """
+    global _listener, _listener_pid, _worker_listener
+
+    _install_root_handler(logging.handlers.QueueHandler(log_queue), _parse_level(level))
+
+    # Listeners inherited through fork belong to the parent; don't stop them at exit
+    _listener = None
+    _listener_pid = None
+    _worker_listener = None
+
+def shutdown_logging():
+    """Flush queued records and stop the listener threads"""
+    global _listener, _worker_listener
+
+    if _listener_pid == os.getpid():
+        if _worker_listener is not None:
+            _worker_listener.stop()
+            _worker_listener = None
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+atexit.register(shutdown_logging)
+
+def _reset_start_lock():
+    """A lock held by another thread at fork time would never be released in the child"""
+    global _start_lock
+    _start_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_start_lock)
+
+def log_event(logger, event, level=logging.INFO, sample_rate=1.0, **fields):
+    """
+    Emit one structured record (e.g. a 'transfer' or 'part' event).
+
+    Nothing is built or formatted when the level is disabled or the event is sampled out.
+
+    Args:
+        logger: Logger to emit on
+        event: Event name
+        level: Log level of the record
+        sample_rate: Fraction of events to keep (1.0 keeps all of them)
+        **fields: Event fields, written as top-level JSON keys
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+
+    fields['event'] = event
+    fields.setdefault('timestamp', time.time())
+    logger.log(level, _EventMessage(event, fields), extra={'event_fields': fields})
@@ -0,0 +1,114 @@
+import os
+import time
+import sqlite3
+
+# Retry delay after a failed upload: doubles with every failure of the same file version
+FAILURE_BACKOFF = 30
+MAX_FAILURE_BACKOFF = 3600
+
+class UploadStateStore:
+    """
+    Local record of files that have been uploaded, so watch mode can be restarted
+    without re-uploading anything.
+
+    A file counts as uploaded only while its size and mtime still match what was
+    uploaded; a file that is rewritten afterwards is uploaded again. The store also
+    keeps the date each watched directory was first seen (so a capture that runs past
+    midnight stays under one prefix) and when a failed file may be retried. Not
+    thread-safe: use it from the thread that created it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS uploaded (
+                local_path TEXT PRIMARY KEY,
+                s3_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                uploaded_at REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS failures (
+                local_path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                attempts INTEGER NOT NULL,
+                retry_at REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS directories (
+                root TEXT PRIMARY KEY,
+                date TEXT NOT NULL
+            )
+        ''')
+        self.conn.commit()
+
+    def is_uploaded(self, local_path, size, mtime):
+        """Check whether this exact version of the file has already been uploaded"""
+        row = self.conn.execute(
+            'SELECT size, mtime FROM uploaded WHERE local_path = ?',
+            (os.path.abspath(local_path),)
+        ).fetchone()
+        return row is not None and row[0] == size and row[1] == mtime
+
+    def mark_uploaded(self, local_path, s3_path, size, mtime):
+        """Record a successful upload"""
+        self.conn.execute(
+            'INSERT OR REPLACE INTO uploaded (local_path, s3_path, size, mtime, uploaded_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (os.path.abspath(local_path), s3_path, size, mtime, time.time())
+        )
+        self.conn.execute('DELETE FROM failures WHERE local_path = ?', (os.path.abspath(local_path),))
+        self.conn.commit()
+
+    def record_failure(self, local_path, size, mtime):
+        """
+        Record a failed upload and schedule the next attempt with exponential backoff.
+
+        Returns:
+            Time (time.time()) before which the file should not be retried
+        """
+        local_path = os.path.abspath(local_path)
+        row = self.conn.execute(
+            'SELECT size, mtime, attempts FROM failures WHERE local_path = ?', (local_path,)
+        ).fetchone()
+        # A rewritten file starts over
+        attempts = row[2] + 1 if row is not None and row[:2] == (size, mtime) else 1
+        retry_at = time.time() + min(MAX_FAILURE_BACKOFF, FAILURE_BACKOFF * 2 ** (attempts - 1))
+        self.conn.execute(
+            'INSERT OR REPLACE INTO failures (local_path, size, mtime, attempts, retry_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (local_path, size, mtime, attempts, retry_at)
+        )
+        self.conn.commit()
+        return retry_at
+
+    def retry_at(self, local_path, size, mtime):
+        """When this version of the file may be retried after a failure (None if it hasn't failed)"""
+        row = self.conn.execute(
+            'SELECT size, mtime, retry_at FROM failures WHERE local_path = ?',
+            (os.path.abspath(local_path),)
+        ).fetchone()
+        if row is None or row[:2] != (size, mtime):
+            return None
+        return row[2]
+
+    def directory_date(self, root, date):
+        """
+        Date used in the keys of a watched directory.
+
+        The first call for a directory stores the given date; later calls (also after a
+        restart) return the stored one.
+        """
+        root = os.path.abspath(root)
+        self.conn.execute('INSERT OR IGNORE INTO directories (root, date) VALUES (?, ?)', (root, date))
+        self.conn.commit()
+        return self.conn.execute('SELECT date FROM directories WHERE root = ?', (root,)).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
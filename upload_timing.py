@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+import cProfile
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Per-request profiling is off unless enabled here; a request then opts in with
+# ?profiler=cprofile|sample (or the X-Upload-Profiler header)
+PROFILER_ENABLED = os.getenv('UPLOAD_PROFILER', 'False').lower() in ('true', 'yes', '1')
+PROFILER_OUTPUT_DIR = os.getenv('UPLOAD_PROFILER_DIR', 'profiles')
+SAMPLE_INTERVAL = float(os.getenv('UPLOAD_PROFILER_INTERVAL', 0.005))  # Seconds between stack samples
+
+class UploadTimer:
+    """
+    Wall-clock time spent in each phase of one upload.
+
+    Phases are named freely (receive, read, upload_part, retry_sleep, complete, ...);
+    time that isn't attributed to any phase is reported as 'other'. Safe to use from
+    several threads.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.profiler = None
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+            self.counts[phase] += 1
+
+    @contextmanager
+    def phase(self, name):
+        """Attribute the time spent in the with-block to a phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        """Seconds per phase, plus 'total' and the unattributed 'other'"""
+        total = self.elapsed()
+        with self.lock:
+            timings = {name: round(seconds, 3) for name, seconds in self.phases.items()}
+            attributed = sum(self.phases.values())
+        timings['other'] = round(max(0.0, total - attributed), 3)
+        timings['total'] = round(total, 3)
+        return timings
+
+class SamplingProfiler:
+    """
+    Low-overhead profiler that samples one thread's stack at a fixed interval.
+
+    Output is in collapsed-stack format (``outer;inner;leaf count`` per line), which
+    flamegraph.pl and speedscope read directly.
+    """
+
+    extension = 'folded'
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+class CProfileProfiler:
+    """Deterministic cProfile of the request thread (output readable with pstats/snakeviz)"""
+
+    extension = 'prof'
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def save(self, path):
+        self.profile.dump_stats(path)
+
+PROFILERS = {'cprofile': CProfileProfiler, 'sample': SamplingProfiler}
+
+def start_profiler(timer, mode):
+    """
+    Start a profiler for the current request if profiling is enabled.
+
+    Args:
+        timer: UploadTimer of the request; the profiler is attached to it
+        mode: 'cprofile', 'sample', or None/empty for no profiling
+
+    Returns:
+        The started profiler, or None
+    """
+    if not PROFILER_ENABLED or not mode:
+        return None
+    if mode not in PROFILERS:
+        logger.warning(f"Unknown profiler '{mode}' requested (use one of: {', '.join(PROFILERS)})")
+        return None
+
+    timer.profiler = PROFILERS[mode]()
+    timer.profiler.start()
+    return timer.profiler
+
+def stop_profiler(timer, name):
+    """
+    Stop the request's profiler (if any) and write its output.
+
+    Args:
+        timer: UploadTimer the profiler was attached to
+        name: Base name of the output file (e.g. the upload ID)
+
+    Returns:
+        Path of the written profile, or None
+    """
+    profiler = timer.profiler
+    if profiler is None:
+        return None
+    timer.profiler = None
+    profiler.stop()
+
+    try:
+        os.makedirs(PROFILER_OUTPUT_DIR, exist_ok=True)
+        path = os.path.join(PROFILER_OUTPUT_DIR, f"{name}.{profiler.extension}")
+        profiler.save(path)
+    except OSError as e:
+        logger.error(f"Could not write profile for {name}: {str(e)}")
+        return None
+
+    logger.info(f"Profile written to {path}")
+    return path